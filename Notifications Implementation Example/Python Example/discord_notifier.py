@@ -2,6 +2,10 @@
 import requests
 import json
 import logging
+import math
+import os
+import threading
+import time
 
 # Configure basic logging for this module
 logger = logging.getLogger(__name__)
@@ -9,18 +13,128 @@ logger = logging.getLogger(__name__)
 # For standalone use, if no other logging is set up, messages might not appear without:
 # logging.basicConfig(level=logging.INFO)
 
+# Discord message limits (https://discord.com/developers/docs/resources/message#embed-object-embed-limits)
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_FIELDS_PER_EMBED = 25
+MAX_FIELD_NAME_LENGTH = 256
+MAX_FIELD_VALUE_LENGTH = 1024
+MAX_EMBED_CHARACTERS = 6000  # Sum of title, field names and field values, across all embeds of one message
+
+
+def split_text(text: str, limit: int) -> list:
+    """
+    Splits text into chunks of at most limit characters, breaking on line boundaries where possible.
+
+    :param text: The text to split.
+    :param limit: Maximum length of each chunk.
+    :return: A list of chunks (at least one).
+    """
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:  # A single line longer than the limit is hard-split
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    chunks.append(current)
+    return chunks
+
+
+def _embed_characters(embed: dict) -> int:
+    return len(embed.get('title') or "") + sum(len(f['name']) + len(f['value']) for f in embed.get('fields', []))
+
+
+def _delay_seconds(value, default: float) -> float:
+    """Parses a rate limit delay in seconds, falling back to default if it is missing or malformed."""
+    if value is None or value == "":
+        return default
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = None
+    if seconds is None or not math.isfinite(seconds) or seconds < 0:
+        logger.warning(f"Ignoring malformed Discord rate limit delay {value!r}. Using {default}s.")
+        return default
+    return seconds
+
+
+def post_webhook(webhook_url: str, payload: dict, max_retries: int = 3, timeout: int = 10) -> bool:
+    """
+    Posts one message payload to a Discord webhook, honouring Discord's rate limits.
+
+    A 429 response is retried after the 'Retry-After' header (or 'retry_after' in the body). When the
+    X-RateLimit-Remaining header says the bucket is empty, this waits X-RateLimit-Reset-After seconds
+    before returning so the next message does not get rate limited.
+
+    :param webhook_url: The Discord webhook URL.
+    :param payload: The message payload (content and/or embeds).
+    :param max_retries: How many times a rate-limited request is retried.
+    :param timeout: Request timeout in seconds.
+    :return: True if the message was delivered, False otherwise.
+    """
+    headers = {'Content-Type': 'application/json'}
+    for attempt in range(max_retries + 1):
+        try:
+            response = requests.post(webhook_url, data=json.dumps(payload), headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error sending Discord notification: {e}")
+            return False
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is None:
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = None
+                retry_after = body.get('retry_after') if isinstance(body, dict) else None
+            retry_after = _delay_seconds(retry_after, 1.0)
+            if attempt == max_retries:
+                break
+            logger.warning(f"Discord rate limit hit. Retrying in {retry_after:.2f}s ({attempt + 1}/{max_retries}).")
+            time.sleep(retry_after)
+            continue
+
+        try:
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"HTTP error sending Discord notification: {e}")
+            logger.error(f"Response status: {e.response.status_code}, Response content: {e.response.text}")
+            return False
+
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            reset_after = _delay_seconds(response.headers.get('X-RateLimit-Reset-After'), 0.0)
+            if reset_after > 0:
+                logger.debug(f"Discord rate limit bucket empty. Waiting {reset_after:.2f}s.")
+                time.sleep(reset_after)
+        logger.info(f"Discord notification sent successfully. Status: {response.status_code}")
+        return True
+
+    logger.error(f"Discord notification still rate limited after {max_retries} retries.")
+    return False
+
 
 class DiscordNotifier:
     """
     A class to send notifications to a Discord webhook.
     """
-    def __init__(self, webhook_url: str):
+    def __init__(self, webhook_url: str, validate_url: bool = True):
         """
         Initializes the DiscordNotifier.
 
         :param webhook_url: The Discord webhook URL.
+        :param validate_url: Require a https://discord.com/api/webhooks/ URL (disable to test against a local server).
         """
-        if not webhook_url or not webhook_url.startswith("https://discord.com/api/webhooks/"):
+        if not webhook_url or (validate_url and not webhook_url.startswith("https://discord.com/api/webhooks/")):
             raise ValueError("Invalid Discord webhook URL provided.")
         self.webhook_url = webhook_url
         self._color = 0x000000  # Default black
@@ -62,77 +176,218 @@ class DiscordNotifier:
         """
         self._content = text
 
-    def add_field(self, name: str, value: str, inline: bool = False):
+    def add_field(self, name: str, value: str, inline: bool = False, code_block: bool = False):
         """
-        Adds a field to the embed.
+        Adds a field to the embed. Values longer than Discord's 1024 character limit are split
+        across several fields ("Name (2/3)", ...) instead of being truncated.
 
         :param name: The name of the field.
         :param value: The value of the field.
         :param inline: Whether the field should be displayed inline (default False).
                        Max 3 inline fields per row.
+        :param code_block: Wrap the value (each part, if split) in a ``` code block.
         """
         if not name or not value:
             logger.warning("Field name or value cannot be empty. Skipping field.")
             return
-        if len(name) > 256:
+        if len(name) > MAX_FIELD_NAME_LENGTH - 8:  # Leave room for a " (nn/nn)" suffix
             logger.warning(f"Field name '{name[:20]}...' is too long (max 256 chars). Truncating.")
-            name = name[:256]
-        if len(value) > 1024:
-            logger.warning(f"Field value for '{name}' starting with '{value[:20]}...' is too long (max 1024 chars). Truncating.")
-            value = value[:1024]
+            name = name[:MAX_FIELD_NAME_LENGTH - 8]
 
-        self._fields.append({
-            'name': name,
-            'value': value,
-            'inline': inline
-        })
+        wrapper = "```\n{}\n```" if code_block else "{}"
+        parts = split_text(value, MAX_FIELD_VALUE_LENGTH - len(wrapper.format("")))
+        for index, part in enumerate(parts, start=1):
+            self._fields.append({
+                'name': name if len(parts) == 1 else f"{name} ({index}/{len(parts)})",
+                'value': wrapper.format(part),
+                'inline': inline
+            })
 
-    def send(self) -> bool:
+    def build_payloads(self) -> list:
         """
-        Sends the notification to Discord.
+        Builds the message payload(s) for this notification. Fields are spread over as many embeds
+        (max 25 fields each) and messages (max 10 embeds and 6000 embed characters each) as needed.
 
-        :return: True if the message was sent successfully, False otherwise.
+        :return: A list of payload dicts, empty if there is nothing to send.
         """
-        payload_embeds = []
-        embed_data = {}
+        embeds = []
+        embed = {'title': self._title, 'color': self._color, 'fields': []}
+        for field in self._fields:
+            field_characters = len(field['name']) + len(field['value'])
+            if embed['fields'] and (len(embed['fields']) >= MAX_FIELDS_PER_EMBED
+                                    or _embed_characters(embed) + field_characters > MAX_EMBED_CHARACTERS):
+                embeds.append(embed)
+                embed = {'title': f"{self._title} (continued)" if self._title else None, 'color': self._color, 'fields': []}
+            embed['fields'].append(field)
+        embeds.append(embed)
 
-        if self._title:
-            embed_data['title'] = self._title
-        
-        embed_data['color'] = self._color # Color is always set, defaults to black
-
-        if self._fields:
-            embed_data['fields'] = self._fields
-        
         # An embed must have at least one of: title, description, fields, author, footer, image, thumbnail.
         # If only color is set, it might not be a valid embed.
-        # We'll only add the embed to the payload if it has a title or fields.
-        if embed_data.get('title') or embed_data.get('fields'):
-            payload_embeds.append(embed_data)
-
-        payload = {}
-        if self._content:
-            payload['content'] = self._content
-        
-        if payload_embeds:
-            payload['embeds'] = payload_embeds
-        
-        if not payload.get('content') and not payload.get('embeds'):
+        # We'll only add an embed to the payload if it has a title or fields.
+        embeds = [{k: v for k, v in e.items() if v or k == 'color'} for e in embeds if e.get('title') or e.get('fields')]
+
+        payloads = []
+        content_chunks = split_text(self._content, MAX_CONTENT_LENGTH) if self._content else []
+        for chunk in content_chunks:
+            payloads.append({'content': chunk, 'embeds': []})
+        if not payloads and embeds:
+            payloads.append({'embeds': []})
+        for embed in embeds:
+            payload = payloads[-1]
+            if (len(payload['embeds']) >= MAX_EMBEDS_PER_MESSAGE
+                    or sum(map(_embed_characters, payload['embeds'])) + _embed_characters(embed) > MAX_EMBED_CHARACTERS):
+                payload = {'embeds': []}
+                payloads.append(payload)
+            payload['embeds'].append(embed)
+        return [{k: v for k, v in p.items() if v} for p in payloads]
+
+    def send(self) -> bool:
+        """
+        Sends the notification to Discord, as several messages if it exceeds Discord's limits.
+
+        :return: True if every message was sent successfully, False otherwise.
+        """
+        payloads = self.build_payloads()
+        if not payloads:
             logger.error("Cannot send an empty message (no content and no valid embed data).")
             return False
 
-        headers = {'Content-Type': 'application/json'}
-
         try:
-            response = requests.post(self.webhook_url, data=json.dumps(payload), headers=headers, timeout=10)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            logger.info(f"Discord notification sent successfully. Status: {response.status_code}")
-            return True
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTP error sending Discord notification: {e}")
-            logger.error(f"Response status: {e.response.status_code}, Response content: {e.response.text}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error sending Discord notification: {e}")
+            return all([post_webhook(self.webhook_url, payload) for payload in payloads])
         except Exception as e:
             logger.error(f"An unexpected error occurred: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class DiscordNotificationQueue:
+    """
+    Queues notifications, coalesces the ones raised within a short time window into as few
+    messages as Discord's limits allow, and persists undelivered messages to a spool file
+    so they are retried later instead of being lost or blocking the caller.
+    """
+    def __init__(self, webhook_url: str, window: float = 5.0, spool_path: str = None,
+                 retry_interval: float = 60.0, validate_url: bool = True):
+        """
+        Initializes the DiscordNotificationQueue.
+
+        :param webhook_url: The Discord webhook URL.
+        :param window: Seconds to wait for more notifications before sending.
+        :param spool_path: JSON-lines file where undelivered messages are kept (None to keep them in memory only).
+        :param retry_interval: Seconds between retries of undelivered messages.
+        :param validate_url: Require a https://discord.com/api/webhooks/ URL (disable to test against a local server).
+        """
+        if not webhook_url or (validate_url and not webhook_url.startswith("https://discord.com/api/webhooks/")):
+            raise ValueError("Invalid Discord webhook URL provided.")
+        self.webhook_url = webhook_url
+        self.window = window
+        self.spool_path = spool_path
+        self.retry_interval = retry_interval
+        self._pending = self._load_spool()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        if self._pending:
+            self._schedule(0)  # Messages spooled by an earlier run are retried right away
+
+    def put(self, notifier: DiscordNotifier):
+        """
+        Queues a configured DiscordNotifier's message(s). They are sent after the coalescing window.
+
+        :param notifier: The notifier whose payloads should be sent.
+        """
+        payloads = notifier.build_payloads()
+        with self._lock:
+            self._pending.extend(payloads)
+            self._schedule(self.window)
+
+    def flush(self) -> bool:
+        """
+        Sends everything queued (including spooled messages from earlier runs) now.
+
+        :return: True if nothing is left undelivered.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._timer = None
+            payloads = self._coalesce(pending)
+            sent = 0
+            try:
+                # Keep order: once one message fails, the rest wait for the next retry too.
+                while sent < len(payloads) and post_webhook(self.webhook_url, payloads[sent]):
+                    sent += 1
+            except Exception as e:
+                # The messages stay queued and spooled instead of being lost with the timer or dispatcher thread.
+                logger.error(f"An unexpected error occurred while sending Discord notifications: {e}")
+            undelivered = payloads[sent:]
+            with self._lock:
+                self._pending = undelivered + self._pending
+                self._save_spool(self._pending)
+                if self._pending and not self._closed:
+                    logger.warning(f"{len(self._pending)} Discord message(s) undelivered. Retrying in {self.retry_interval}s.")
+                    self._schedule(self.retry_interval)
+            return not undelivered
+
+    def close(self) -> bool:
+        """
+        Cancels the coalescing timer and sends everything queued now. Anything still undelivered
+        stays in the spool file for the next run.
+
+        :return: True if nothing is left undelivered.
+        """
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return self.flush()
+
+    def _schedule(self, delay: float):
+        if self._timer is None and not self._closed:
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @staticmethod
+    def _coalesce(payloads: list) -> list:
+        """Merges consecutive payloads into one message wherever Discord's limits allow it."""
+        merged = []
+        for payload in payloads:
+            last = merged[-1] if merged else None
+            if last is not None:
+                content = "\n\n".join(filter(None, [last.get('content'), payload.get('content')]))
+                embeds = last.get('embeds', []) + payload.get('embeds', [])
+                if (len(content) <= MAX_CONTENT_LENGTH and len(embeds) <= MAX_EMBEDS_PER_MESSAGE
+                        and sum(map(_embed_characters, embeds)) <= MAX_EMBED_CHARACTERS):
+                    merged[-1] = {k: v for k, v in (('content', content), ('embeds', embeds)) if v}
+                    continue
+            merged.append(payload)
+        return merged
+
+    def _load_spool(self) -> list:
+        if not self.spool_path:
+            return []
+        try:
+            with open(self.spool_path, "r") as spool:
+                return [json.loads(line) for line in spool if line.strip()]
+        except FileNotFoundError:
+            return []
+        except (IOError, ValueError) as e:
+            logger.error(f"Could not read Discord spool file {self.spool_path}: {e}")
+            return []
+
+    def _save_spool(self, payloads: list):
+        if not self.spool_path:
+            return
+        try:
+            if not payloads:
+                if os.path.exists(self.spool_path):
+                    os.remove(self.spool_path)
+                return
+            temp_path = f"{self.spool_path}.tmp"
+            with open(temp_path, "w") as spool:
+                spool.writelines(json.dumps(payload) + "\n" for payload in payloads)
+            os.replace(temp_path, self.spool_path)
+        except (IOError, OSError) as e:
+            logger.error(f"Could not write Discord spool file {self.spool_path}: {e}")
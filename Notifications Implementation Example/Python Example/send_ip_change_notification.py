@@ -59,13 +59,9 @@ def main():
     notifier.add_field(name="Apache2 Status", value=args.apache_status, inline=False)
     notifier.add_field(name="System Updates", value=args.update_status, inline=False)
 
-    # Format domain_status to be more readable, potentially in a code block
-    # Ensure domain_status is not excessively long (Discord field value limit is 1024)
-    domain_report = args.domain_status
-    if len(domain_report) > 1000: # Leave some room for formatting
-        domain_report = domain_report[:1000] + "..."
-    
-    notifier.add_field(name="DNS Update Status", value=f"```\n{domain_report}\n```", inline=False)
+    # Format domain_status to be more readable in a code block
+    # Long reports are split over several fields/embeds/messages to stay within Discord's limits
+    notifier.add_field(name="DNS Update Status", value=args.domain_status, inline=False, code_block=True)
 
     if notifier.send():
         script_logger.info("IP change notification sent successfully via Python.")
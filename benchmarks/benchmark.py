@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Cloudflare DDNS Benchmark
+# Runs cloudflare_ddns.main() end to end against the mock Cloudflare API for a few synthetic account shapes
+# and reports wall time, API request count and peak RSS, so changes to the hot path can be measured.
+#
+# Usage:
+#   python3 benchmarks/benchmark.py                      # All shapes
+#   python3 benchmarks/benchmark.py --shape 1x10000 --latency 0.02 --error-rate-5xx 0.01
+#
+# Every run starts in a fresh interpreter with its own generated config.py, and every record starts out
+# stale, so each run exercises the full pipeline: IP lookup, listing every zone and updating every record.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from mock_cloudflare_api import MockCloudflareAPI, base_url
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (zones, A records per zone)
+SHAPES = {
+    "1x10000": (1, 10000),
+    "500x5": (500, 5),
+    "1x100000": (1, 100000),
+}
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+# Executed in the child interpreter: import the script with the generated config and time main().
+CHILD = """
+import json, resource, sys, time
+sys.path[:0] = sys.argv[1:] # Generated config, repository, benchmarks (for NullNotifier's module)
+start = time.perf_counter()
+import cloudflare_ddns
+imported = time.perf_counter()
+cloudflare_ddns.main()
+finished = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "wall_seconds": finished - imported,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+class NullNotifier:
+    """Notification backend used by the benchmark (the script requires notifications to be enabled)."""
+
+    def __init__(self, config):
+        pass
+
+    def notify(self, report):
+        return True
+
+    def close(self):
+        pass
+
+
+def write_config(directory, api_url, ip_url, zones, args):
+    settings = {
+        "CLOUDFLARE_API_TOKEN_ENV_VAR": None,
+        "CLOUDFLARE_API_TOKEN": "benchmark-token",
+        "CLOUDFLARE_API_BASE_URL": api_url,
+        "ZONES": zones,
+        "IP_FILE": os.path.join(directory, "ip.txt"),
+        "LOG_FILE": os.path.join(directory, "cloudflare_ddns.log"),
+        "ENABLE_STATE_CACHE": False,
+        "MAX_WORKERS": args.workers,
+        "IP_PROVIDERS": [{"name": "mock", "type": "text", "url": ip_url}],
+        "IP_PROVIDER_QUORUM": 1,
+        "IP_PROVIDER_FANOUT": 1,
+        "ENABLE_BATCH_UPDATES": not args.no_batch,
+        # Cloudflare's real limit would make the benchmark measure the rate limiter instead of the script.
+        "CLOUDFLARE_RATE_LIMIT": args.rate_limit,
+        "ENABLE_DISCORD_NOTIFICATIONS": True,
+        "NOTIFICATION_BACKEND": f"{os.path.abspath(__file__)}:NullNotifier",
+    }
+    with open(os.path.join(directory, "config.py"), "w") as f:
+        for name, value in settings.items():
+            f.write(f"{name} = {value!r}\n")
+
+
+def run_shape(name, zone_count, records_per_zone, args):
+    api = MockCloudflareAPI(NEW_IP, args.latency, args.error_rate_429, args.error_rate_5xx, retry_after=1, seed=0)
+    zones = api.populate(zone_count, records_per_zone, OLD_IP)
+    server = api.start()
+    try:
+        host, port = server.server_address[:2]
+        with tempfile.TemporaryDirectory(prefix="ddns-bench-") as directory:
+            write_config(directory, base_url(server), f"http://{host}:{port}/ip", zones, args)
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD, directory, REPO_DIR, os.path.dirname(os.path.abspath(__file__))],
+                cwd=directory, capture_output=True, text=True
+            )
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark run for {name} failed:\n{result.stdout}{result.stderr}")
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    total = zone_count * records_per_zone
+    return {
+        "shape": name,
+        "records": total,
+        "updated": api.count_content(NEW_IP),
+        "wall_seconds": round(timings["wall_seconds"], 3),
+        "import_seconds": round(timings["import_seconds"], 3),
+        "requests": api.stats["requests"],
+        "requests_by_method": {m: api.stats[f"requests_{m}"] for m in ("GET", "PUT", "PATCH", "POST") if api.stats[f"requests_{m}"]},
+        "injected_errors": api.stats["injected_429"] + api.stats["injected_5xx"],
+        "connections": api.stats["connections"],
+        "peak_rss_mb": round(timings["peak_rss_kb"] / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cloudflare_ddns.main() against a local mock Cloudflare API.")
+    parser.add_argument("--shape", action="append", choices=sorted(SHAPES), help="Account shape(s) to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per shape.")
+    parser.add_argument("--workers", type=int, default=8, help="MAX_WORKERS for the script.")
+    parser.add_argument("--no-batch", action="store_true", help="Disable ENABLE_BATCH_UPDATES (one PUT per record).")
+    parser.add_argument("--rate-limit", type=int, default=10 ** 9, help="CLOUDFLARE_RATE_LIMIT for the script (default: effectively unlimited).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency added to every API response.")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Fraction of API requests answered with 429.")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="Fraction of API requests answered with 503.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table.")
+    args = parser.parse_args()
+
+    if not args.json:
+        print(f"{'shape':<10} {'records':>8} {'updated':>8} {'wall s':>8} {'import s':>9} {'requests':>9} {'errors':>7} {'conns':>6} {'peak RSS MB':>12}")
+    for name in args.shape or SHAPES:
+        for _ in range(args.repeat):
+            result = run_shape(name, *SHAPES[name], args)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{result['shape']:<10} {result['records']:>8} {result['updated']:>8} {result['wall_seconds']:>8} "
+                      f"{result['import_seconds']:>9} {result['requests']:>9} {result['injected_errors']:>7} "
+                      f"{result['connections']:>6} {result['peak_rss_mb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
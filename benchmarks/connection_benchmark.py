@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Cloudflare DDNS Connection Benchmark
+# Sends the same record updates to the mock Cloudflare API over HTTPS (self-signed certificate made with the openssl
+# command) and reports wall time per 1,000 updates and the number of TLS handshakes the mock saw:
+#   per-call:  a fresh requests.put() with freshly built headers per update, as the script did before CloudflareClient
+#   pooled:    cloudflare_ddns.update_dns_record(), through the shared keep-alive session
+#   batch:     cloudflare_ddns.update_dns_records_batch(), DNS_BATCH_SIZE records per request
+#
+# Usage:
+#   python3 benchmarks/connection_benchmark.py --updates 1000 --workers 8 --latency 0.02
+
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmark import NEW_IP, OLD_IP, REPO_DIR, write_config
+from mock_cloudflare_api import MockCloudflareAPI, base_url
+
+ZONE_ID = "zone00000"
+
+
+def make_certificate(directory):
+    """Self-signed certificate and key for 127.0.0.1. Returns (cert_path, key_path)."""
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key_path, "-out", cert_path],
+                   check=True, capture_output=True)
+    return cert_path, key_path
+
+
+def per_call_update(api_url, token, record_id, record_name):
+    """One update the way the script sent it before the shared session: new connection, headers built per call."""
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    payload = {"type": "A", "name": record_name, "content": NEW_IP, "ttl": 1, "proxied": True}
+    response = requests.put(f"{api_url}/zones/{ZONE_ID}/dns_records/{record_id}", headers=headers,
+                            data=json.dumps(payload), timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+def run_variant(api, name, update_all):
+    """Reset the mock's records and counters, run update_all() and return the measured row."""
+    for record in api.zones[ZONE_ID].values():
+        record["content"] = OLD_IP
+    api.reset_stats()
+    started = time.perf_counter()
+    update_all()
+    wall = time.perf_counter() - started
+    updates = len(api.zones[ZONE_ID])
+    if api.count_content(NEW_IP) != updates:
+        raise RuntimeError(f"{name}: only {api.count_content(NEW_IP)} of {updates} records were updated")
+    return {"variant": name, "updates": updates, "wall_seconds": round(wall, 3),
+            "ms_per_1000": round(wall * 1000 * 1000 / updates, 1), "requests": api.stats["requests"],
+            "tls_handshakes": api.stats["tls_handshakes"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TLS handshakes and wall time of per-call requests and the pooled session.")
+    parser.add_argument("--updates", type=int, default=1000, help="Record updates per variant.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent updates (MAX_WORKERS).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency added to every API response.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines instead of a table.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ddns-conn-") as directory:
+        cert_path, key_path = make_certificate(directory)
+        os.environ["REQUESTS_CA_BUNDLE"] = cert_path # Trusted by requests.put() and the script's session alike
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert_path, key_path)
+
+        api = MockCloudflareAPI(NEW_IP, latency=args.latency)
+        zones = api.populate(1, args.updates, OLD_IP)
+        server = api.start(ssl_context=context)
+        host, port = server.server_address[:2]
+        api_url = base_url(server)
+        write_config(directory, api_url, f"https://{host}:{port}/ip", zones,
+                     argparse.Namespace(workers=args.workers, no_batch=False, rate_limit=10 ** 9))
+        sys.path[:0] = [directory, REPO_DIR]
+        import cloudflare_ddns
+
+        records = [(record["id"], record["name"]) for record in api.zones[ZONE_ID].values()]
+        token = cloudflare_ddns.CLOUDFLARE_API_TOKEN
+
+        def per_call():
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                list(executor.map(lambda record: per_call_update(api_url, token, *record), records))
+
+        def pooled():
+            cloudflare_ddns.http_client.close() # Start without kept-alive connections, like a fresh run
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                list(executor.map(lambda record: cloudflare_ddns.update_dns_record(
+                    ZONE_ID, record[0], record[1], {"content": NEW_IP}), records))
+
+        def batch():
+            cloudflare_ddns.http_client.close()
+            size = cloudflare_ddns.DNS_BATCH_SIZE
+            chunks = [[(record_id, name, "A", {"content": NEW_IP}) for record_id, name in records[i:i + size]]
+                      for i in range(0, len(records), size)]
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                list(executor.map(lambda chunk: cloudflare_ddns.update_dns_records_batch(ZONE_ID, chunk), chunks))
+
+        results = [run_variant(api, name, update_all) for name, update_all in
+                   (("per-call", per_call), ("pooled", pooled), ("batch", batch))]
+        server.shutdown()
+        server.server_close()
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    print(f"{'variant':<10} {'updates':>8} {'wall s':>8} {'ms/1000 updates':>16} {'requests':>9} {'TLS handshakes':>15}")
+    for result in results:
+        print(f"{result['variant']:<10} {result['updates']:>8} {result['wall_seconds']:>8} {result['ms_per_1000']:>16} "
+              f"{result['requests']:>9} {result['tls_handshakes']:>15}")
+
+
+if __name__ == "__main__":
+    main()
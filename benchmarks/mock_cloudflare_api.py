@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# Mock Cloudflare API
+# A local stand-in for the Cloudflare v4 DNS record endpoints used by cloudflare_ddns.py, for benchmarks and manual testing.
+# Supports listing zones and records with pagination, PUT/PATCH of single records, /dns_records/batch, a plain-text
+# public IP endpoint, and injected latency, 429 and 5xx responses. Listing pages and the batch endpoint can also be
+# made to fail deterministically (failing_pages, batch_status), which the tests in tests/ use.
+#
+# Standalone usage:
+#   python3 benchmarks/mock_cloudflare_api.py --zones 3 --records 100 --port 8787
+# then set CLOUDFLARE_API_BASE_URL = "http://127.0.0.1:8787/client/v4" in config.py.
+
+import argparse
+import json
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/client/v4"
+MAX_PER_PAGE = 5000 # Cloudflare caps per_page for DNS record listing
+MAX_ZONES_PER_PAGE = 50 # ...and for zone listing
+
+
+class MockCloudflareAPI:
+    """In-memory DNS records plus the knobs (latency, error rates) and counters used by the benchmark."""
+
+    def __init__(self, public_ip="198.51.100.7", latency=0.0, error_rate_429=0.0, error_rate_5xx=0.0,
+                 retry_after=1, seed=None):
+        self.public_ip = public_ip
+        self.latency = latency
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.retry_after = retry_after
+        self.failing_pages = set() # Record listing pages always answered with 503, e.g. {2} for a listing cut short
+        self.batch_status = None # Status every /dns_records/batch request is answered with instead, e.g. 405
+        self.batch_sizes = [] # Operations in each batch request handled, in arrival order
+        self.listing_types = [] # Type filter of each record listing request handled (None = every type)
+        self.zone_tokens = {} # zone_id -> set of Authorization headers its requests carried
+        self.record_writes = [] # (method, record_id, body) of each single-record PUT/PATCH handled, in arrival order
+        self.random = random.Random(seed)
+        self.zones = {} # zone_id -> {record_id: record}
+        self.zone_names = {} # zone_id -> zone name
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def add_zone(self, zone_id, zone_name, records=0, content="192.0.2.1", record_type="A"):
+        """Create (or extend) a zone with synthetic records named host<n>.<zone_name>."""
+        zone = self.zones.setdefault(zone_id, {})
+        self.zone_names[zone_id] = zone_name
+        start = len(zone)
+        for n in range(start, start + records):
+            record_id = f"{zone_id}-{n}"
+            zone[record_id] = {
+                "id": record_id,
+                "zone_id": zone_id,
+                "zone_name": zone_name,
+                "name": f"host{n}.{zone_name}",
+                "type": record_type,
+                "content": content,
+                "proxied": True,
+                "ttl": 1,
+                "modified_on": "2024-01-01T00:00:00.000000Z",
+            }
+        return zone
+
+    def populate(self, zone_count, records_per_zone, content="192.0.2.1"):
+        """Create zone_count zones of records_per_zone records. Returns the ZONES mapping for config.py."""
+        zones = {}
+        for z in range(zone_count):
+            zone_id = f"zone{z:05d}"
+            zone_name = f"example{z}.test"
+            self.add_zone(zone_id, zone_name, records_per_zone, content)
+            zones[zone_name] = zone_id
+        return zones
+
+    def count_content(self, content):
+        """Number of records (across all zones) whose content equals content."""
+        with self.lock:
+            return sum(1 for zone in self.zones.values() for record in zone.values() if record["content"] == content)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+
+    def start(self, host="127.0.0.1", port=0, ssl_context=None):
+        """Serve on a background thread (HTTPS with an ssl.SSLContext). Returns the server; its base URL is base_url(server)."""
+        handler = type("Handler", (MockCloudflareHandler,), {"api": self})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        if ssl_context is not None:
+            # The handshake is done by each connection's handler thread (see setup()), not by the accepting thread.
+            server.socket = ssl_context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+        threading.Thread(target=server.serve_forever, name="mock-cloudflare-api", daemon=True).start()
+        return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    scheme = "https" if isinstance(server.socket, ssl.SSLSocket) else "http"
+    return f"{scheme}://{host}:{port}{API_PREFIX}"
+
+
+class MockCloudflareHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs add ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+    api = None # Set per server by MockCloudflareAPI.start()
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+            with self.api.lock:
+                self.api.stats["tls_handshakes"] += 1
+        super().setup()
+        with self.api.lock:
+            self.api.stats["connections"] += 1
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode() if not isinstance(body, bytes) else body
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if not isinstance(body, bytes) else "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, code, message, headers=None):
+        self._send(status, {"success": False, "errors": [{"code": code, "message": message}], "messages": [], "result": None}, headers)
+
+    def _ok(self, result, result_info=None):
+        body = {"success": True, "errors": [], "messages": [], "result": result}
+        if result_info is not None:
+            body["result_info"] = result_info
+        self._send(200, body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _handle(self, method):
+        api = self.api
+        url = urlparse(self.path)
+        body = self._read_json() if method in ("PUT", "PATCH", "POST") else None
+        if url.path == "/ip": # Public IP lookup, as used by a "text" IP provider. Not counted as an API request.
+            with api.lock:
+                api.stats["ip_lookups"] += 1
+            return self._send(200, f"{api.public_ip}\n".encode())
+
+        with api.lock:
+            api.stats["requests"] += 1
+            api.stats[f"requests_{method}"] += 1
+            roll = api.random.random()
+        if api.latency:
+            time.sleep(api.latency)
+        if not url.path.startswith(API_PREFIX):
+            return self._error(404, 7000, "No route for that URI")
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._error(400, 6003, "Invalid request headers")
+
+        if roll < api.error_rate_429:
+            with api.lock:
+                api.stats["injected_429"] += 1
+            return self._error(429, 971, "Please wait and consider throttling your request speed",
+                               {"Retry-After": str(api.retry_after)})
+        if roll < api.error_rate_429 + api.error_rate_5xx:
+            with api.lock:
+                api.stats["injected_5xx"] += 1
+            return self._error(503, 10000, "Service unavailable")
+
+        path = url.path[len(API_PREFIX):]
+        if method == "GET" and path == "/zones":
+            return self._list_zones(parse_qs(url.query))
+        match = re.fullmatch(r"/zones/([^/]+)/dns_records(?:/([^/]+))?", path)
+        if not match or match.group(1) not in api.zones:
+            return self._error(404, 7003, "Could not route to that URI")
+        zone_id, record_id = match.groups()
+        zone = api.zones[zone_id]
+        with api.lock:
+            api.zone_tokens.setdefault(zone_id, set()).add(self.headers["Authorization"])
+
+        if method == "GET" and record_id is None:
+            query = parse_qs(url.query)
+            if int(query.get("page", ["1"])[0]) in api.failing_pages:
+                return self._error(503, 10000, "Service unavailable")
+            return self._list(zone, query)
+        if method == "POST" and record_id == "batch":
+            if api.batch_status is not None:
+                return self._error(api.batch_status, 10000, f"Batch rejected with HTTP {api.batch_status}")
+            with api.lock:
+                api.batch_sizes.append(sum(len(body.get(key, [])) for key in ("puts", "patches", "deletes", "posts")))
+            return self._batch(zone, body)
+        if method in ("PUT", "PATCH") and record_id is not None:
+            if record_id not in zone:
+                return self._error(404, 81044, "Record does not exist.")
+            with api.lock:
+                api.record_writes.append((method, record_id, body))
+                record = self._apply(zone[record_id], body, replace=(method == "PUT"))
+            return self._ok(record)
+        return self._error(405, 10000, "Method not allowed")
+
+    def _list(self, zone, query):
+        record_type = query.get("type", [None])[0]
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = min(MAX_PER_PAGE, max(1, int(query.get("per_page", ["100"])[0])))
+        with self.api.lock:
+            self.api.listing_types.append(record_type)
+            records = [r for r in zone.values() if record_type is None or r["type"] == record_type]
+            result = [dict(r) for r in records[(page - 1) * per_page:page * per_page]]
+        total_pages = (len(records) + per_page - 1) // per_page
+        self._ok(result, {"page": page, "per_page": per_page, "count": len(result),
+                          "total_count": len(records), "total_pages": total_pages})
+
+    def _list_zones(self, query):
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = min(MAX_ZONES_PER_PAGE, max(1, int(query.get("per_page", ["20"])[0])))
+        with self.api.lock:
+            zones = [{"id": zone_id, "name": name, "status": "active"} for zone_id, name in self.api.zone_names.items()]
+        result = zones[(page - 1) * per_page:page * per_page]
+        self._ok(result, {"page": page, "per_page": per_page, "count": len(result),
+                          "total_count": len(zones), "total_pages": (len(zones) + per_page - 1) // per_page})
+
+    def _batch(self, zone, body):
+        operations = {"puts": [], "patches": [], "deletes": [], "posts": []}
+        with self.api.lock:
+            # Validate first: the real endpoint applies the whole batch or nothing.
+            for key in ("puts", "patches", "deletes"):
+                for item in body.get(key, []):
+                    if item.get("id") not in zone:
+                        return self._error(400, 81044, f"Record {item.get('id')} does not exist.")
+            for item in body.get("deletes", []):
+                operations["deletes"].append(zone.pop(item["id"]))
+            for item in body.get("patches", []):
+                operations["patches"].append(self._apply(zone[item["id"]], item, replace=False))
+            for item in body.get("puts", []):
+                operations["puts"].append(self._apply(zone[item["id"]], item, replace=True))
+            for item in body.get("posts", []):
+                record_id = uuid.uuid4().hex
+                zone[record_id] = dict(item, id=record_id)
+                operations["posts"].append(dict(zone[record_id]))
+        self._ok(operations)
+
+    @staticmethod
+    def _apply(record, changes, replace):
+        fields = ("type", "name", "content", "ttl", "proxied", "comment")
+        if replace: # PUT overwrites the record, so optional fields that were left out are cleared
+            record.pop("comment", None)
+        for field in fields:
+            if field in changes:
+                record[field] = changes[field]
+        record["modified_on"] = time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime())
+        return dict(record)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the Cloudflare v4 DNS record API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--zones", type=int, default=1, help="Number of synthetic zones.")
+    parser.add_argument("--records", type=int, default=10, help="A records per zone.")
+    parser.add_argument("--public-ip", default="198.51.100.7", help="Address served at /ip.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="Fraction of API requests answered with 429.")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="Fraction of API requests answered with 503.")
+    args = parser.parse_args()
+
+    api = MockCloudflareAPI(args.public_ip, args.latency, args.error_rate_429, args.error_rate_5xx)
+    zones = api.populate(args.zones, args.records)
+    server = api.start(args.host, args.port)
+    print(f"Mock Cloudflare API listening on {base_url(server)} (public IP at http://{args.host}:{args.port}/ip)")
+    print(f"ZONES = {json.dumps(zones, indent=4)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Cloudflare DDNS Record Model Benchmark
+# Measures, on a synthetic zone of 100k records (as the API returns them):
+#   memory:    bytes per record kept as the API's JSON dicts vs. as cloudflare_ddns.DnsRecord
+#   build:     records per second turned into DnsRecords
+#   selection: records per second matched against RECORD_INCLUDE-style rules, with cloudflare_ddns.NameRules
+#              vs. checking every rule in turn with fnmatch/re, for growing rule sets
+#
+# Usage:
+#   python3 benchmarks/record_model_benchmark.py --records 100000 --rules 10 100 1000
+
+import argparse
+import fnmatch
+import gc
+import json
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmark import NEW_IP, OLD_IP, REPO_DIR, write_config
+
+
+def record_name(n, zone_name="example.test"):
+    """A mix of plain hosts and names the wildcard and regex rules of rule_set() can match."""
+    return (f"host{n}", f"web{n % 100}-{n}", f"h{n}.team{n % 200}", f"vpn{n % 100}-{n}")[n % 4] + f".{zone_name}"
+
+
+def api_page(record_count, zone_name="example.test"):
+    """JSON text of one zone's records, with every field a real /dns_records listing has."""
+    records = [{
+        "id": f"{n:032x}",
+        "zone_id": "0" * 32,
+        "zone_name": zone_name,
+        "name": record_name(n, zone_name),
+        "type": "A",
+        "content": OLD_IP if n % 2 else NEW_IP,
+        "proxiable": True,
+        "proxied": True,
+        "ttl": 1,
+        "settings": {},
+        "meta": {"auto_added": False, "managed_by_apps": False, "managed_by_argo_tunnel": False},
+        "comment": None,
+        "tags": [],
+        "created_on": "2024-01-01T00:00:00.000000Z",
+        "modified_on": "2024-01-01T00:00:00.000000Z",
+    } for n in range(record_count)]
+    return json.dumps({"success": True, "errors": [], "messages": [], "result": records})
+
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns (its result is kept alive until measured)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def rate(function, items):
+    """Items per second function handles."""
+    started = time.perf_counter()
+    for item in items:
+        function(item)
+    return len(items) / (time.perf_counter() - started)
+
+
+def rule_set(size, zone_name="example.test"):
+    """size rules: mostly exact names, some '*.suffix' wildcards, and a few other wildcards and regexes."""
+    rules = [f"host{n * 4}.{zone_name}" for n in range(size * 8 // 10)]
+    rules += [f"*.team{n}.{zone_name}" for n in range(size // 10)]
+    rules += [f"web{n}-*.{zone_name}" for n in range(size // 20)]
+    rules += [f"re:vpn{n}-[0-9]+\\." for n in range(size - len(rules))]
+    return rules
+
+
+def naive_matcher(rules):
+    """Checks a name against every rule in turn (what a plain loop over the config list would do)."""
+    compiled = [(rule[3:], re.compile(rule[3:])) if rule.startswith("re:") else (rule, None) for rule in rules]
+
+    def matches(name):
+        name = name.lower()
+        for rule, regex in compiled:
+            if regex.match(name) if regex is not None else fnmatch.fnmatchcase(name, rule):
+                return True
+        return False
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the record model and name rule matching on a large synthetic zone.")
+    parser.add_argument("--records", type=int, default=100000, help="Records in the synthetic zone.")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000], help="Rule set sizes to match against.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ddns-records-") as directory:
+        # cloudflare_ddns reads config.py on import; nothing in this benchmark contacts the (unused) API URL.
+        write_config(directory, "http://127.0.0.1:9/client/v4", "http://127.0.0.1:9/ip", {"example.test": "0" * 32},
+                     argparse.Namespace(workers=1, no_batch=False, rate_limit=10 ** 9))
+        sys.path[:0] = [directory, REPO_DIR]
+        import cloudflare_ddns
+
+    page = api_page(args.records)
+    dicts = json.loads(page)["result"]
+    names = [record["name"] for record in dicts]
+
+    dict_bytes = retained_bytes(lambda: json.loads(page)["result"])
+    # Built from a fresh parse whose dicts are then freed, so only what the records keep (e.g. name strings) counts.
+    record_bytes = retained_bytes(lambda: [cloudflare_ddns.DnsRecord.from_api(record) for record in json.loads(page)["result"]])
+    print(f"{args.records} records")
+    print(f"  memory as API dicts:  {dict_bytes / 2 ** 20:8.1f} MB ({dict_bytes / args.records:6.0f} B/record)")
+    print(f"  memory as DnsRecord:  {record_bytes / 2 ** 20:8.1f} MB ({record_bytes / args.records:6.0f} B/record)")
+    print(f"  DnsRecord.from_api:   {rate(cloudflare_ddns.DnsRecord.from_api, dicts):10.0f} records/s")
+
+    # The per-rule scan gets too slow for every record with large rule sets, so it runs on an evenly spread sample.
+    sample = names[::max(1, len(names) // 10000)]
+    print(f"{'rules':>7} {'NameRules rec/s':>16} {'per-rule scan rec/s':>20} {'selected':>9}")
+    for size in args.rules:
+        rules = cloudflare_ddns.NameRules(rule_set(size))
+        naive = naive_matcher(rule_set(size))
+        if sum(map(rules.matches, sample)) != sum(map(naive, sample)):
+            raise RuntimeError(f"NameRules and the per-rule scan disagree for {size} rules")
+        print(f"{size:>7} {rate(rules.matches, names):>16.0f} {rate(naive, sample):>20.0f} {sum(map(rules.matches, names)):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Cloudflare DDNS Startup Benchmark
+# Times complete `python3 cloudflare_ddns.py` runs (as cron starts it) for the common "IP unchanged" case:
+#   lookup:   public IP looked up over HTTP (against the mock API's /ip endpoint), found unchanged
+#   precheck: ENABLE_LOCAL_PRECHECK with a warm cache, so no lookup is made at all
+# With --baseline-rev, the same "lookup" run of the script at an older git revision is timed for comparison.
+#
+# Usage:
+#   python3 benchmarks/startup_benchmark.py --runs 20 --baseline-rev HEAD~1
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import NEW_IP, REPO_DIR, write_config
+from mock_cloudflare_api import MockCloudflareAPI, base_url
+
+
+def time_runs(script, directory, runs):
+    """Wall time in milliseconds of each run of script, with the generated config in directory."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, os.path.dirname(os.path.abspath(__file__))]))
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, script], cwd=directory, env=env, capture_output=True, text=True)
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0 or "No update needed" not in result.stderr:
+            raise RuntimeError(f"{script} did not take the 'IP unchanged' path:\n{result.stdout}{result.stderr}")
+    return timings
+
+
+def prepare(directory, api_url, ip_url, zones, precheck):
+    write_config(directory, api_url, ip_url, zones, argparse.Namespace(workers=4, no_batch=False, rate_limit=10 ** 9))
+    with open(os.path.join(directory, "config.py"), "a") as f:
+        f.write(f"ENABLE_LOCAL_PRECHECK = {precheck!r}\n")
+        f.write(f"LOCAL_PRECHECK_FILE = {os.path.join(directory, 'precheck.json')!r}\n")
+    with open(os.path.join(directory, "ip.txt"), "w") as f:
+        json.dump({"A": NEW_IP}, f) # Already converged: every run should end at "No update needed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the 'IP unchanged' cron run with and without the local pre-check.")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per variant (median is reported).")
+    parser.add_argument("--baseline-rev", help="Also time the script at this git revision (e.g. HEAD~1).")
+    args = parser.parse_args()
+
+    api = MockCloudflareAPI(NEW_IP)
+    zones = api.populate(1, 1, NEW_IP)
+    server = api.start()
+    host, port = server.server_address[:2]
+    ip_url = f"http://{host}:{port}/ip"
+    script = os.path.join(REPO_DIR, "cloudflare_ddns.py")
+
+    variants = []
+    with tempfile.TemporaryDirectory(prefix="ddns-startup-") as root:
+        if args.baseline_rev:
+            baseline_dir = os.path.join(root, "baseline")
+            os.mkdir(baseline_dir)
+            baseline_script = os.path.join(baseline_dir, "cloudflare_ddns.py")
+            source = subprocess.run(["git", "show", f"{args.baseline_rev}:cloudflare_ddns.py"], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout
+            with open(baseline_script, "w") as f:
+                f.write(source)
+            prepare(baseline_dir, base_url(server), ip_url, zones, precheck=False)
+            variants.append((f"baseline ({args.baseline_rev})", baseline_script, baseline_dir))
+        for name, precheck in (("lookup", False), ("precheck", True)):
+            directory = os.path.join(root, name)
+            os.mkdir(directory)
+            prepare(directory, base_url(server), ip_url, zones, precheck)
+            if precheck:
+                time_runs(script, directory, 1) # First run does the lookup and fills the pre-check cache
+            variants.append((name, script, directory))
+
+        print(f"{'variant':<24} {'median ms':>10} {'min ms':>8} {'max ms':>8} {'IP lookups':>11}")
+        for name, variant_script, directory in variants:
+            lookups_before = api.stats["ip_lookups"]
+            timings = time_runs(variant_script, directory, args.runs)
+            print(f"{name:<24} {statistics.median(timings):>10.1f} {min(timings):>8.1f} {max(timings):>8.1f} "
+                  f"{api.stats['ip_lookups'] - lookups_before:>11}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,45 @@
 #!/usr/bin/env python3
 # Cloudflare DDNS Update Script
-# This script updates Cloudflare DNS 'A' records with the current public IP address.
+# This script updates Cloudflare DNS 'A' (and optionally 'AAAA') records with the current public IP address.
 
 
+import argparse
+import importlib.util
 import subprocess
-import requests
 import json
 import datetime
 import logging
+import logging.handlers
+import atexit
+import contextlib
+import fnmatch
 import os
+import time
+import ipaddress
+import queue
+import random
+import re
+import socket
+import struct
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class LazyModule:
+    """Stands in for a module that is only imported on first use, so runs that never need it skip the import."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        globals()[self._name] = module # Later lookups go straight to the real module
+        return getattr(module, attribute)
+
+
+# requests is by far the slowest import and is not needed when the local pre-check finds nothing changed.
+requests = LazyModule("requests")
 
 # --- Load Configuration ---
 try:
@@ -18,120 +49,1568 @@ except ImportError:
     print("Please copy 'config.py.example' to 'config.py' and fill in your details.")
     exit(1)
 
+# Zones can be grouped under several Cloudflare accounts/tokens with ACCOUNTS (see config.py.example).
+# Without ACCOUNTS, CLOUDFLARE_API_TOKEN and ZONES form a single account.
+ACCOUNTS = getattr(config, 'ACCOUNTS', None)
+
 CLOUDFLARE_API_TOKEN = ""
 if hasattr(config, 'CLOUDFLARE_API_TOKEN_ENV_VAR') and config.CLOUDFLARE_API_TOKEN_ENV_VAR:
     CLOUDFLARE_API_TOKEN = os.getenv(config.CLOUDFLARE_API_TOKEN_ENV_VAR)
 if not CLOUDFLARE_API_TOKEN and hasattr(config, 'CLOUDFLARE_API_TOKEN'):
     CLOUDFLARE_API_TOKEN = config.CLOUDFLARE_API_TOKEN
 
-if not CLOUDFLARE_API_TOKEN:
+if not CLOUDFLARE_API_TOKEN and not ACCOUNTS:
     print("CRITICAL: Cloudflare API Token not configured.")
     print("Please set it in config.py or via the environment variable specified in config.py.")
     exit(1)
 
+# Cloudflare API endpoint. Only change this to point the script at a stand-in such as benchmarks/mock_cloudflare_api.py.
+CLOUDFLARE_API_BASE_URL = getattr(config, 'CLOUDFLARE_API_BASE_URL', "https://api.cloudflare.com/client/v4").rstrip("/")
+
 ZONES = getattr(config, 'ZONES', {})
-if not ZONES:
+
+# Zone discovery: add every zone the API token can read (GET /zones) whose name matches ZONE_DISCOVERY_PATTERNS
+# (and none of ZONE_DISCOVERY_EXCLUDE; both use the name rules described at RECORD_INCLUDE) to the zones in ZONES. The listing is cached in ZONE_DISCOVERY_CACHE_FILE
+# and refreshed in the background once it is older than ZONE_DISCOVERY_TTL seconds.
+ZONE_DISCOVERY = getattr(config, 'ZONE_DISCOVERY', False)
+ZONE_DISCOVERY_PATTERNS = getattr(config, 'ZONE_DISCOVERY_PATTERNS', ['*']) # Shell-style, e.g. ['*.com', 'example.*']
+ZONE_DISCOVERY_EXCLUDE = getattr(config, 'ZONE_DISCOVERY_EXCLUDE', [])
+ZONE_DISCOVERY_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'ZONE_DISCOVERY_CACHE_FILE', 'cloudflare_ddns_zones.json'))
+ZONE_DISCOVERY_TTL = getattr(config, 'ZONE_DISCOVERY_TTL', 86400)
+ZONES_PER_PAGE = 50 # Cloudflare's maximum page size for listing zones
+if not isinstance(ZONE_DISCOVERY_TTL, (int, float)) or ZONE_DISCOVERY_TTL <= 0:
+    print("CRITICAL: ZONE_DISCOVERY_TTL must be a positive number (seconds) in config.py.")
+    exit(1)
+
+if not ZONES and not ACCOUNTS and not ZONE_DISCOVERY:
     print("CRITICAL: No ZONES configured in config.py. Exiting.")
     exit(1)
 
 IP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'IP_FILE', 'cloudflare_ddns_currentIP.txt'))
 LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'LOG_FILE', 'cloudflare_ddns.log'))
+LOG_LEVEL = getattr(config, 'LOG_LEVEL', 'DEBUG') # Level written to LOG_FILE. Per-record lines are DEBUG; zone summaries are INFO.
+LOG_FORMAT = getattr(config, 'LOG_FORMAT', 'text') # 'text' or 'json' (one JSON object per line in LOG_FILE)
+LOG_ROTATION = getattr(config, 'LOG_ROTATION', None) # None, 'size' (LOG_MAX_BYTES) or 'time' (LOG_ROTATE_WHEN)
+LOG_MAX_BYTES = getattr(config, 'LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_ROTATE_WHEN = getattr(config, 'LOG_ROTATE_WHEN', 'midnight')
+LOG_BACKUP_COUNT = getattr(config, 'LOG_BACKUP_COUNT', 5)
+LOG_ASYNC = getattr(config, 'LOG_ASYNC', True) # Write log files on a background thread instead of in the update path
+if not isinstance(logging.getLevelName(str(LOG_LEVEL).upper()), int) or LOG_FORMAT not in ('text', 'json') \
+        or LOG_ROTATION not in (None, 'size', 'time'):
+    print("CRITICAL: LOG_LEVEL must be a logging level name, LOG_FORMAT 'text' or 'json', and LOG_ROTATION None, 'size' or 'time' in config.py.")
+    exit(1)
+
+# Record-state cache: remembers each zone's records and which zones converged to which IP between runs.
+ENABLE_STATE_CACHE = getattr(config, 'ENABLE_STATE_CACHE', False)
+STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'STATE_FILE', 'cloudflare_ddns_state.json'))
+STATE_FULL_RECONCILE_INTERVAL = getattr(config, 'STATE_FULL_RECONCILE_INTERVAL', 86400) # Seconds between full re-lists
+
+# Number of Cloudflare API calls (zone fetches and record updates) allowed in flight at once. 1 = sequential.
+MAX_WORKERS = getattr(config, 'MAX_WORKERS', 1)
+if not isinstance(MAX_WORKERS, int) or MAX_WORKERS < 1:
+    print("CRITICAL: MAX_WORKERS must be a positive integer in config.py.")
+    exit(1)
+
+# DNS record types to keep in sync: 'A' (IPv4) and/or 'AAAA' (IPv6). Each type tracks its own public IP.
+IP_VERSIONS = {"A": 4, "AAAA": 6}
+RECORD_TYPES = list(getattr(config, 'RECORD_TYPES', ['A']))
+if not RECORD_TYPES or any(record_type not in IP_VERSIONS for record_type in RECORD_TYPES):
+    print("CRITICAL: RECORD_TYPES must contain 'A', 'AAAA' or both in config.py.")
+    exit(1)
+
+# Public IP providers, queried concurrently. Each entry is a dict with a 'type' of 'text', 'json' or 'dns'
+# and an 'ip_version' of 4 (default) or 6 saying which address family it reports.
+DEFAULT_IP_PROVIDERS = [
+    {"name": "ipify", "type": "json", "url": "https://api.ipify.org?format=json", "key": "ip"},
+    {"name": "icanhazip", "type": "text", "url": "https://ipv4.icanhazip.com"},
+    {"name": "aws", "type": "text", "url": "https://checkip.amazonaws.com"},
+    {"name": "opendns", "type": "dns", "server": "208.67.222.222", "query": "myip.opendns.com"},
+    {"name": "ipify6", "type": "json", "url": "https://api6.ipify.org?format=json", "key": "ip", "ip_version": 6},
+    {"name": "icanhazip6", "type": "text", "url": "https://ipv6.icanhazip.com", "ip_version": 6},
+    {"name": "opendns6", "type": "dns", "server": "2620:119:35::35", "query": "myip.opendns.com", "ip_version": 6},
+]
+IP_PROVIDERS = getattr(config, 'IP_PROVIDERS', None) or DEFAULT_IP_PROVIDERS
+IP_PROVIDER_QUORUM = getattr(config, 'IP_PROVIDER_QUORUM', 1) # How many providers must return the same IP
+IP_PROVIDER_FANOUT = getattr(config, 'IP_PROVIDER_FANOUT', 3) # How many providers are queried at the same time
+IP_PROVIDER_TIMEOUT = getattr(config, 'IP_PROVIDER_TIMEOUT', 10)
+
+# Local pre-check (cron mode): skip the public IP lookup while the local address the default route uses is the
+# same as at the last lookup. A lookup is still forced every LOCAL_PRECHECK_MAX_AGE seconds, for changes upstream (NAT).
+ENABLE_LOCAL_PRECHECK = getattr(config, 'ENABLE_LOCAL_PRECHECK', False)
+LOCAL_PRECHECK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'LOCAL_PRECHECK_FILE', 'cloudflare_ddns_precheck.json'))
+LOCAL_PRECHECK_MAX_AGE = getattr(config, 'LOCAL_PRECHECK_MAX_AGE', 3600)
+if not isinstance(LOCAL_PRECHECK_MAX_AGE, (int, float)) or LOCAL_PRECHECK_MAX_AGE <= 0:
+    print("CRITICAL: LOCAL_PRECHECK_MAX_AGE must be a positive number (seconds) in config.py.")
+    exit(1)
+for record_type in RECORD_TYPES:
+    family_providers = [p for p in IP_PROVIDERS if p.get("ip_version", 4) == IP_VERSIONS[record_type]]
+    if not isinstance(IP_PROVIDER_QUORUM, int) or not 1 <= IP_PROVIDER_QUORUM <= len(family_providers):
+        print(f"CRITICAL: IP_PROVIDER_QUORUM must be between 1 and the number of IPv{IP_VERSIONS[record_type]} IP_PROVIDERS in config.py.")
+        exit(1)
+if not isinstance(IP_PROVIDER_FANOUT, int) or IP_PROVIDER_FANOUT < IP_PROVIDER_QUORUM:
+    print("CRITICAL: IP_PROVIDER_FANOUT must be an integer no smaller than IP_PROVIDER_QUORUM in config.py.")
+    exit(1)
+
+# Daemon mode (--daemon): how often to check the public IP, and how often to re-list every zone from Cloudflare.
+DAEMON_POLL_INTERVAL = getattr(config, 'DAEMON_POLL_INTERVAL', 60)
+DAEMON_RECONCILE_INTERVAL = getattr(config, 'DAEMON_RECONCILE_INTERVAL', 3600)
+if not all(isinstance(v, (int, float)) and v > 0 for v in (DAEMON_POLL_INTERVAL, DAEMON_RECONCILE_INTERVAL)):
+    print("CRITICAL: DAEMON_POLL_INTERVAL and DAEMON_RECONCILE_INTERVAL must be positive numbers (seconds) in config.py.")
+    exit(1)
+
+# Watch mode (--watch): the daemon waits for Linux netlink address/route events instead of polling every
+# DAEMON_POLL_INTERVAL. A slow fallback poll still catches changes made upstream (e.g. behind NAT).
+WATCH_FALLBACK_POLL_INTERVAL = getattr(config, 'WATCH_FALLBACK_POLL_INTERVAL', 900)
+WATCH_SETTLE_TIME = getattr(config, 'WATCH_SETTLE_TIME', 2) # Seconds to let a burst of interface events settle
+if not isinstance(WATCH_FALLBACK_POLL_INTERVAL, (int, float)) or WATCH_FALLBACK_POLL_INTERVAL <= 0 \
+        or not isinstance(WATCH_SETTLE_TIME, (int, float)) or WATCH_SETTLE_TIME < 0:
+    print("CRITICAL: WATCH_FALLBACK_POLL_INTERVAL must be a positive number and WATCH_SETTLE_TIME a non-negative number (seconds) in config.py.")
+    exit(1)
+
+# Records requested per page when listing a zone. Larger pages mean fewer round trips for big zones.
+DNS_RECORDS_PER_PAGE = getattr(config, 'DNS_RECORDS_PER_PAGE', 5000)
+
+# Cloudflare API request scheduling. The default matches Cloudflare's global limit of 1200 requests per 5 minutes.
+CLOUDFLARE_RATE_LIMIT = getattr(config, 'CLOUDFLARE_RATE_LIMIT', 1200) # Requests allowed...
+CLOUDFLARE_RATE_PERIOD = getattr(config, 'CLOUDFLARE_RATE_PERIOD', 300) # ...per this many seconds
+API_MAX_RETRIES = getattr(config, 'API_MAX_RETRIES', 4) # Retries for 429s, 5xx responses and timeouts
+API_BACKOFF_BASE = getattr(config, 'API_BACKOFF_BASE', 1.0) # Seconds; doubled on every retry, with jitter
+API_BACKOFF_MAX = getattr(config, 'API_BACKOFF_MAX', 60)
+CIRCUIT_BREAKER_THRESHOLD = getattr(config, 'CIRCUIT_BREAKER_THRESHOLD', 5) # Consecutive failed calls before a zone is paused
+CIRCUIT_BREAKER_COOLDOWN = getattr(config, 'CIRCUIT_BREAKER_COOLDOWN', 60) # Seconds a paused zone fails fast
+if not isinstance(CLOUDFLARE_RATE_LIMIT, int) or CLOUDFLARE_RATE_LIMIT < 2 or CLOUDFLARE_RATE_PERIOD <= 0:
+    print("CRITICAL: CLOUDFLARE_RATE_LIMIT must be an integer of at least 2 and CLOUDFLARE_RATE_PERIOD a positive number in config.py.")
+    exit(1)
+
+# One entry per account: its token, zones, worker pool size and request budget. Accounts run in parallel.
+if ACCOUNTS:
+    ACCOUNT_SETTINGS = []
+    for index, account in enumerate(ACCOUNTS):
+        name = account.get("name", f"account{index + 1}")
+        api_token = os.getenv(account["api_token_env_var"]) if account.get("api_token_env_var") else None
+        settings = {
+            "name": name,
+            "api_token": api_token or account.get("api_token"),
+            "zones": account.get("zones") or {},
+            "max_workers": account.get("max_workers", MAX_WORKERS),
+            "rate_limit": account.get("rate_limit", CLOUDFLARE_RATE_LIMIT),
+            "rate_period": account.get("rate_period", CLOUDFLARE_RATE_PERIOD),
+            "discover_zones": account.get("discover_zones", ZONE_DISCOVERY),
+        }
+        if not settings["api_token"] or not (settings["zones"] or settings["discover_zones"]):
+            print(f"CRITICAL: Account '{name}' in ACCOUNTS needs an API token (api_token or api_token_env_var) and zones (or discover_zones) in config.py.")
+            exit(1)
+        if not all(isinstance(settings[key], int) and settings[key] >= minimum for key, minimum in (("max_workers", 1), ("rate_limit", 2))) \
+                or settings["rate_period"] <= 0:
+            print(f"CRITICAL: max_workers must be a positive integer, rate_limit an integer of at least 2 and rate_period a positive number for account '{name}' in config.py.")
+            exit(1)
+        ACCOUNT_SETTINGS.append(settings)
+    ZONES = {}
+    for settings in ACCOUNT_SETTINGS:
+        for zone_name, zone_id in settings["zones"].items():
+            if zone_id in ZONES.values():
+                print(f"CRITICAL: Zone ID {zone_id} is listed under more than one account in config.py.")
+                exit(1)
+            ZONES[zone_name] = zone_id
+else:
+    ACCOUNT_SETTINGS = [{
+        "name": "default", "api_token": CLOUDFLARE_API_TOKEN, "zones": ZONES, "max_workers": MAX_WORKERS,
+        "rate_limit": CLOUDFLARE_RATE_LIMIT, "rate_period": CLOUDFLARE_RATE_PERIOD, "discover_zones": ZONE_DISCOVERY,
+    }]
+
+# Send a zone's pending updates through /dns_records/batch, at most DNS_BATCH_SIZE records per request.
+ENABLE_BATCH_UPDATES = getattr(config, 'ENABLE_BATCH_UPDATES', True)
+DNS_BATCH_SIZE = getattr(config, 'DNS_BATCH_SIZE', 200)
+if not isinstance(DNS_BATCH_SIZE, int) or DNS_BATCH_SIZE < 1:
+    print("CRITICAL: DNS_BATCH_SIZE must be a positive integer in config.py.")
+    exit(1)
+
+# Desired state of the synced records besides their IP. Each record is diffed against it and only the fields
+# that differ are sent (PATCH). None leaves a field as it is in Cloudflare, so by default only the IP is managed.
+MANAGED_RECORD_FIELDS = ("proxied", "ttl", "comment")
+RECORD_DEFAULTS = getattr(config, 'RECORD_DEFAULTS', {}) # e.g. {"proxied": True, "ttl": 1} (1 = auto)
+RECORD_OVERRIDES = getattr(config, 'RECORD_OVERRIDES', {}) # Per record name, e.g. {"ssh.example.com": {"proxied": False}}
+if not isinstance(RECORD_DEFAULTS, dict) or not isinstance(RECORD_OVERRIDES, dict) or any(
+    not isinstance(fields, dict) or set(fields) - set(MANAGED_RECORD_FIELDS)
+    for fields in [RECORD_DEFAULTS, *RECORD_OVERRIDES.values()]
+):
+    print("CRITICAL: RECORD_DEFAULTS and the entries of RECORD_OVERRIDES must be dicts of 'proxied', 'ttl' and/or 'comment' in config.py.")
+    exit(1)
+if not all(isinstance(name, str) for name in RECORD_OVERRIDES):
+    print("CRITICAL: The keys of RECORD_OVERRIDES must be record names in config.py.")
+    exit(1)
+# Record names are compared in lower case, like the RECORD_INCLUDE/RECORD_EXCLUDE rules.
+RECORD_OVERRIDES = {name.lower().rstrip("."): fields for name, fields in RECORD_OVERRIDES.items()}
+
+# Which records to manage, by name. Rules are exact names ('home.example.com'), wildcards ('*.example.com',
+# 'web?.example.org') or regular expressions prefixed with 're:' ('re:vpn-[0-9]+\\.'), which must match from the
+# start of the name. Names are compared in lower case and regular expressions ignore case.
+# An empty RECORD_INCLUDE means every record; RECORD_EXCLUDE wins.
+RECORD_INCLUDE = getattr(config, 'RECORD_INCLUDE', [])
+RECORD_EXCLUDE = getattr(config, 'RECORD_EXCLUDE', [])
 
 # GET Notification Configuration
 ENABLE_APACHE_STATUS_CHECK = getattr(config, 'ENABLE_APACHE_STATUS_CHECK', False)
 ENABLE_SYSTEM_UPDATE_CHECK = getattr(config, 'ENABLE_SYSTEM_UPDATE_CHECK', False)
+# The apt result is reused until apt's package lists or dpkg's status change, or SYSTEM_UPDATE_CACHE_TTL seconds pass.
+SYSTEM_UPDATE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'SYSTEM_UPDATE_CACHE_FILE', 'cloudflare_ddns_apt_cache.json'))
+SYSTEM_UPDATE_CACHE_TTL = getattr(config, 'SYSTEM_UPDATE_CACHE_TTL', 3600)
 
 ENABLE_DISCORD_NOTIFICATIONS = getattr(config, 'ENABLE_DISCORD_NOTIFICATIONS', False)
 if not ENABLE_DISCORD_NOTIFICATIONS:
     print("CRITICAL: Please define this in config.py")
     exit(1)
 
+# Notification backend:
+#   'script'  - run DISCORD_SCRIPT_PATH with php or python3 in a subprocess (the original behaviour)
+#   'discord' - load DiscordNotifier from DISCORD_NOTIFIER_PATH (discord_notifier.py) into this process
+#   '/path/to/module.py:ClassName' - any other Notifier subclass, constructed with the config module
+NOTIFICATION_BACKEND = getattr(config, 'NOTIFICATION_BACKEND', 'script')
+
 DISCORD_SCRIPT_LANGAUGE = getattr(config, 'DISCORD_SCRIPT_LANGAUGE', None)
-if DISCORD_SCRIPT_LANGAUGE not in ['php', 'py'] and ENABLE_DISCORD_NOTIFICATIONS == True:
+if DISCORD_SCRIPT_LANGAUGE not in ['php', 'py'] and ENABLE_DISCORD_NOTIFICATIONS == True and NOTIFICATION_BACKEND == 'script':
     print("CRITICAL: DISCORD_SCRIPT_LANGAUGE must be set to 'php' or 'py' in config.py. Or turn off ENABLE_DISCORD_NOTIFICATIONS.")
     exit(1)
 
 DISCORD_SCRIPT_PATH = getattr(config, 'DISCORD_SCRIPT_PATH', None)
-if not DISCORD_SCRIPT_PATH and ENABLE_DISCORD_NOTIFICATIONS == True:
+if not DISCORD_SCRIPT_PATH and ENABLE_DISCORD_NOTIFICATIONS == True and NOTIFICATION_BACKEND == 'script':
     print("CRITICAL: DISCORD_SCRIPT_PATH must be set in config.py if ENABLE_DISCORD_NOTIFICATIONS is True.")
     exit(1)
 
+DISCORD_NOTIFIER_PATH = getattr(config, 'DISCORD_NOTIFIER_PATH', None)
+if not DISCORD_NOTIFIER_PATH and ENABLE_DISCORD_NOTIFICATIONS == True and NOTIFICATION_BACKEND == 'discord':
+    print("CRITICAL: DISCORD_NOTIFIER_PATH must be set in config.py if NOTIFICATION_BACKEND is 'discord'.")
+    exit(1)
+
+# Discord webhook URL for the 'discord' backend and the Python notification script, resolved here so a missing URL
+# stops the script at startup rather than on the notification thread.
+DISCORD_WEBHOOK_URL = ""
+if hasattr(config, 'DISCORD_API_WEBHOOK_URL_ENV_VAR') and config.DISCORD_API_WEBHOOK_URL_ENV_VAR:
+    DISCORD_WEBHOOK_URL = os.getenv(config.DISCORD_API_WEBHOOK_URL_ENV_VAR)
+if not DISCORD_WEBHOOK_URL and hasattr(config, 'DISCORD_WEBHOOK_URL'):
+    DISCORD_WEBHOOK_URL = config.DISCORD_WEBHOOK_URL
+if not DISCORD_WEBHOOK_URL and ENABLE_DISCORD_NOTIFICATIONS == True and (
+        NOTIFICATION_BACKEND == 'discord' or (NOTIFICATION_BACKEND == 'script' and DISCORD_SCRIPT_LANGAUGE == 'py')):
+    print("CRITICAL: Discord API Token not configured.")
+    print("Please set it in config.py or via the environment variable specified in config.py.")
+    exit(1)
+
+DISCORD_COALESCE_WINDOW = getattr(config, 'DISCORD_COALESCE_WINDOW', 5) # Seconds to gather reports into one message (daemon mode)
+DISCORD_SPOOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), getattr(config, 'DISCORD_SPOOL_FILE', 'discord_undelivered.jsonl')) # Undelivered messages, retried on the next run
+
+# Prometheus metrics. In daemon mode they are served at http://METRICS_ADDRESS:METRICS_PORT/metrics (None = off).
+# In cron mode they are written to METRICS_TEXTFILE after every run, for node_exporter's textfile collector (None = off).
+METRICS_ADDRESS = getattr(config, 'METRICS_ADDRESS', '127.0.0.1')
+METRICS_PORT = getattr(config, 'METRICS_PORT', None)
+METRICS_TEXTFILE = getattr(config, 'METRICS_TEXTFILE', None)
+if METRICS_PORT is not None and (not isinstance(METRICS_PORT, int) or not 0 < METRICS_PORT < 65536):
+    print("CRITICAL: METRICS_PORT must be a port number or None in config.py.")
+    exit(1)
+
+# Run timing: wall-clock spans for every phase, zone and Cloudflare API request of a run, summarized in one log line
+# per run. The spans can also be exported in OpenTelemetry's OTLP/JSON format, to a file and/or an OTLP/HTTP collector.
+ENABLE_RUN_TIMING = getattr(config, 'ENABLE_RUN_TIMING', True)
+TRACE_EXPORT_FILE = getattr(config, 'TRACE_EXPORT_FILE', None) # Appends one OTLP/JSON trace per line (None = off)
+if TRACE_EXPORT_FILE:
+    TRACE_EXPORT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), TRACE_EXPORT_FILE)
+TRACE_EXPORT_URL = getattr(config, 'TRACE_EXPORT_URL', None) # e.g. 'http://localhost:4318/v1/traces' (None = off)
+# Spans kept per run for the export. Later ones still count in the summary but are dropped, so a run with many
+# thousands of API requests keeps bounded memory; the export says how many were dropped.
+TRACE_MAX_SPANS = getattr(config, 'TRACE_MAX_SPANS', 1000)
+if not isinstance(TRACE_MAX_SPANS, int) or TRACE_MAX_SPANS < 1:
+    print("CRITICAL: TRACE_MAX_SPANS must be a positive integer in config.py.")
+    exit(1)
+
 
 
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, including the structured fields passed to a log call with extra={...}."""
+
+    FIELDS = ("zone", "record", "record_type", "updated", "failed", "unchanged", "elapsed_ms",
+              "method", "endpoint", "status", "latency_ms")
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+log_handlers = [] # Handlers setup_logging() attached to the root logger
+log_listener = None
+
 def setup_logging():
-    """Configures logging to file and console."""
-    # Basic configuration for logging
-    # File handler
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    """Configures logging to file and console. Calling it again (e.g. main() run twice in-process) does nothing."""
+    global log_listener
+    if log_handlers:
+        return
+    # File handler, optionally rotating
+    if LOG_ROTATION == 'size':
+        file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    elif LOG_ROTATION == 'time':
+        file_handler = logging.handlers.TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+    else:
+        file_handler = logging.FileHandler(LOG_FILE)
+    if LOG_FORMAT == 'json':
+        file_handler.setFormatter(JsonLogFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    file_level = logging.getLevelName(str(LOG_LEVEL).upper())
+    file_handler.setLevel(file_level)
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     console_handler.setLevel(logging.INFO) # Console shows INFO and above
 
+    handlers = [file_handler, console_handler]
+    if LOG_ASYNC:
+        # Callers only put records on a queue; a listener thread does the formatting and file writes.
+        log_queue = queue.Queue()
+        log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        log_listener.start()
+        atexit.register(log_listener.stop) # Flushes whatever is still queued on exit
+        handlers = [logging.handlers.QueueHandler(log_queue)]
+
     # Root logger
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG) # Capture DEBUG and above for the file
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.setLevel(min(file_level, logging.INFO)) # DEBUG records are not even created unless the file wants them
+    for handler in handlers:
+        logger.addHandler(handler)
+        log_handlers.append(handler)
+
+
+class Metric:
+    """A labelled Prometheus counter or gauge, rendered in the text exposition format."""
+
+    def __init__(self, name, documentation, metric_type="counter", labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labelnames)
+        with self.lock:
+            self.values[key] = value
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{self._labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Histogram(Metric):
+    """A labelled Prometheus histogram. Buckets are upper bounds in seconds."""
 
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
 
-def get_public_ip():
-    """Get current public IP address."""
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, "histogram", labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labelnames)
+        with self.lock:
+            counts, total, count = self.values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(c + (value <= bound) for c, bound in zip(counts, self.buckets))
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self._labels(key, [('le', str(bound))])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+metrics_registry = []
+
+API_REQUEST_SECONDS = Histogram("cloudflare_ddns_api_request_duration_seconds",
+                                "Cloudflare API request latency (each attempt, including retries).", ("method", "endpoint", "status"))
+RECORDS_UPDATED = Metric("cloudflare_ddns_records_updated_total", "DNS records successfully updated.", "counter", ("zone", "type"))
+RECORDS_FAILED = Metric("cloudflare_ddns_records_failed_total", "DNS record updates that failed.", "counter", ("zone", "type"))
+IP_LOOKUP_SECONDS = Histogram("cloudflare_ddns_ip_lookup_duration_seconds",
+                              "Public IP lookup latency per provider.", ("provider", "result"))
+CONVERGENCE_SECONDS = Histogram("cloudflare_ddns_convergence_seconds",
+                                "Time from starting the lookup that detected an IP change until every record pointed at the new IP.", ("type",))
+IP_CHANGES = Metric("cloudflare_ddns_ip_changes_total", "Public IP changes detected.", "counter", ("type",))
+NOTIFICATION_SECONDS = Histogram("cloudflare_ddns_notification_duration_seconds",
+                                 "Time from queueing a notification until the backend finished sending it.", ("backend", "result"))
+LAST_RUN_TIMESTAMP = Metric("cloudflare_ddns_last_run_timestamp_seconds", "Unix time the last IP check started.", "gauge")
+LAST_CONVERGED_TIMESTAMP = Metric("cloudflare_ddns_last_converged_timestamp_seconds",
+                                  "Unix time records last fully converged to a new IP.", "gauge", ("type",))
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in metrics_registry) + "\n"
+
+def write_metrics_textfile(path):
+    """Write all metrics to path atomically (textfile collectors may read it at any moment)."""
+    temp_path = f"{path}.tmp"
     try:
-        response = requests.get("https://api64.ipify.org?format=json", timeout=10)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        return response.json()["ip"]
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching public IP: {e}")
-        return None
-    except (json.JSONDecodeError, KeyError) as e:
-        logging.error(f"Error parsing IP address from response: {e}")
+        with open(temp_path, "w") as f:
+            f.write(render_metrics())
+        os.replace(temp_path, path)
+    except OSError as e:
+        logging.error(f"Could not write metrics to {path}: {e}")
+
+def start_metrics_server(address, port):
+    """Serve /metrics on a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes would otherwise flood the console
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics at http://{address}:{port}/metrics")
+    return server
+
+
+class RunTrace:
+    """Wall-clock spans of one run (phases, zones, API requests), exportable as OpenTelemetry OTLP/JSON.
+
+    A span nests under the span open on the same thread, or under the run's root span. Only the first max_spans
+    spans are kept for to_otlp(); the summary is built from per-name totals that include every span.
+    """
+
+    KIND_INTERNAL = 1
+    KIND_CLIENT = 3
+    # Attributes that name what a span was about, shown next to the slowest span in the summary.
+    LABEL_ATTRIBUTES = ("ddns.zone", "ddns.record", "ddns.provider", "ddns.check", "ddns.account")
+
+    def __init__(self, name, max_spans=None):
+        self.trace_id = os.urandom(16).hex()
+        self.max_spans = TRACE_MAX_SPANS if max_spans is None else max_spans
+        self.spans = []
+        self.dropped_spans = 0
+        self.totals = {} # span name -> [finished count, summed ns, slowest ns, slowest span's label], in start order
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.root = self._new_span(name, None, {}, self.KIND_INTERNAL)
+
+    def _new_span(self, name, parent_id, attributes, kind):
+        span = {"name": name, "span_id": os.urandom(8).hex(), "parent_id": parent_id, "kind": kind,
+                "start": time.time_ns(), "end": None, "attributes": attributes, "error": None}
+        with self.lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+            if parent_id is not None:
+                self.totals.setdefault(name, [0, 0, -1, ""])
+        return span
+
+    def _end_span(self, span):
+        span["end"] = time.time_ns()
+        duration = span["end"] - span["start"]
+        with self.lock:
+            totals = self.totals[span["name"]]
+            totals[0] += 1
+            totals[1] += duration
+            if duration > totals[2]:
+                attributes = span["attributes"]
+                totals[2] = duration
+                totals[3] = next((f" ({attributes[key]})" for key in self.LABEL_ATTRIBUTES if key in attributes), "")
+
+    @contextlib.contextmanager
+    def span(self, name, attributes=None, kind=KIND_INTERNAL):
+        """Time the with block as a span. Yields the span dict; set span["error"] to mark it failed."""
+        stack = self.local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else self.root
+        span = self._new_span(name, parent["span_id"], dict(attributes or {}), kind)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            self._end_span(span)
+
+    def finish(self):
+        self.root["end"] = time.time_ns()
+
+    def summary(self):
+        """One line: the run's duration, then per span name the count, summed and slowest duration."""
+        parts = [f"total {((self.root['end'] or time.time_ns()) - self.root['start']) / 1e6:.0f} ms"]
+        with self.lock:
+            totals = list(self.totals.items()) # Roughly the order the phases started in
+        for name, (count, summed, slowest, label) in totals:
+            if count == 0:
+                continue # Still running, e.g. an abandoned IP lookup
+            if count == 1:
+                parts.append(f"{name} {slowest / 1e6:.0f} ms{label}")
+            else:
+                parts.append(f"{name} x{count} sum {summed / 1e6:.0f} ms, slowest {slowest / 1e6:.0f} ms{label}")
+        return "; ".join(parts)
+
+    def to_otlp(self):
+        """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        spans = []
+        with self.lock:
+            for span in self.spans:
+                otlp_span = {
+                    "traceId": self.trace_id,
+                    "spanId": span["span_id"],
+                    "name": span["name"],
+                    "kind": span["kind"],
+                    "startTimeUnixNano": str(span["start"]),
+                    "endTimeUnixNano": str(span["end"] or time.time_ns()),
+                    "attributes": [{"key": key, "value": value(v)} for key, v in span["attributes"].items()],
+                }
+                if span["parent_id"]:
+                    otlp_span["parentSpanId"] = span["parent_id"]
+                if span["error"]:
+                    otlp_span["status"] = {"code": 2, "message": span["error"]} # STATUS_CODE_ERROR
+                spans.append(otlp_span)
+            if self.dropped_spans:
+                spans[0]["attributes"].append({"key": "ddns.dropped_spans", "value": value(self.dropped_spans)})
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "cloudflare-ddns"}}]},
+            "scopeSpans": [{"scope": {"name": "cloudflare_ddns"}, "spans": spans}],
+        }]}
+
+
+current_trace = None # RunTrace of the run in progress (None when ENABLE_RUN_TIMING is off or between runs)
+
+def trace_span(name, attributes=None, kind=RunTrace.KIND_INTERNAL):
+    """A span in the current run's trace, or a no-op outside a traced run."""
+    trace = current_trace
+    if trace is None:
+        return contextlib.nullcontext({"attributes": {}, "error": None})
+    return trace.span(name, attributes, kind)
+
+def run_in_span(name, attributes, function, *args):
+    """Call function(*args) inside a span, e.g. as an executor task."""
+    with trace_span(name, attributes):
+        return function(*args)
+
+def start_run_trace(name="run"):
+    global current_trace
+    current_trace = RunTrace(name) if ENABLE_RUN_TIMING else None
+
+def finish_run_trace(level=logging.INFO):
+    """End the current run's trace, log its timing summary and export it if configured."""
+    global current_trace
+    trace, current_trace = current_trace, None
+    if trace is None:
+        return
+    trace.finish()
+    logging.log(level, f"Run timing: {trace.summary()}")
+    if TRACE_EXPORT_FILE or TRACE_EXPORT_URL:
+        export_trace(trace)
+
+def export_trace(trace):
+    """Append the trace to TRACE_EXPORT_FILE and/or POST it to the OTLP/HTTP collector at TRACE_EXPORT_URL."""
+    payload = trace.to_otlp()
+    if TRACE_EXPORT_FILE:
+        try:
+            with open(TRACE_EXPORT_FILE, "a") as f:
+                f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logging.error(f"Could not write trace to {TRACE_EXPORT_FILE}: {e}")
+    if TRACE_EXPORT_URL:
+        try:
+            response = http_client.session.post(TRACE_EXPORT_URL, json=payload, timeout=5)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Could not export trace to {TRACE_EXPORT_URL}: {e}")
+
+def start_profiler():
+    """Start cProfile for --profile. Returns the profilers whose stats make up the dump."""
+    import cProfile
+
+    profilers = [cProfile.Profile()]
+    if sys.version_info < (3, 12):
+        # Before 3.12 a profiler only sees the thread that enabled it, so every new thread enables its own.
+        def profile_thread(*args):
+            profiler = cProfile.Profile()
+            profilers.append(profiler)
+            profiler.enable() # Replaces this hook for the rest of the thread
+        threading.setprofile(profile_thread)
+    profilers[0].enable()
+    return profilers
+
+def write_profile(profilers, path):
+    """Stop profiling and write the merged stats of profilers to path (a pstats dump)."""
+    import pstats
+
+    threading.setprofile(None)
+    for profiler in profilers:
+        profiler.disable()
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(path)
+    logging.info(f"Profile written to {path} (view with: python3 -m pstats {path}).")
+
+
+class CircuitOpenError(OSError):
+    """Raised instead of calling the API while a zone's circuit breaker is open.
+
+    Not a requests exception (defining one would import requests at startup), so API callers catch it alongside them.
+    """
+
+
+class RequestScheduler:
+    """Token bucket, retry with backoff and per-zone circuit breaker shared by every Cloudflare API call."""
+
+    def __init__(self, rate_limit, rate_period, max_retries, backoff_base, backoff_max, breaker_threshold, breaker_cooldown):
+        # A bucket of capacity C refilled at r tokens/s can spend C + r * period in any window, so the refill
+        # rate leaves room for the burst and the total never exceeds rate_limit per rate_period. That needs at
+        # least one token for the burst and one for the refill.
+        if rate_limit < 2:
+            raise ValueError(f"rate_limit must be at least 2, not {rate_limit}")
+        self.capacity = min(max(1, rate_limit // 10), rate_limit - 1)
+        self.refill_rate = (rate_limit - self.capacity) / rate_period
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0 # Set from Retry-After; every caller waits for it
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.zone_failures = {} # zone_id -> consecutive failed calls
+        # zone_id -> monotonic time the breaker half-opens. Once past it, calls go through again: the first success
+        # closes the breaker (and drops the entry), a failure opens it again straight away.
+        self.zone_open_until = {}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+                self.last_refill = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_breaker(self, zone_id):
+        with self.lock:
+            open_until = self.zone_open_until.get(zone_id, 0)
+        if time.monotonic() < open_until:
+            raise CircuitOpenError(f"Circuit breaker open for zone {zone_id} after repeated failures; retrying in {open_until - time.monotonic():.0f}s")
+
+    def _record_result(self, zone_id, success):
+        if zone_id is None:
+            return
+        with self.lock:
+            if success:
+                self.zone_failures.pop(zone_id, None)
+                if self.zone_open_until.pop(zone_id, None) is not None:
+                    logging.info(f"Circuit breaker closed for zone {zone_id}.")
+                return
+            failures = self.zone_failures.get(zone_id, 0) + 1
+            self.zone_failures[zone_id] = failures
+            if failures >= self.breaker_threshold or zone_id in self.zone_open_until:
+                self.zone_open_until[zone_id] = time.monotonic() + self.breaker_cooldown
+                self.zone_failures.pop(zone_id, None)
+                logging.error(f"Circuit breaker opened for zone {zone_id} for {self.breaker_cooldown}s after {failures} consecutive failures.")
+
+    def call(self, zone_id, send):
+        """Send a request via send() under the rate limit, retrying 429s, 5xx responses and timeouts.
+
+        Returns the final response (which may still be an error status) or raises the last RequestException.
+        """
+        for attempt in range(self.max_retries + 1):
+            if zone_id is not None:
+                self._check_breaker(zone_id)
+            self.acquire()
+            last_attempt = attempt == self.max_retries
+            try:
+                response = send()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if last_attempt:
+                    self._record_result(zone_id, False)
+                    raise
+                delay = self.backoff(attempt)
+                logging.warning(f"Cloudflare API request failed ({e}). Retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 429:
+                # Rate limits are per token, not per zone, so this pauses every caller and never trips the breaker.
+                try:
+                    delay = float(response.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    delay = self.backoff(attempt)
+                with self.lock:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                if last_attempt:
+                    return response
+                logging.warning(f"Cloudflare API rate limit hit. Pausing requests for {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+                continue
+            if response.status_code >= 500:
+                if last_attempt:
+                    self._record_result(zone_id, False)
+                    return response
+                delay = self.backoff(attempt)
+                logging.warning(f"Cloudflare API returned HTTP {response.status_code}. Retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+                continue
+
+            self._record_result(zone_id, True)
+            return response
+
+
+class CloudflareClient:
+    """Shared keep-alive HTTP session for Cloudflare API and public IP lookups."""
+
+    def __init__(self, api_token, pool_size, scheduler, base_url=CLOUDFLARE_API_BASE_URL):
+        self.base_url = base_url
+        self.scheduler = scheduler
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Auth headers are built once and only sent to the Cloudflare API, never to IP lookup services.
+        self.api_headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        }
+
+    @property
+    def session(self):
+        """The requests session, created on first use so startup never imports requests."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # One pool per host, sized so every worker thread can hold its own kept-alive connection.
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def get(self, url, timeout=10):
+        """GET an arbitrary URL (e.g. an IP lookup service) without Cloudflare credentials."""
+        return self.session.get(url, timeout=timeout)
+
+    def api_request(self, method, path, timeout=10, **kwargs):
+        """Send a Cloudflare API request through the scheduler. Paths under /zones/<id>/ share that zone's breaker."""
+        parts = path.split("/")
+        zone_id = parts[2] if len(parts) > 2 and parts[1] == "zones" else None
+        url = f"{self.base_url}{path}"
+        # Record and zone IDs are replaced so the endpoint label stays low-cardinality.
+        if zone_id is not None:
+            parts[2] = ":zone_id"
+        if len(parts) > 4 and parts[3] == "dns_records" and parts[4] != "batch":
+            parts[4] = ":record_id"
+        endpoint = "/".join(parts)
+
+        def send():
+            started = time.monotonic()
+            status = "error"
+            span_attributes = {"http.request.method": method, "http.route": endpoint}
+            try:
+                with trace_span(f"{method} {endpoint}", span_attributes, RunTrace.KIND_CLIENT) as span:
+                    response = self.session.request(method, url, headers=self.api_headers, timeout=timeout, **kwargs)
+                    status = response.status_code
+                    span["attributes"]["http.response.status_code"] = status
+                    if status >= 400:
+                        span["error"] = f"HTTP {status}"
+                return response
+            finally:
+                latency = time.monotonic() - started
+                API_REQUEST_SECONDS.observe(latency, method=method, endpoint=endpoint, status=status)
+                logging.debug(f"{method} {endpoint} -> {status} in {latency * 1000:.0f} ms",
+                              extra={"method": method, "endpoint": endpoint, "status": status, "latency_ms": round(latency * 1000, 1)})
+
+        return self.scheduler.call(zone_id, send)
+
+    def api_get(self, path, params=None, timeout=10):
+        """GET a Cloudflare API path such as '/zones/<id>/dns_records'."""
+        return self.api_request("GET", path, params=params, timeout=timeout)
+
+    def api_put(self, path, payload, timeout=10):
+        """PUT a JSON payload to a Cloudflare API path."""
+        return self.api_request("PUT", path, data=json.dumps(payload), timeout=timeout)
+
+    def api_patch(self, path, payload, timeout=10):
+        """PATCH a JSON payload to a Cloudflare API path. Fields left out of the payload are not changed."""
+        return self.api_request("PATCH", path, data=json.dumps(payload), timeout=timeout)
+
+    def api_post(self, path, payload, timeout=10):
+        """POST a JSON payload to a Cloudflare API path."""
+        return self.api_request("POST", path, data=json.dumps(payload), timeout=timeout)
+
+    def close(self):
+        """Close the pooled connections. A later request opens a new session."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class Account:
+    """A group of zones sharing one API token, request budget (scheduler) and worker pool size.
+
+    zones holds the configured zones plus, with discover_zones, the discovered ones (see apply_discovered_zones()).
+    """
+
+    def __init__(self, name, api_token, zones, max_workers, rate_limit, rate_period, discover_zones=False):
+        self.name = name
+        self.configured_zones = dict(zones)
+        self.zones = dict(zones)
+        self.discover_zones = discover_zones
+        self.max_workers = max_workers
+        self.client = CloudflareClient(
+            api_token,
+            max_workers,
+            RequestScheduler(
+                rate_limit, rate_period, API_MAX_RETRIES, API_BACKOFF_BASE, API_BACKOFF_MAX,
+                CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN
+            )
+        )
+
+
+accounts = [Account(**settings) for settings in ACCOUNT_SETTINGS]
+zone_clients = {zone_id: account.client for account in accounts for zone_id in account.zones.values()}
+http_client = accounts[0].client # Also used for public IP lookups, which never send credentials
+
+def api_client(zone_id):
+    """The CloudflareClient of the account that owns zone_id."""
+    return zone_clients.get(zone_id, http_client)
+
+
+def lookup_ip_text(provider):
+    """Provider that returns the address as the whole plain-text response body."""
+    response = http_client.get(provider["url"], timeout=IP_PROVIDER_TIMEOUT)
+    response.raise_for_status()
+    return response.text.strip()
+
+def lookup_ip_json(provider):
+    """Provider that returns a JSON object with the address under provider['key'] (default 'ip')."""
+    response = http_client.get(provider["url"], timeout=IP_PROVIDER_TIMEOUT)
+    response.raise_for_status()
+    return response.json()[provider.get("key", "ip")]
+
+def _skip_dns_name(packet, offset):
+    """Return the offset just past a (possibly compressed) domain name in a DNS packet."""
+    while True:
+        length = packet[offset]
+        if length & 0xC0 == 0xC0: # Compression pointer, always the end of the name
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+DNS_QUERY_TYPES = {"A": 1, "AAAA": 28, "TXT": 16}
+
+def lookup_ip_dns(provider):
+    """Provider that is a DNS server answering a query with the client's own address.
+
+    By default an 'A'/'AAAA' query (e.g. myip.opendns.com). With provider['record_type'] = 'TXT' the address is
+    the first string of the first TXT record (e.g. o-o.myaddr.l.google.com, asked of ns1.google.com).
+    """
+    ipv6 = provider.get("ip_version", 4) == 6
+    record_type = provider.get("record_type", "AAAA" if ipv6 else "A")
+    if record_type not in DNS_QUERY_TYPES:
+        raise ValueError(f"unsupported DNS record_type '{record_type}'")
+    query_type = DNS_QUERY_TYPES[record_type]
+    query_id = random.randint(0, 0xFFFF)
+    question = b"".join(bytes([len(label)]) + label.encode() for label in provider["query"].split(".")) + b"\0"
+    packet = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + struct.pack("!HH", query_type, 1)
+
+    server_family = socket.AF_INET6 if ipaddress.ip_address(provider["server"]).version == 6 else socket.AF_INET
+    with socket.socket(server_family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(IP_PROVIDER_TIMEOUT)
+        sock.sendto(packet, (provider["server"], provider.get("port", 53)))
+        response, _ = sock.recvfrom(512)
+
+    response_id, flags, _, answer_count, _, _ = struct.unpack("!HHHHHH", response[:12])
+    if response_id != query_id or flags & 0x000F:
+        raise ValueError(f"DNS query failed (id match: {response_id == query_id}, rcode: {flags & 0x000F})")
+    offset = 12 + len(question) + 4
+    for _ in range(answer_count):
+        offset = _skip_dns_name(response, offset)
+        answer_type, _, _, data_length = struct.unpack("!HHIH", response[offset:offset + 10])
+        offset += 10
+        data = response[offset:offset + data_length]
+        if answer_type == query_type == DNS_QUERY_TYPES["TXT"] and data:
+            return data[1:1 + data[0]].decode("ascii") # Checked to be an address by query_ip_provider()
+        if answer_type == query_type and data_length in (4, 16):
+            return socket.inet_ntop(socket.AF_INET6 if data_length == 16 else socket.AF_INET, data)
+        offset += data_length
+    raise ValueError(f"DNS response contained no {record_type} record")
+
+# Maps a provider 'type' to its lookup function. Register additional provider types here.
+IP_LOOKUP_TYPES = {
+    "text": lookup_ip_text,
+    "json": lookup_ip_json,
+    "dns": lookup_ip_dns,
+}
+
+# Per-provider moving averages of latency (seconds) and failure rate, used to try the best providers first.
+ip_provider_stats = {}
+ip_provider_stats_lock = threading.Lock()
+
+def _ip_provider_score(provider):
+    stats = ip_provider_stats.get(provider.get("name"))
+    if stats is None:
+        return 0.0 # Untried providers go first so they get measured
+    return stats["latency"] * (1 + 4 * stats["failure_rate"])
+
+def _record_ip_provider_result(name, latency, success):
+    with ip_provider_stats_lock:
+        stats = ip_provider_stats.get(name)
+        if stats is None:
+            ip_provider_stats[name] = {"latency": latency, "failure_rate": 0.0 if success else 1.0}
+        else:
+            stats["latency"] = 0.7 * stats["latency"] + 0.3 * latency
+            stats["failure_rate"] = 0.7 * stats["failure_rate"] + 0.3 * (0.0 if success else 1.0)
+
+def query_ip_provider(provider):
+    """Ask one provider for the public IP. Returns the address, or None if the lookup failed."""
+    name = provider.get("name", provider.get("url") or provider.get("server"))
+    started = time.monotonic()
+    try:
+        lookup = IP_LOOKUP_TYPES.get(provider.get("type"))
+        if lookup is None:
+            raise ValueError(f"unknown provider type '{provider.get('type')}'")
+        with trace_span("ip_provider", {"ddns.provider": name}):
+            address = ipaddress.ip_address(str(lookup(provider)).strip())
+        if address.version != provider.get("ip_version", 4):
+            raise ValueError(f"returned IPv{address.version} address {address}, expected IPv{provider.get('ip_version', 4)}")
+        ip = str(address)
+    except (requests.exceptions.RequestException, OSError, ValueError, KeyError, TypeError, struct.error, IndexError) as e:
+        # Failed lookups count with the full timeout as their latency so a dead provider sinks in the order.
+        _record_ip_provider_result(name, max(time.monotonic() - started, IP_PROVIDER_TIMEOUT), False)
+        IP_LOOKUP_SECONDS.observe(time.monotonic() - started, provider=name, result="failure")
+        logging.warning(f"IP provider '{name}' failed: {e}")
         return None
+    _record_ip_provider_result(name, time.monotonic() - started, True)
+    IP_LOOKUP_SECONDS.observe(time.monotonic() - started, provider=name, result="success")
+    return ip
 
-def get_dns_records(zone_id):
-    """Retrieve all Cloudflare 'A' DNS records for a given zone."""
-    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records?type=A"
-    headers = {
-        "Authorization": f"Bearer {CLOUDFLARE_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
+def get_public_ip(ip_version=4):
+    """Get current public IP address by racing the configured providers until IP_PROVIDER_QUORUM of them agree."""
+    providers = sorted((p for p in IP_PROVIDERS if p.get("ip_version", 4) == ip_version), key=_ip_provider_score)
+    results = queue.Queue()
+    next_provider = 0
+    in_flight = 0
+    votes = {}
+
+    while True:
+        # Keep IP_PROVIDER_FANOUT lookups running, starting the next-best provider whenever one finishes.
+        while in_flight < IP_PROVIDER_FANOUT and next_provider < len(providers):
+            provider = providers[next_provider]
+            # Daemon threads: lookups still running once the quorum is reached are abandoned, not waited for.
+            threading.Thread(target=lambda p=provider: results.put(query_ip_provider(p)), daemon=True).start()
+            next_provider += 1
+            in_flight += 1
+        if in_flight == 0:
+            break
+
+        ip = results.get()
+        in_flight -= 1
+        if ip:
+            votes[ip] = votes.get(ip, 0) + 1
+            if votes[ip] >= IP_PROVIDER_QUORUM:
+                return ip
+
+    logging.error(f"Error fetching public IPv{ip_version}: fewer than {IP_PROVIDER_QUORUM} providers agreed (answers: {votes or 'none'}).")
+    return None
+
+def get_public_ips():
+    """Look up the public IP for every configured record type concurrently.
+
+    Returns {record_type: ip}, e.g. {"A": "203.0.113.7", "AAAA": "2001:db8::7"}. Families whose lookup failed are left out.
+    """
+    with trace_span("ip_lookup"), ThreadPoolExecutor(max_workers=len(RECORD_TYPES)) as executor:
+        ips = dict(zip(RECORD_TYPES, executor.map(lambda record_type: get_public_ip(IP_VERSIONS[record_type]), RECORD_TYPES)))
+    return {record_type: ip for record_type, ip in ips.items() if ip}
+
+# Destinations used to ask the kernel which source address its default route would pick. Nothing is sent to them.
+LOCAL_ROUTE_PROBES = {4: (socket.AF_INET, "1.1.1.1"), 6: (socket.AF_INET6, "2606:4700:4700::1111")}
+
+def get_local_route_addresses():
+    """Local source address of the default route for each record type ({record_type: address or None})."""
+    addresses = {}
+    for record_type in RECORD_TYPES:
+        family, probe = LOCAL_ROUTE_PROBES[IP_VERSIONS[record_type]]
+        try:
+            # connect() on a UDP socket only selects a route and source address; no packet leaves the host.
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                sock.connect((probe, 53))
+                addresses[record_type] = sock.getsockname()[0]
+        except OSError:
+            addresses[record_type] = None
+    return addresses
+
+def local_precheck_unchanged(local_addresses, last_ips):
+    """True if the last lookup saw these same local addresses, resolved to last_ips, less than LOCAL_PRECHECK_MAX_AGE ago."""
+    if not last_ips or not any(local_addresses.values()):
+        return False
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("success"):
-            return data.get("result", [])
-        else:
+        with open(LOCAL_PRECHECK_FILE, "r") as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return (
+        cached.get("local") == local_addresses
+        and cached.get("public") == {record_type: last_ips.get(record_type) for record_type in RECORD_TYPES}
+        and 0 <= time.time() - cached.get("checked_at", 0) < LOCAL_PRECHECK_MAX_AGE
+    )
+
+def save_local_precheck(local_addresses, public_ips):
+    """Remember which public IPs the current local addresses resolved to."""
+    temp_path = f"{LOCAL_PRECHECK_FILE}.tmp"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump({
+                "local": local_addresses,
+                "public": {record_type: public_ips.get(record_type) for record_type in RECORD_TYPES},
+                "checked_at": time.time(),
+            }, file)
+        os.replace(temp_path, LOCAL_PRECHECK_FILE)
+    except OSError as e:
+        logging.warning(f"Could not save local pre-check state to {LOCAL_PRECHECK_FILE}: {e}")
+
+def format_ips(ips):
+    """Human-readable form of a {record_type: ip} dict for logs and notifications."""
+    return " / ".join(ips[record_type] for record_type in RECORD_TYPES if ips.get(record_type)) or "None"
+
+def format_record_types(record_types):
+    return "/".join(f"'{record_type}'" for record_type in record_types)
+
+class NameRules:
+    """A precompiled set of name rules: exact names, wildcards and 're:' regular expressions.
+
+    Exact names and '*.suffix' wildcards are set lookups (one per label of the name), so matching does not slow
+    down as rules are added. Any other wildcards and the regular expressions share one compiled pattern, except
+    expressions with groups or global inline flags ('(?x)'): joined with the others their backreferences would
+    point at the wrong group and their flags would not be at the start, so each keeps a pattern of its own.
+    Names are matched in lower case and the regular expressions ignore case, so 're:VPN-' matches vpn-1.example.com.
+    """
+
+    def __init__(self, rules):
+        self.exact = set()
+        self.suffixes = set() # '*.example.com' is stored as '.example.com'
+        self.separate = [] # Compiled 're:' rules that cannot share the combined pattern
+        patterns = []
+        for rule in rules:
+            if not isinstance(rule, str) or not rule:
+                raise ValueError(f"invalid rule {rule!r}")
+            if rule.startswith("re:"):
+                try:
+                    compiled = re.compile(rule[3:])
+                except re.error as e:
+                    raise ValueError(f"invalid regular expression in rule {rule!r}: {e}") from None
+                if compiled.groups or compiled.flags & ~re.UNICODE:
+                    self.separate.append(re.compile(rule[3:], re.IGNORECASE))
+                else:
+                    patterns.append(rule[3:])
+                continue
+            rule = rule.lower().rstrip(".")
+            if not any(c in rule for c in "*?["):
+                self.exact.add(rule)
+            elif rule.startswith("*.") and not any(c in rule[2:] for c in "*?["):
+                self.suffixes.add(rule[1:])
+            else:
+                patterns.append(fnmatch.translate(rule))
+        self.pattern = re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE) if patterns else None
+        self.empty = not (self.exact or self.suffixes or self.pattern or self.separate)
+
+    def matches(self, name):
+        name = name.lower()
+        if name in self.exact:
+            return True
+        if self.suffixes:
+            dot = name.find(".")
+            while dot != -1:
+                if name[dot:] in self.suffixes:
+                    return True
+                dot = name.find(".", dot + 1)
+        if self.pattern is not None and self.pattern.match(name) is not None:
+            return True
+        return any(pattern.match(name) is not None for pattern in self.separate)
+
+
+try:
+    RECORD_INCLUDE_RULES = NameRules(RECORD_INCLUDE)
+    RECORD_EXCLUDE_RULES = NameRules(RECORD_EXCLUDE)
+    ZONE_DISCOVERY_RULES = NameRules(ZONE_DISCOVERY_PATTERNS)
+    ZONE_DISCOVERY_EXCLUDE_RULES = NameRules(ZONE_DISCOVERY_EXCLUDE)
+except (ValueError, TypeError, re.error) as e:
+    print(f"CRITICAL: RECORD_INCLUDE, RECORD_EXCLUDE, ZONE_DISCOVERY_PATTERNS and ZONE_DISCOVERY_EXCLUDE must be lists of names, wildcards or 're:' expressions in config.py ({e}).")
+    exit(1)
+
+def record_selected(record_name):
+    """True if a record of this name is managed: matched by RECORD_INCLUDE (if set) and not by RECORD_EXCLUDE."""
+    return (RECORD_INCLUDE_RULES.empty or RECORD_INCLUDE_RULES.matches(record_name)) and not RECORD_EXCLUDE_RULES.matches(record_name)
+
+
+class DnsRecord:
+    """The fields of a Cloudflare DNS record this script uses, without the rest of the API's JSON.
+
+    Slotted, since a RecordIndex can hold every record of accounts with tens of thousands of them.
+    """
+
+    FIELDS = ("id", "type", "name", "content", "proxied", "ttl", "comment", "modified_on")
+    __slots__ = FIELDS
+
+    def __init__(self, id, type, name, content, proxied, ttl, comment, modified_on):
+        self.id = id
+        self.type = type
+        self.name = name
+        self.content = content
+        self.proxied = proxied
+        self.ttl = ttl
+        self.comment = comment
+        self.modified_on = modified_on
+
+    @classmethod
+    def from_api(cls, data):
+        """Build a record from one entry of the API's result list."""
+        content = data.get("content")
+        # The same few IPs repeat across a zone, so each distinct content string is kept once.
+        return cls(data.get("id"), data.get("type"), data.get("name"), content if content is None else sys.intern(content),
+                   data.get("proxied"), data.get("ttl"), data.get("comment"), data.get("modified_on"))
+
+    def __repr__(self):
+        return f"DnsRecord({', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)})"
+
+
+def iter_dns_records(zone_id, record_types=("A",), exclude=None, fetch_stats=None):
+    """Yield a zone's Cloudflare DNS records of the given types page by page, following result_info pagination.
+
+    A single type is filtered by the API; several types are listed in one combined pass and filtered here.
+    Records are yielded as DnsRecords. Records not selected by RECORD_INCLUDE/RECORD_EXCLUDE are dropped before
+    they are built, and records for which exclude(record) is true are skipped. If fetch_stats is a dict it is
+    filled with 'seen' (selected records listed), 'skipped' (records excluded) and 'error' (listing stopped early).
+    """
+    if fetch_stats is None:
+        fetch_stats = {}
+    fetch_stats.update(seen=0, skipped=0, error=False)
+    params = {"per_page": DNS_RECORDS_PER_PAGE}
+    if len(record_types) == 1:
+        params["type"] = record_types[0]
+    page = 1
+
+    while True:
+        try:
+            response = api_client(zone_id).api_get(
+                f"/zones/{zone_id}/dns_records",
+                params=dict(params, page=page),
+                timeout=10
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            logging.error(f"Request error fetching DNS records for zone {zone_id} (page {page}): {e}")
+            fetch_stats["error"] = True
+            return
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error fetching DNS records for zone {zone_id} (page {page}): {e}")
+            fetch_stats["error"] = True
+            return
+        if not data.get("success"):
             logging.error(f"Cloudflare API error fetching DNS records for zone {zone_id}: {data.get('errors')}")
-            return []
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Request error fetching DNS records for zone {zone_id}: {e}")
-        return []
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error fetching DNS records for zone {zone_id}: {e}")
-        return []
-
-def update_dns_record(zone_id, record_id, record_name, new_ip):
-    """Update a specific Cloudflare DNS 'A' record. Sets proxied to True."""
-    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
-    headers = {
-        "Authorization": f"Bearer {CLOUDFLARE_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "type": "A",
-        "name": record_name,
-        "content": new_ip,
-        "ttl": 1, # 1 for auto
-        "proxied": True # Set proxied status to True as per original script's behavior
-    }
-    
+            fetch_stats["error"] = True
+            return
+
+        records = data.get("result") or []
+        for data_record in records:
+            if data_record.get("type") not in record_types and len(record_types) > 1:
+                continue
+            if not record_selected(data_record.get("name") or ""):
+                continue
+            fetch_stats["seen"] += 1
+            record = DnsRecord.from_api(data_record)
+            if exclude is not None and exclude(record):
+                fetch_stats["skipped"] += 1
+                continue
+            yield record
+
+        total_pages = (data.get("result_info") or {}).get("total_pages")
+        if total_pages is None:
+            if len(records) < DNS_RECORDS_PER_PAGE:
+                return
+        elif page >= total_pages:
+            return
+        if not records:
+            return
+        page += 1
+
+def get_dns_records(zone_id, record_types=("A",)):
+    """Retrieve all selected Cloudflare DNS records of the given types ('A' by default) for a given zone, as DnsRecords."""
+    return list(iter_dns_records(zone_id, record_types))
+
+class RecordIndex:
+    """Process-resident zone_id -> record_id -> DnsRecord index.
+
+    Also tracks which zones have fully converged to which IP per record type, so a retried sync can skip them.
+    """
+
+    def __init__(self):
+        self._zones = {}
+        self._converged = {} # zone_id -> {record_type: ip}
+        self._incomplete = set() # Zones whose last listing failed part way
+        self.target_ips = {} # {record_type: ip} the most recent sync converged towards
+
+    def has_zone(self, zone_id):
+        return bool(self._zones.get(zone_id)) and zone_id not in self._incomplete
+
+    def replace_zone(self, zone_id, records):
+        """Replace everything known about a zone with a freshly fetched record list."""
+        self._zones[zone_id] = {record.id: record for record in records}
+        self._incomplete.discard(zone_id)
+
+    def mark_incomplete(self, zone_id):
+        """The zone's listing was cut short: keep its records for this sync, but list it again on the next one."""
+        self._incomplete.add(zone_id)
+
+    def records(self, zone_id, record_types):
+        """Return the indexed records (DnsRecords) of the given types."""
+        return [record for record in self._zones.get(zone_id, {}).values() if record.type in record_types]
+
+    def apply_changes(self, zone_id, record_id, changes):
+        """Write the fields ({field: value}) of a successful update back to the indexed record."""
+        record = self._zones[zone_id][record_id]
+        for field, value in changes.items():
+            setattr(record, field, value)
+        record.modified_on = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def is_converged(self, zone_id, record_type, ip):
+        return self._converged.get(zone_id, {}).get(record_type) == ip
+
+    def mark_converged(self, zone_id, record_type, ip):
+        self._converged.setdefault(zone_id, {})[record_type] = ip
+
+    def begin_sync(self, target_ips):
+        """Note the IPs a sync is about to write. Convergence to any other IP for those types no longer holds."""
+        self.target_ips = dict(self.target_ips, **target_ips)
+        for converged in self._converged.values():
+            for record_type, ip in target_ips.items():
+                if converged.get(record_type) != ip:
+                    converged.pop(record_type, None)
+
+    def finish_sync(self, full_reconcile=False):
+        """Called once a sync's results have been recorded."""
+
+
+class RecordStateStore(RecordIndex):
+    """RecordIndex persisted to STATE_FILE between runs. Writes go to a temp file that atomically replaces it."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.last_full_reconcile = 0.0
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (IOError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable state file {path}: {e}")
+            return
+        self.target_ips = data.get("target_ips", {})
+        self.last_full_reconcile = data.get("last_full_reconcile", 0.0)
+        for zone_id, zone in data.get("zones", {}).items():
+            records = zone.get("records", {})
+            if any(len(values) != len(DnsRecord.FIELDS) - 1 for values in records.values()):
+                continue # Saved in an older record format; the zone is listed again
+            # Records RECORD_INCLUDE/RECORD_EXCLUDE no longer select are dropped, as a fresh listing would.
+            self._zones[zone_id] = {
+                record_id: DnsRecord(record_id, *values) for record_id, values in records.items() if record_selected(values[1] or "")
+            }
+            if zone.get("converged"):
+                self._converged[zone_id] = zone["converged"]
+
+    def reconcile_due(self):
+        return time.time() - self.last_full_reconcile >= STATE_FULL_RECONCILE_INTERVAL
+
+    def save(self):
+        data = {
+            "target_ips": self.target_ips,
+            "last_full_reconcile": self.last_full_reconcile,
+            "zones": {
+                zone_id: {
+                    "records": {
+                        record_id: [getattr(record, field) for field in DnsRecord.FIELDS[1:]]
+                        for record_id, record in self._zones.get(zone_id, {}).items()
+                        if zone_id not in self._incomplete # A partial listing is not saved; the zone is listed again
+                    },
+                    "converged": self._converged.get(zone_id, {}),
+                }
+                for zone_id in set(self._zones) | set(self._converged)
+            },
+        }
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(data, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving record state to {self.path}: {e}")
+
+    def begin_sync(self, target_ips):
+        super().begin_sync(target_ips)
+        self.save() # Persisted before any write so a crash mid-run can never leave a zone marked converged
+
+    def finish_sync(self, full_reconcile=False):
+        if full_reconcile:
+            self.last_full_reconcile = time.time()
+        self.save()
+
+
+def list_accessible_zones(client):
+    """Return {zone name: zone ID} for every zone client's API token can read (all pages of GET /zones), or None on error."""
+    zones = {}
+    page = 1
+    while True:
+        try:
+            response = client.api_get("/zones", params={"per_page": ZONES_PER_PAGE, "page": page}, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            logging.error(f"Request error listing zones (page {page}): {e}")
+            return None
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error listing zones (page {page}): {e}")
+            return None
+        if not data.get("success"):
+            logging.error(f"Cloudflare API error listing zones: {data.get('errors')}")
+            return None
+
+        results = data.get("result") or []
+        for zone in results:
+            zones[zone.get("name")] = zone.get("id")
+        total_pages = (data.get("result_info") or {}).get("total_pages") or 1
+        if page >= total_pages or not results:
+            return zones
+        page += 1
+
+def zone_discovery_match(zone_name):
+    """True if a discovered zone matches ZONE_DISCOVERY_PATTERNS and none of ZONE_DISCOVERY_EXCLUDE."""
+    return ZONE_DISCOVERY_RULES.matches(zone_name) and not ZONE_DISCOVERY_EXCLUDE_RULES.matches(zone_name)
+
+
+class ZoneIndex:
+    """Discovered zones per account, cached in ZONE_DISCOVERY_CACHE_FILE so that most runs make no /zones call.
+
+    Zones that appear in a refresh stay 'pending' until a sync has brought them to the current IP, so a zone
+    added while the IP is unchanged is still updated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock() # Refreshes run on a background thread
+        self.accounts = {} # account name -> {"fetched_at": timestamp, "zones": {name: id}, "pending": [zone IDs]}
+        try:
+            with open(path, "r") as file:
+                self.accounts = json.load(file).get("accounts", {})
+        except FileNotFoundError:
+            pass
+        except (IOError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable zone cache {path}: {e}")
+
+    def has_account(self, account_name):
+        return account_name in self.accounts
+
+    def is_stale(self, account_name):
+        return time.time() - self.accounts.get(account_name, {}).get("fetched_at", 0) >= ZONE_DISCOVERY_TTL
+
+    def zones(self, account_name):
+        return dict(self.accounts.get(account_name, {}).get("zones", {}))
+
+    def pending(self, account_name):
+        return set(self.accounts.get(account_name, {}).get("pending", []))
+
+    def update(self, account_name, zones):
+        """Store a fresh listing. Zones not in the previous one become pending; zones that disappeared are dropped."""
+        with self.lock:
+            entry = self.accounts.get(account_name, {})
+            known = set(entry.get("zones", {}).values())
+            pending = (set(entry.get("pending", [])) | (set(zones.values()) - known)) & set(zones.values())
+            self.accounts[account_name] = {"fetched_at": time.time(), "zones": zones, "pending": sorted(pending)}
+            self.save()
+
+    def clear_pending(self, zone_ids):
+        with self.lock:
+            for entry in self.accounts.values():
+                entry["pending"] = [zone_id for zone_id in entry.get("pending", []) if zone_id not in zone_ids]
+            self.save()
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump({"accounts": self.accounts}, file, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error(f"Error saving zone cache to {self.path}: {e}")
+
+
+zone_index = None # ZoneIndex, created by start_zone_discovery() if any account discovers zones
+zone_discovery_future = None # Future of the running background refresh, if any
+
+def refresh_discovered_zones(discover_accounts):
+    """List the zones of each account in discover_accounts and store the ones matching the patterns in zone_index."""
+    for account in discover_accounts:
+        with trace_span("zone_discovery", {"ddns.account": account.name}):
+            zones = list_accessible_zones(account.client)
+        if zones is None:
+            continue # The cached zones are kept and the refresh is retried later
+        for zone_name, zone_id in account.configured_zones.items():
+            if zone_id not in zones.values():
+                logging.warning(f"Configured zone '{zone_name}' (ID: {zone_id}) is not accessible with the API token of account '{account.name}'.")
+        matched = {zone_name: zone_id for zone_name, zone_id in zones.items() if zone_discovery_match(zone_name)}
+        zone_index.update(account.name, matched)
+        logging.info(f"Zone discovery for account '{account.name}': {len(matched)} of {len(zones)} accessible zone(s) match.")
+
+def _run_zone_refresh(future, discover_accounts):
     try:
-        response = requests.put(url, headers=headers, data=json.dumps(payload), timeout=10)
+        refresh_discovered_zones(discover_accounts)
+    except Exception as e: # Never leave the future unset; the cached zones stay in use
+        logging.error(f"Zone discovery refresh failed: {e}")
+    future.set_result(None)
+
+def apply_discovered_zones():
+    """Rebuild every account's zones from its configured zones plus its cached discovered ones.
+
+    Configured zones always win, and a zone ID already used by another account is not added again.
+    Only call this between syncs, never while one is running.
+    """
+    if zone_index is None:
+        return
+    claimed = {zone_id for account in accounts for zone_id in account.configured_zones.values()}
+    for account in accounts:
+        zones = dict(account.configured_zones)
+        if account.discover_zones:
+            for zone_name, zone_id in sorted(zone_index.zones(account.name).items()):
+                if zone_name not in zones and zone_id not in claimed:
+                    zones[zone_name] = zone_id
+                    claimed.add(zone_id)
+        account.zones = zones
+    zone_clients.clear()
+    zone_clients.update({zone_id: account.client for account in accounts for zone_id in account.zones.values()})
+
+def start_zone_discovery():
+    """Load the discovered zones into the accounts, refreshing the cache in the background if it is stale.
+
+    Accounts that have never been discovered are listed right away, since there is nothing cached to use yet.
+    """
+    global zone_index, zone_discovery_future
+    discover_accounts = [account for account in accounts if account.discover_zones]
+    if not discover_accounts:
+        return
+    if zone_index is None:
+        zone_index = ZoneIndex(ZONE_DISCOVERY_CACHE_FILE)
+    unknown = [account for account in discover_accounts if not zone_index.has_account(account.name)]
+    if unknown:
+        refresh_discovered_zones(unknown)
+    stale = [account for account in discover_accounts if account not in unknown and zone_index.is_stale(account.name)]
+    if stale and (zone_discovery_future is None or zone_discovery_future.done()):
+        zone_discovery_future = Future()
+        threading.Thread(target=_run_zone_refresh, args=(zone_discovery_future, stale), name="zone-discovery", daemon=True).start()
+    apply_discovered_zones()
+
+def wait_for_zone_discovery():
+    """Wait for a running background refresh and load its result into the accounts."""
+    if zone_discovery_future is not None:
+        zone_discovery_future.result()
+    apply_discovered_zones()
+
+def desired_record_state(record_name, new_ip):
+    """The fields a record should have: its family's new IP plus RECORD_DEFAULTS and its RECORD_OVERRIDES entry."""
+    desired = {"content": new_ip, **RECORD_DEFAULTS, **RECORD_OVERRIDES.get(record_name.lower(), {})}
+    return {field: value for field, value in desired.items() if value is not None}
+
+def plan_record_changes(record, target_ips):
+    """Return {field: value} for the fields of record (a DnsRecord) that differ from its desired state.
+
+    Records of a type not in target_ips ({record_type: ip}) are not managed and never have changes.
+    """
+    new_ip = target_ips.get(record.type)
+    if new_ip is None:
+        return {}
+    desired = desired_record_state(record.name, new_ip)
+    return {field: value for field, value in desired.items() if getattr(record, field) != value}
+
+def format_changes(changes, record=None):
+    """Human-readable form of planned changes, e.g. "content 192.0.2.1 -> 203.0.113.7, proxied True -> False"."""
+    if record is None:
+        return ", ".join(f"{field}={value}" for field, value in changes.items())
+    return ", ".join(f"{field} {getattr(record, field)} -> {value}" for field, value in changes.items())
+
+def update_dns_record(zone_id, record_id, record_name, changes, record_type="A"):
+    """PATCH a specific Cloudflare DNS 'A' or 'AAAA' record, sending only the changed fields ({field: value})."""
+    try:
+        with trace_span("update_record", {"ddns.record": record_name, "ddns.record_type": record_type}):
+            response = api_client(zone_id).api_patch(f"/zones/{zone_id}/dns_records/{record_id}", changes, timeout=10)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        # Only the outcome is kept: the updated record in "result" would otherwise stay referenced until the sync ends.
+        return {"success": data.get("success"), "errors": data.get("errors")}
     except requests.exceptions.HTTPError as e:
         error_details = "Unknown error"
         try:
@@ -140,30 +1619,178 @@ def update_dns_record(zone_id, record_id, record_name, new_ip):
             error_details = e.response.text
         logging.error(f"HTTP error updating DNS record {record_name} ({record_id}): {e.response.status_code} - {error_details}")
         return {"success": False, "errors": [{"message": f"HTTP {e.response.status_code}: {error_details}"}]}
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
         logging.error(f"Request error updating DNS record {record_name} ({record_id}): {e}")
         return {"success": False, "errors": [{"message": str(e)}]}
 
-def save_current_ip(ip):
-    """Save current IP to file."""
+# Zones whose batch endpoint answered 404/405/501; they use per-record updates for the rest of the process.
+batch_unsupported_zones = set()
+
+def update_dns_records_batch(zone_id, records):
+    """Update several 'A'/'AAAA' records in one zone with a single /dns_records/batch request.
+
+    records is a list of (record_id, record_name, record_type, changes) tuples. Returns {record_id: response} where each response has
+    the same shape as update_dns_record()'s. A batch is applied all-or-nothing by Cloudflare, so if it fails
+    (or the endpoint is unavailable) the records are retried one by one to get per-record results.
+    """
+    if zone_id not in batch_unsupported_zones:
+        payload = {"patches": [dict(changes, id=record_id) for record_id, _, _, changes in records]}
+        error_details = None
+        try:
+            response = api_client(zone_id).api_post(f"/zones/{zone_id}/dns_records/batch", payload, timeout=30)
+            if response.status_code in (404, 405, 501):
+                batch_unsupported_zones.add(zone_id)
+                error_details = f"batch endpoint unavailable (HTTP {response.status_code})"
+            else:
+                response.raise_for_status()
+                data = response.json()
+                if data.get("success"):
+                    return {record_id: {"success": True} for record_id, *_ in records}
+                error_details = data.get("errors")
+        except requests.exceptions.HTTPError as e:
+            try:
+                error_details = f"HTTP {e.response.status_code}: {e.response.json().get('errors')}"
+            except json.JSONDecodeError:
+                error_details = f"HTTP {e.response.status_code}: {e.response.text}"
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            error_details = str(e)
+        except json.JSONDecodeError as e:
+            error_details = f"JSON decode error: {e}"
+        logging.warning(f"Batch update of {len(records)} record(s) in zone {zone_id} failed ({error_details}). Retrying records individually.")
+
+    return {
+        record_id: update_dns_record(zone_id, record_id, record_name, changes, record_type)
+        for record_id, record_name, record_type, changes in records
+    }
+
+def submit_batch_update(executor, zone_id, records):
+    """Submit one batch update and return a (record_id, record_name, record_type, changes, future) tuple per record in it."""
+    batch_future = executor.submit(run_in_span, "update_batch", {"ddns.zone_id": zone_id, "ddns.records": len(records)},
+                                   update_dns_records_batch, zone_id, records)
+    record_futures = [(*record, Future()) for record in records]
+
+    def resolve(done_future):
+        # Fan the batch's {record_id: response} result out to the per-record futures main() collects.
+        if done_future.exception() is not None:
+            for *_, future in record_futures:
+                future.set_exception(done_future.exception())
+            return
+        responses = done_future.result()
+        for record_id, *_, future in record_futures:
+            future.set_result(responses.get(record_id))
+
+    batch_future.add_done_callback(resolve)
+    return record_futures
+
+def queue_zone_updates(zone_name, zone_id, target_ips, executor, record_index=None, refresh_index=True):
+    """List a zone's records and submit an update to executor for every record that differs from its desired state.
+
+    target_ips maps the record types to converge to their new IP, e.g. {"A": "203.0.113.7"}; records of other
+    types are left alone. Each update only sends the fields plan_record_changes() found to differ. Records are consumed as their pages arrive, so updates start before the listing
+    finishes. With a RecordIndex, the zone is served from memory unless refresh_index is set or the zone is
+    not indexed yet; a refresh always indexes every configured record type.
+    Returns (records_seen, record_futures, fetch_ok) where record_futures holds (record_id, record_name, record_type,
+    changes, future) tuples and fetch_ok is False if listing the zone failed part way.
+    """
+    if record_index is not None and not refresh_index:
+        # Families this zone already fully converged to (e.g. before a partial failure) need no API call at all.
+        target_ips = {
+            record_type: ip for record_type, ip in target_ips.items()
+            if not record_index.is_converged(zone_id, record_type, ip)
+        }
+        if not target_ips:
+            logging.info(f"Zone '{zone_name}' already converged to {format_ips(record_index.target_ips)}. Skipping.")
+            return max(1, len(record_index.records(zone_id, RECORD_TYPES))), [], True
+
+    logging.info(f"Processing zone: {zone_name} (ID: {zone_id})")
+    record_types = [record_type for record_type in RECORD_TYPES if record_type in target_ips]
+    fetch_stats = {}
+    if record_index is None:
+        records = iter_dns_records(
+            zone_id, record_types, exclude=lambda record: not plan_record_changes(record, target_ips), fetch_stats=fetch_stats
+        )
+    else:
+        if refresh_index or not record_index.has_zone(zone_id):
+            record_index.replace_zone(zone_id, iter_dns_records(zone_id, RECORD_TYPES, fetch_stats=fetch_stats))
+            if fetch_stats["error"]:
+                record_index.mark_incomplete(zone_id)
+        records = record_index.records(zone_id, record_types)
+
+    records_seen = 0
+    records_up_to_date = 0
+    record_futures = []
+    pending_batch = []
+    for record in records:
+        records_seen += 1
+        record_id = record.id
+        record_name = record.name
+        record_type = record.type or record_types[0]
+        record_content_ip = record.content
+        new_ip = target_ips.get(record_type)
+
+        if not all([record_id, record_name, record_content_ip, new_ip]):
+            logging.warning(f"Skipping malformed record in zone {zone_name}: {record}")
+            continue
+
+        changes = plan_record_changes(record, target_ips)
+        if not changes:
+            records_up_to_date += 1
+            continue
+
+        logging.debug(f"Updating {record_type} record '{record_name}' (ID: {record_id}) in zone '{zone_name}': {format_changes(changes, record)}",
+                      extra={"zone": zone_name, "record": record_name, "record_type": record_type})
+        if ENABLE_BATCH_UPDATES:
+            pending_batch.append((record_id, record_name, record_type, changes))
+            if len(pending_batch) >= DNS_BATCH_SIZE:
+                record_futures.extend(submit_batch_update(executor, zone_id, pending_batch))
+                pending_batch = []
+        else:
+            future = executor.submit(update_dns_record, zone_id, record_id, record_name, changes, record_type)
+            record_futures.append((record_id, record_name, record_type, changes, future))
+    if pending_batch:
+        record_futures.extend(submit_batch_update(executor, zone_id, pending_batch))
+
+    if record_index is None:
+        # Records already in their desired state were filtered out while streaming.
+        records_seen = fetch_stats["seen"]
+        records_up_to_date += fetch_stats["skipped"]
+    if records_up_to_date:
+        logging.debug(f"{records_up_to_date} record(s) in zone '{zone_name}' already up-to-date with {format_ips(target_ips)}. No update needed.")
+    return records_seen, record_futures, not fetch_stats.get("error")
+
+def save_current_ips(ips):
+    """Save the current IP of each record type ({record_type: ip}) to file as JSON."""
     try:
         with open(IP_FILE, "w") as file:
-            file.write(ip)
-        logging.info(f"Successfully saved current IP ({ip}) to {IP_FILE}")
+            json.dump(ips, file)
+        logging.info(f"Successfully saved current IP ({format_ips(ips)}) to {IP_FILE}")
     except IOError as e:
         logging.error(f"Error saving current IP to {IP_FILE}: {e}")
 
-def load_last_ip():
-    """Load the last saved IP from file."""
+def load_last_ips():
+    """Load the last saved IP of each record type from file. Returns {record_type: ip}, empty if unknown."""
     try:
         with open(IP_FILE, "r") as file:
-            return file.read().strip()
+            content = file.read().strip()
     except FileNotFoundError:
         logging.info(f"IP file ({IP_FILE}) not found. Will assume IP needs update.")
-        return None
+        return {}
     except IOError as e:
         logging.error(f"Error loading last IP from {IP_FILE}: {e}")
-        return None
+        return {}
+
+    try:
+        ips = json.loads(content)
+        if isinstance(ips, dict):
+            return ips
+    except json.JSONDecodeError:
+        pass
+    # Files written before dual-stack support hold a single bare address.
+    try:
+        return {"AAAA" if ipaddress.ip_address(content).version == 6 else "A": content}
+    except ValueError:
+        logging.error(f"Unrecognised content in IP file {IP_FILE}. Will assume IP needs update.")
+        return {}
 
 def check_apache_status():
     """Check Apache2 status."""
@@ -174,158 +1801,464 @@ def check_apache_status():
         logging.warning(f"Could not check Apache status: {e}")
         return "Unknown"
 
+APT_STATE_PATHS = ("/var/lib/apt/lists", "/var/lib/dpkg/status") # Change on 'apt update' and on (un)install
+
+def _apt_state_key():
+    """mtimes of apt's package lists and dpkg's status file; the upgradable list can only change when these do."""
+    key = []
+    for path in APT_STATE_PATHS:
+        try:
+            key.append(os.stat(path).st_mtime)
+        except OSError:
+            key.append(None)
+    return key
+
+def count_upgradable_packages():
+    """Number of upgradable packages according to 'apt list --upgradable', or None if apt failed."""
+    # LC_ALL=C keeps the "[upgradable from: ...]" marker in English regardless of the system locale.
+    result = subprocess.run(["apt", "list", "--upgradable"], capture_output=True, text=True, check=False,
+                            env=dict(os.environ, LC_ALL="C"))
+    if result.returncode != 0:
+        logging.warning(f"'apt list --upgradable' exited with {result.returncode}: {result.stderr.strip()}")
+        return None
+    # Output is a "Listing..." header followed by one "name/suite version arch [upgradable from: old]" line per package.
+    return sum(1 for line in result.stdout.splitlines() if "[upgradable from:" in line)
+
 def check_system_updates():
-    """Check for pending system updates."""
+    """Check for pending system updates. Cached in SYSTEM_UPDATE_CACHE_FILE, since apt can take several seconds."""
+    key = _apt_state_key()
+    try:
+        with open(SYSTEM_UPDATE_CACHE_FILE, "r") as file:
+            cached = json.load(file)
+        if cached.get("key") == key and time.time() - cached.get("checked_at", 0) < SYSTEM_UPDATE_CACHE_TTL:
+            logging.debug(f"Using cached system update status ({cached['status']}).")
+            return cached["status"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass # No usable cache; ask apt
+
     try:
-        result = subprocess.run(["apt", "list", "--upgradable"], capture_output=True, text=True, check=False)
-        # A more reliable check might be to count lines after the header "Listing... Done"
-        if "upgradable" in result.stdout and len(result.stdout.splitlines()) > 1:
-             return "Updates Available"
-        return "Up-to-date"
+        count = count_upgradable_packages()
     except Exception as e:
         logging.warning(f"Could not check system updates: {e}")
         return "Unknown"
+    if count is None:
+        return "Unknown"
+    status = f"Updates Available ({count})" if count else "Up-to-date"
+
+    temp_path = f"{SYSTEM_UPDATE_CACHE_FILE}.tmp"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump({"key": key, "checked_at": time.time(), "status": status}, file)
+        os.replace(temp_path, SYSTEM_UPDATE_CACHE_FILE)
+    except OSError as e:
+        logging.warning(f"Could not cache system update status in {SYSTEM_UPDATE_CACHE_FILE}: {e}")
+    return status
+
+def _run_system_check(future, check):
+    try:
+        with trace_span("system_check", {"ddns.check": check.__name__}):
+            result = check()
+        future.set_result(result)
+    except Exception as e: # Never leave the future unset; the report would wait on it forever
+        logging.warning(f"System check {check.__name__} failed: {e}")
+        future.set_result("Unknown")
+
+def start_system_checks():
+    """Start the enabled system checks on background threads so they overlap with the Cloudflare work.
+
+    Returns {report key: Future}, e.g. {"apache_status": Future, "update_status": Future}.
+    """
+    checks = {}
+    if ENABLE_DISCORD_NOTIFICATIONS:
+        if ENABLE_APACHE_STATUS_CHECK:
+            checks["apache_status"] = check_apache_status
+        if ENABLE_SYSTEM_UPDATE_CHECK:
+            checks["update_status"] = check_system_updates
+    futures = {}
+    for key, check in checks.items():
+        future = Future()
+        # Daemon threads: a run that turns out to have nothing to report exits without waiting on apt.
+        threading.Thread(target=_run_system_check, args=(future, check), name=key, daemon=True).start()
+        futures[key] = future
+    return futures
+
+def load_module_from_path(module_path):
+    """Import a Python file by path, e.g. the example discord_notifier.py, without it being on sys.path."""
+    module_name = os.path.splitext(os.path.basename(module_path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    if spec is None:
+        raise ImportError(f"Cannot load a Python module from {module_path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Notifier:
+    """Notification backend interface.
+
+    notify() receives a report dict with the keys 'ip', 'apache_status', 'update_status', 'system_time'
+    and 'domain_status' and returns True if the notification was delivered.
+    """
+
+    def notify(self, report):
+        raise NotImplementedError
+
+    def close(self):
+        """Called once before exit so backends that buffer notifications can deliver them."""
+
+
+class ScriptNotifier(Notifier):
+    """Compatibility backend that runs DISCORD_SCRIPT_PATH with php or python3 as a subprocess."""
+
+    def __init__(self, language, script_path, webhook_url=None):
+        self.language = language
+        self.script_path = script_path
+        self.webhook_url = webhook_url # Passed to the Python script with --webhook-url
+
+    def notify(self, report):
+        args = [report["ip"], report["apache_status"], report["update_status"], report["system_time"], report["domain_status"]]
+        if self.language == 'php':
+            command, label = ['php', self.script_path] + args, "PHP"
+        elif self.language == 'py':
+            command, label = ['python3', self.script_path] + args + ['--webhook-url', self.webhook_url], "Python"
+        else:
+            logging.error(f"Invalid DISCORD_SCRIPT_LANGAUGE: {self.language}. Must be 'php' or 'py'.")
+            return False
+
+        try:
+            process = subprocess.run(command, capture_output=True, text=True, check=True, timeout=30) # Added timeout and check
+            logging.info(f"{label} script executed successfully. Output: {process.stdout.strip()}")
+            return True
+        except subprocess.CalledProcessError as e:
+            logging.error(f"{label} script execution failed. Return code: {e.returncode}")
+            logging.error(f"{label} script stdout: {e.stdout.strip()}")
+            logging.error(f"{label} script stderr: {e.stderr.strip()}")
+        except subprocess.TimeoutExpired:
+            logging.error(f"{label} script timed out after 30 seconds.")
+        except FileNotFoundError:
+            logging.error(f"{label} script or interpreter not found for {self.script_path}. Please check the path.")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred while running {label} script: {e}")
+        return False
+
+
+class DiscordWebhookNotifier(Notifier):
+    """Posts the report with DiscordNotifier from discord_notifier.py, loaded into this process.
+
+    Reports go through a DiscordNotificationQueue, which coalesces reports raised within
+    DISCORD_COALESCE_WINDOW seconds, honours Discord's rate limits and keeps undelivered
+    messages in DISCORD_SPOOL_FILE until they can be sent.
+    """
+
+    def __init__(self, module_path, webhook_url):
+        module = load_module_from_path(module_path)
+        self.notifier_class = module.DiscordNotifier
+        self.webhook_url = webhook_url
+        self.queue = module.DiscordNotificationQueue(webhook_url, window=DISCORD_COALESCE_WINDOW, spool_path=DISCORD_SPOOL_FILE)
+
+    def notify(self, report):
+        # Same layout as send_ip_change_notification.py
+        notifier = self.notifier_class(webhook_url=self.webhook_url)
+        notifier.set_color("#a80000")
+        notifier.set_title("URGENT: System IP Address Change Detected ")
+        notifier.set_content("**Alert!** The server's public IP address has changed.")
+        notifier.add_field(name="New Public IP", value=report["ip"], inline=True)
+        notifier.add_field(name="System Time", value=report["system_time"], inline=True)
+        notifier.add_field(name="Apache2 Status", value=report["apache_status"], inline=False)
+        notifier.add_field(name="System Updates", value=report["update_status"], inline=False)
+        notifier.add_field(name="DNS Update Status", value=report["domain_status"], inline=False, code_block=True)
+        self.queue.put(notifier)
+        return True # Delivery (and retrying it) is up to the queue
+
+    def close(self):
+        if not self.queue.close():
+            logging.error("Some Discord notifications could not be delivered. They will be retried on the next run.")
+
+
+def load_notifier():
+    """Build the notifier selected by NOTIFICATION_BACKEND."""
+    if NOTIFICATION_BACKEND == 'script':
+        return ScriptNotifier(DISCORD_SCRIPT_LANGAUGE, DISCORD_SCRIPT_PATH, DISCORD_WEBHOOK_URL)
+    if NOTIFICATION_BACKEND == 'discord':
+        return DiscordWebhookNotifier(DISCORD_NOTIFIER_PATH, DISCORD_WEBHOOK_URL)
+    module_path, _, class_name = NOTIFICATION_BACKEND.rpartition(':')
+    return getattr(load_module_from_path(module_path), class_name)(config)
+
+
+class NotificationDispatcher:
+    """Delivers notifications on a background thread so DNS updates and the IP save never wait on them."""
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def submit(self, report):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="notifications")
+            self.thread.start()
+        self.queue.put((report, time.monotonic()))
+
+    def _run(self):
+        backend = type(self.notifier).__name__
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.notifier.close()
+                return
+            report, submitted = item
+            logging.info(f"Sending notification via {backend}...")
+            try:
+                with trace_span("notification", {"ddns.backend": backend}):
+                    delivered = self.notifier.notify(report)
+            except Exception as e:
+                logging.error(f"An unexpected error occurred while sending notification: {e}")
+                delivered = False
+            NOTIFICATION_SECONDS.observe(time.monotonic() - submitted, backend=backend, result="success" if delivered else "failure")
+            if not delivered:
+                logging.error("Notification could not be delivered.")
+
+    def close(self, timeout=60):
+        """Wait (up to timeout seconds) for queued notifications to be sent, then stop the worker thread."""
+        if self.thread is None:
+            self.notifier.close() # Nothing was submitted, but the backend may still hold messages from an earlier run
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+
+notification_dispatcher = None
+
+def get_notification_dispatcher():
+    """Lazily load the configured notifier. Returns None if notifications are disabled or it cannot be loaded."""
+    global notification_dispatcher
+    if notification_dispatcher is None and ENABLE_DISCORD_NOTIFICATIONS:
+        try:
+            notification_dispatcher = NotificationDispatcher(load_notifier())
+        except (ImportError, AttributeError, OSError, SyntaxError, ValueError) as e:
+            logging.error(f"Could not load notification backend '{NOTIFICATION_BACKEND}': {e}")
+    return notification_dispatcher
+
+def retry_undelivered_notifications():
+    """Load the notifier now if an earlier run left messages in DISCORD_SPOOL_FILE.
+
+    The Discord queue starts sending them as soon as it is built, so they are retried even by runs that have
+    nothing new to report, as long as the dispatcher is closed before exit.
+    """
+    if NOTIFICATION_BACKEND == 'discord' and os.path.exists(DISCORD_SPOOL_FILE):
+        get_notification_dispatcher()
 
 def main():
-    """Main function to check and update DDNS for all 'A' records in configured zones."""
+    """Main function to check and update DDNS for all 'A'/'AAAA' records in configured zones."""
     setup_logging() # Initialize logging
     
+    try:
+        run_update()
+    finally:
+        # The notification thread is not a daemon thread: without this an exception would leave the process hanging.
+        # On the normal path the IP is already saved; this just lets queued notifications finish.
+        if notification_dispatcher is not None:
+            notification_dispatcher.close()
+
+def run_update():
+    """One check of the public IP, syncing the zones if it changed. Called by main()."""
     logging.info("Starting DDNS update process...")
-    current_ip = get_public_ip()
-    if not current_ip:
+    LAST_RUN_TIMESTAMP.set(time.time())
+    last_ips = load_last_ips()
+    retry_undelivered_notifications()
+    local_addresses = None
+    if ENABLE_LOCAL_PRECHECK:
+        # Fast path: nothing on this host changed, so skip the HTTP lookup (and never import requests).
+        local_addresses = get_local_route_addresses()
+        if local_precheck_unchanged(local_addresses, last_ips):
+            logging.info(f"Local address unchanged ({format_ips(local_addresses)}). Assuming IP unchanged ({format_ips(last_ips)}). No update needed.")
+            return
+
+    start_zone_discovery() # Uses the cached zones; a stale cache is refreshed alongside the run
+    detection_started = time.monotonic()
+    current_ips = get_public_ips()
+    if not current_ips:
         logging.error("Could not fetch public IP. Exiting.")
         # Optionally send a notification about failing to get public IP
         return
+    if local_addresses is not None:
+        save_local_precheck(local_addresses, current_ips)
 
-    last_ip = load_last_ip()
-    if current_ip == last_ip:
-        logging.info(f"IP unchanged ({current_ip}). No update needed.")
+    state_store = RecordStateStore(STATE_FILE) if ENABLE_STATE_CACHE else None
+    full_reconcile = state_store is not None and state_store.reconcile_due()
+    # Only the address families that changed are synced, so a v6 prefix rotation never sweeps the 'A' records.
+    changed_ips = {record_type: ip for record_type, ip in current_ips.items() if ip != last_ips.get(record_type)}
+    if not changed_ips and not full_reconcile:
+        logging.info(f"IP unchanged ({format_ips(current_ips)}). No update needed.")
         # If you want to send a notification even when IP is unchanged, add it here.
+        sync_discovered_zones(current_ips, state_store) # Starts the system checks only if a new zone needs syncing
         return
 
-    logging.info(f"Public IP changed from '{last_ip}' to '{current_ip}'. Starting DNS updates.")
+    system_checks = start_system_checks() # Only now that a sync will run; they overlap with the DNS updates
+    for record_type, ip in changed_ips.items():
+        logging.info(f"Public IP for {record_type} records changed from '{last_ips.get(record_type)}' to '{ip}'. Starting DNS updates.")
+        IP_CHANGES.inc(type=record_type)
+    if full_reconcile:
+        logging.info(f"Full reconciliation due. Re-listing every zone against {format_ips(current_ips)}.")
+    target_ips = current_ips if full_reconcile else changed_ips
+    # Cached records are only trusted when re-trying the same IP change; a new change re-lists every zone.
+    refresh_index = state_store is None or full_reconcile or any(
+        state_store.target_ips.get(record_type) != ip for record_type, ip in target_ips.items()
+    )
+    converged_zones = {}
+    record_convergence(sync_dns_records(target_ips, last_ips, state_store, refresh_index, system_checks,
+                                        converged_zones=converged_zones), detection_started)
+    sync_discovered_zones(current_ips, state_store, system_checks, converged_zones=converged_zones)
+    logging.info("DDNS update process finished.")
+
+def record_convergence(converged_ips, detection_started):
+    """Record how long the families in converged_ips took to converge since the lookup that detected the change."""
+    for record_type in converged_ips:
+        CONVERGENCE_SECONDS.observe(time.monotonic() - detection_started, type=record_type)
+        LAST_CONVERGED_TIMESTAMP.set(time.time(), type=record_type)
 
-    apache_status = "N/A"
-    update_status = "N/A"
+def sync_dns_records(target_ips, last_ips, record_index=None, refresh_index=True, system_checks=None, zone_ids=None,
+                     converged_zones=None):
+    """Point the configured zones' records at target_ips ({record_type: ip}), send the notification and save the IPs.
+
+    Only record types present in target_ips are touched. With a RecordIndex, zones already in the index are
+    served from memory and zones already converged are skipped unless refresh_index is set; every successful
+    update and fully converged zone is written back to it.
+    system_checks ({report key: Future}, from start_system_checks()) are started here if not passed in.
+    zone_ids restricts the sync to those zones (e.g. newly discovered ones).
+    converged_zones, if given, is filled with {zone_id: {record_type: ip}} for every zone family that fully
+    converged, which works without a RecordIndex too.
+    Returns {record_type: ip} for the families that fully converged to a new IP and were saved.
+    """
+    if system_checks is None:
+        system_checks = start_system_checks()
     system_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    overall_script_success = True # Tracks if all operations (including updates) were successful
+    family_success = {record_type: True for record_type in target_ips} # Tracks if all operations per family were successful
     any_record_updated_successfully = False
+    types_label = format_record_types(record_type for record_type in RECORD_TYPES if record_type in target_ips)
     domain_statuses_messages = []
 
-    for zone_name, zone_id in ZONES.items():
-        logging.info(f"Processing zone: {zone_name} (ID: {zone_id})")
-        all_a_records = get_dns_records(zone_id)
+    def record_zone_convergence(zone_id, zone_family_success):
+        for record_type, success in zone_family_success.items():
+            if success:
+                if record_index is not None:
+                    record_index.mark_converged(zone_id, record_type, target_ips[record_type])
+                if converged_zones is not None:
+                    converged_zones.setdefault(zone_id, {})[record_type] = target_ips[record_type]
 
-        if not all_a_records:
-            message = f"Zone '{zone_name}': No 'A' records found or error fetching records."
-            logging.warning(message)
-            domain_statuses_messages.append(message)
-            # Not necessarily a script failure if a zone has no 'A' records.
-            continue
-        
-        zone_update_summary = []
-        records_in_zone_to_update = 0
-        records_in_zone_updated_successfully = 0
-
-        for record in all_a_records:
-            record_id = record.get("id")
-            record_name = record.get("name")
-            record_content_ip = record.get("content")
-
-            if not all([record_id, record_name, record_content_ip]):
-                logging.warning(f"Skipping malformed record in zone {zone_name}: {record}")
-                continue
+    sync_started = time.monotonic()
+    if record_index is not None:
+        record_index.begin_sync(target_ips)
+    with contextlib.ExitStack() as stack:
+        # Every account gets its own pool, so a slow or rate-limited account never holds up the others.
+        # List all zones concurrently. Each zone task queues its record updates on its account's pool as pages
+        # stream in and returns without waiting on them.
+        zone_futures = []
+        for account in accounts:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=account.max_workers, thread_name_prefix=account.name))
+            for zone_name, zone_id in account.zones.items():
+                if zone_ids is not None and zone_id not in zone_ids:
+                    continue
+                zone_futures.append((zone_name, zone_id, executor.submit(
+                    run_in_span, "zone", {"ddns.zone": zone_name},
+                    queue_zone_updates, zone_name, zone_id, target_ips, executor, record_index, refresh_index
+                )))
+        zone_jobs = [(zone_name, zone_id, *future.result()) for zone_name, zone_id, future in zone_futures]
 
-            if record_content_ip == current_ip:
-                logging.info(f"Record '{record_name}' in zone '{zone_name}' already points to {current_ip}. No update needed.")
-                # zone_update_summary.append(f"{record_name}: Already {current_ip}") # Optional: for very verbose notifications
+        # Collect results zone by zone, in configured order, so the report reads the same as a sequential run.
+        for zone_name, zone_id, records_seen, record_futures, fetch_ok in zone_jobs:
+            zone_family_success = dict.fromkeys(target_ips, fetch_ok)
+            if not fetch_ok:
+                # Records on the pages that were never listed were not checked, so no family can count as converged.
+                message = f"Zone '{zone_name}': Listing {types_label} records failed after {records_seen} record(s); the rest were not checked."
+                logging.error(message, extra={"zone": zone_name})
+                domain_statuses_messages.append(message)
+                for record_type in target_ips:
+                    family_success[record_type] = False
+            if not records_seen:
+                if fetch_ok:
+                    message = f"Zone '{zone_name}': No {types_label} records found."
+                    logging.warning(message)
+                    domain_statuses_messages.append(message)
+                # Not necessarily a script failure if a zone has no records of these types.
+                record_zone_convergence(zone_id, zone_family_success)
                 continue
-            
-            records_in_zone_to_update += 1
-            logging.info(f"Updating record '{record_name}' (ID: {record_id}) in zone '{zone_name}' from {record_content_ip} to {current_ip}")
-            update_response = update_dns_record(zone_id, record_id, record_name, current_ip)
-            
-            if update_response and update_response.get("success"):
-                logging.info(f"Successfully updated '{record_name}' to {current_ip}.")
-                zone_update_summary.append(f"Updated {record_name} to {current_ip} (Proxied: ✅)")
-                any_record_updated_successfully = True
-                records_in_zone_updated_successfully +=1
-            else:
-                error_msg = "Unknown error"
-                if update_response and update_response.get("errors"):
-                    error_msg = update_response["errors"][0].get("message", "Unknown error")
-                logging.error(f"Failed to update '{record_name}': {error_msg}. Full response: {update_response}")
-                zone_update_summary.append(f"Failed to update {record_name}: {error_msg}")
-                overall_script_success = False # Mark failure if any update fails
-
-        if zone_update_summary: # Add summary for the zone if there was anything to report
-            domain_statuses_messages.append(f"--- Zone: {zone_name} ---")
-            domain_statuses_messages.extend(zone_update_summary)
-        elif records_in_zone_to_update == 0 and all_a_records: # All records were already up-to-date
-             domain_statuses_messages.append(f"Zone '{zone_name}': All 'A' records already up-to-date.")
 
-    if ENABLE_DISCORD_NOTIFICATIONS:
-        if ENABLE_APACHE_STATUS_CHECK:
-            apache_status = check_apache_status()
-        if ENABLE_SYSTEM_UPDATE_CHECK:
-            update_status = check_system_updates()
+            zone_update_summary = []
+            records_in_zone_to_update = len(record_futures)
+            records_in_zone_updated_successfully = 0
+
+            for record_id, record_name, record_type, changes, future in record_futures:
+                update_response = future.result()
+
+                if update_response and update_response.get("success"):
+                    RECORDS_UPDATED.inc(zone=zone_name, type=record_type)
+                    logging.debug(f"Successfully updated '{record_name}' ({record_type}): {format_changes(changes)}.",
+                                  extra={"zone": zone_name, "record": record_name, "record_type": record_type})
+                    zone_update_summary.append(f"Updated {record_name} ({record_type}): {format_changes(changes)}")
+                    any_record_updated_successfully = True
+                    records_in_zone_updated_successfully +=1
+                    if record_index is not None:
+                        record_index.apply_changes(zone_id, record_id, changes)
+                else:
+                    error_msg = "Unknown error"
+                    if update_response and update_response.get("errors"):
+                        error_msg = update_response["errors"][0].get("message", "Unknown error")
+                    RECORDS_FAILED.inc(zone=zone_name, type=record_type)
+                    logging.error(f"Failed to update '{record_name}': {error_msg}. Full response: {update_response}",
+                                  extra={"zone": zone_name, "record": record_name, "record_type": record_type})
+                    zone_update_summary.append(f"Failed to update {record_name} ({record_type}): {error_msg}")
+                    family_success[record_type] = False # Mark failure if any update fails
+                    zone_family_success[record_type] = False
 
-    # Send Discord notification
+            records_in_zone_failed = records_in_zone_to_update - records_in_zone_updated_successfully
+            records_in_zone_unchanged = max(0, records_seen - records_in_zone_to_update)
+            logging.info(
+                f"Zone '{zone_name}': {records_in_zone_updated_successfully} updated, {records_in_zone_failed} failed, "
+                f"{records_in_zone_unchanged} already up-to-date.",
+                extra={"zone": zone_name, "updated": records_in_zone_updated_successfully, "failed": records_in_zone_failed,
+                       "unchanged": records_in_zone_unchanged, "elapsed_ms": round((time.monotonic() - sync_started) * 1000)}
+            )
+            if zone_update_summary: # Add summary for the zone if there was anything to report
+                domain_statuses_messages.append(f"--- Zone: {zone_name} ---")
+                domain_statuses_messages.extend(zone_update_summary)
+            elif records_in_zone_to_update == 0 and records_seen: # All records were already up-to-date
+                 domain_statuses_messages.append(f"Zone '{zone_name}': All {types_label} records already up-to-date.")
+            record_zone_convergence(zone_id, zone_family_success)
+
+    if record_index is not None:
+        record_index.finish_sync(full_reconcile=refresh_index and zone_ids is None and set(target_ips) == set(RECORD_TYPES))
+
+    ip_changed = any(ip != last_ips.get(record_type) for record_type, ip in target_ips.items())
+    if not ip_changed and not any(record_futures or not fetch_ok for *_, record_futures, fetch_ok in zone_jobs):
+        # Reconciliation pass (daemon mode) found no drift; there is nothing to notify about or save.
+        logging.info(f"Reconciliation complete. All records already point to {format_ips(target_ips)}.")
+        return {}
+    current_ip = format_ips(target_ips)
+
+    # Usually finished by now: the checks started before the zones were listed.
+    apache_status = system_checks["apache_status"].result() if "apache_status" in system_checks else "N/A"
+    update_status = system_checks["update_status"].result() if "update_status" in system_checks else "N/A"
+
+    # Send Discord notification. This is queued to a background thread; DNS convergence never waits on it.
     if domain_statuses_messages: # Only send if there are messages (updates, errors, or zone info)
         domain_status_report = "\n".join(domain_statuses_messages)
-        logging.info("Sending notification via PHP script...")
-        if ENABLE_DISCORD_NOTIFICATIONS:
-            if DISCORD_SCRIPT_LANGAUGE == 'php':
-                try:
-                    php_process = subprocess.run(
-                        ['php', DISCORD_SCRIPT_PATH, current_ip, apache_status, update_status, system_time, domain_status_report],
-                        capture_output=True, text=True, check=True, timeout=30 # Added timeout and check
-                    )
-                    logging.info(f"PHP script executed successfully. Output: {php_process.stdout.strip()}")
-
-                except subprocess.CalledProcessError as e:
-                    logging.error(f"PHP script execution failed. Return code: {e.returncode}")
-                    logging.error(f"PHP script stdout: {e.stdout.strip()}")
-                    logging.error(f"PHP script stderr: {e.stderr.strip()}")
-                    overall_script_success = False # Notification failure is a script failure
-                except subprocess.TimeoutExpired:
-                    logging.error(f"PHP script timed out after 30 seconds.")
-                    overall_script_success = False
-                except FileNotFoundError:
-                    logging.error(f"PHP script not found at {DISCORD_SCRIPT_PATH}. Please check the path.")
-                    overall_script_success = False
-                except Exception as e:
-                    logging.error(f"An unexpected error occurred while running PHP script: {e}")
-                    overall_script_success = False
-            elif DISCORD_SCRIPT_LANGAUGE == 'py':
-                DISCORD_WEBHOOK_URL = ""
-                if hasattr(config, 'DISCORD_API_WEBHOOK_URL_ENV_VAR') and config.DISCORD_API_WEBHOOK_URL_ENV_VAR:
-                    DISCORD_WEBHOOK_URL = os.getenv(config.DISCORD_API_WEBHOOK_URL_ENV_VAR)
-                if not DISCORD_WEBHOOK_URL and hasattr(config, 'CLOUDFLARE_API_TOKEN'):
-                    DISCORD_WEBHOOK_URL = config.DISCORD_WEBHOOK_URL
-
-                if not DISCORD_WEBHOOK_URL:
-                    print("CRITICAL: Discord API Token not configured.")
-                    print("Please set it in config.py or via the environment variable specified in config.py.")
-                    exit(1)
-                    
-                try:
-                    python_process = subprocess.run(
-                        ['python3', DISCORD_SCRIPT_PATH, current_ip, apache_status, update_status, system_time, domain_status_report, DISCORD_WEBHOOK_URL],
-                        capture_output=True, text=True, check=True, timeout=30 # Added timeout and check
-                    )
-                    logging.info(f"Python script executed successfully. Output: {python_process.stdout.strip()}")
-                    
-                except subprocess.CalledProcessError as e:
-                    logging.error(f"Python script execution failed. Return code: {e.returncode}")
-                    logging.error(f"Python script stdout: {e.stdout.strip()}")
-                    logging.error(f"Python script stderr: {e.stderr.strip()}")
-                    overall_script_success = False
-            else:
-                logging.error(f"Invalid DISCORD_SCRIPT_LANGAUGE: {DISCORD_SCRIPT_LANGAUGE}. Must be 'php' or 'py'.")
+        dispatcher = get_notification_dispatcher()
+        if dispatcher is not None:
+            dispatcher.submit({
+                "ip": current_ip,
+                "apache_status": apache_status,
+                "update_status": update_status,
+                "system_time": system_time,
+                "domain_status": domain_status_report,
+            })
+        elif ENABLE_DISCORD_NOTIFICATIONS:
+            # get_notification_dispatcher() has already logged why the backend could not be loaded.
+            logging.warning(f"Update report not sent: notification backend '{NOTIFICATION_BACKEND}' is unavailable.")
         else:
-            logging.error(f"Discord notifications are not enabled.")
+            logging.debug("Notifications are disabled; update report not sent.")
     
     else:
         # This case means IP changed, but no records needed update AND no zones had errors during fetch.
@@ -337,15 +2270,341 @@ def main():
         pass
 
 
-    if overall_script_success and current_ip != last_ip: # IP changed and all operations were successful
-        logging.info(f"All operations completed successfully. New IP is {current_ip}.")
-        save_current_ip(current_ip)
+    # Each family is saved only if every one of its records converged, so a failed 'AAAA' sweep does not redo 'A'.
+    converged_ips = {
+        record_type: ip for record_type, ip in target_ips.items()
+        if family_success[record_type] and ip != last_ips.get(record_type)
+    }
+    failed_types = [record_type for record_type, success in family_success.items() if not success]
+    if converged_ips: # IP changed and all operations for these families were successful
+        logging.info(f"All operations for {format_record_types(converged_ips)} records completed successfully. New IP is {format_ips(converged_ips)}.")
+        save_current_ips(dict(last_ips, **converged_ips))
         if not any_record_updated_successfully:
-            logging.info("Note: Although IP changed, no records required an update (e.g., already correct, or no relevant 'A' records found). IP file updated.")
-    elif not overall_script_success and current_ip != last_ip:
-        logging.error("One or more operations failed during the DDNS update process. New IP was not saved to allow re-attempt on next run.")
-    
-    logging.info("DDNS update process finished.")
+            logging.info("Note: Although IP changed, no records required an update (e.g., already correct, or no relevant records found). IP file updated.")
+    if failed_types:
+        logging.error(f"One or more operations failed for {format_record_types(failed_types)} records during the DDNS update process. New IP was not saved to allow re-attempt on next run.")
+
+    return converged_ips
+
+def sync_discovered_zones(current_ips, record_index=None, system_checks=None, wait=True, converged_zones=None):
+    """Bring the zones zone discovery found since they were last synced (pending zones) to current_ips.
+
+    With wait, a background refresh that is still running is waited for first, so its new zones are synced
+    in this run; otherwise they are picked up by a later call.
+    converged_zones is what the sync that just ran reported (see sync_dns_records()); those zones are not
+    listed a second time, even without a RecordIndex.
+    """
+    if zone_index is None:
+        return
+    if wait or (zone_discovery_future is not None and zone_discovery_future.done()):
+        wait_for_zone_discovery()
+    pending = {
+        zone_id for account in accounts if account.discover_zones
+        for zone_id in zone_index.pending(account.name) if zone_id in account.zones.values()
+    }
+    if not pending:
+        return
+    if record_index is None:
+        record_index = RecordIndex()
+    converged_zones = {} if converged_zones is None else converged_zones
+
+    def unconverged(zone_ids):
+        return {
+            zone_id for zone_id in zone_ids
+            if not all(record_index.is_converged(zone_id, record_type, ip) or converged_zones.get(zone_id, {}).get(record_type) == ip
+                       for record_type, ip in current_ips.items())
+        }
+
+    # Zones the sync that just ran already converged (e.g. a daemon reconciliation) need no second pass.
+    to_sync = unconverged(pending)
+    if to_sync:
+        logging.info(f"Syncing {len(to_sync)} newly discovered zone(s) to {format_ips(current_ips)}...")
+        # current_ips doubles as last_ips: this sync never saves the IP, which only a sync of every zone may do.
+        sync_dns_records(current_ips, current_ips, record_index, True, system_checks, zone_ids=to_sync)
+    zone_index.clear_pending(pending - unconverged(pending))
+
+def plan_zone_changes(zone_name, zone_id, target_ips):
+    """List a zone and diff its records against their desired state without changing anything.
+
+    Returns {"zone", "zone_id", "records_seen", "fetch_ok", "changes"} where changes holds one
+    {"id", "name", "type", "changes": {field: {"from": old, "to": new}}} entry per record that would be updated.
+    """
+    record_types = [record_type for record_type in RECORD_TYPES if record_type in target_ips]
+    fetch_stats = {}
+    changes = []
+    for record in iter_dns_records(zone_id, record_types, fetch_stats=fetch_stats):
+        record_changes = plan_record_changes(record, target_ips)
+        if record_changes:
+            changes.append({
+                "id": record.id,
+                "name": record.name,
+                "type": record.type,
+                "changes": {field: {"from": getattr(record, field), "to": value} for field, value in record_changes.items()},
+            })
+    return {"zone": zone_name, "zone_id": zone_id, "records_seen": fetch_stats["seen"],
+            "fetch_ok": not fetch_stats["error"], "changes": changes}
+
+def run_plan(output_format="text"):
+    """Print the changes a full sync against the current public IP would make (--plan). Nothing is written or saved.
+
+    Returns True if every zone could be listed.
+    """
+    setup_logging()
+    start_zone_discovery()
+    current_ips = get_public_ips()
+    if not current_ips:
+        logging.error("Could not fetch public IP. Exiting.")
+        return False
+    wait_for_zone_discovery()
+
+    with contextlib.ExitStack() as stack:
+        zone_futures = []
+        for account in accounts:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=account.max_workers, thread_name_prefix=account.name))
+            for zone_name, zone_id in account.zones.items():
+                zone_futures.append(executor.submit(run_in_span, "zone", {"ddns.zone": zone_name}, plan_zone_changes, zone_name, zone_id, current_ips))
+        zone_plans = [future.result() for future in zone_futures]
+
+    if output_format == "json":
+        print(json.dumps({"target_ips": current_ips, "zones": zone_plans}, indent=2))
+    else:
+        print(f"Plan against {format_ips(current_ips)}:")
+        for zone_plan in zone_plans:
+            if not zone_plan["fetch_ok"]:
+                print(f"  {zone_plan['zone']}: error listing records")
+            elif not zone_plan["changes"]:
+                print(f"  {zone_plan['zone']}: no changes ({zone_plan['records_seen']} record(s))")
+            else:
+                print(f"  {zone_plan['zone']}: {len(zone_plan['changes'])} of {zone_plan['records_seen']} record(s) to update")
+            for change in zone_plan["changes"]:
+                fields = ", ".join(f"{field} {values['from']} -> {values['to']}" for field, values in change["changes"].items())
+                print(f"    ~ {change['name']} ({change['type']}): {fields}")
+        total = sum(len(zone_plan["changes"]) for zone_plan in zone_plans)
+        zones = sum(1 for zone_plan in zone_plans if zone_plan["changes"])
+        print(f"Plan: {total} record(s) to update in {zones} zone(s).")
+    return all(zone_plan["fetch_ok"] for zone_plan in zone_plans)
+
+class NetlinkWatcher:
+    """Waits for local address and default route changes using a Linux rtnetlink socket."""
+
+    # Multicast groups (linux/rtnetlink.h)
+    RTMGRP_LINK = 0x1
+    RTMGRP_IPV4_IFADDR = 0x10
+    RTMGRP_IPV4_ROUTE = 0x40
+    RTMGRP_IPV6_IFADDR = 0x100
+    RTMGRP_IPV6_ROUTE = 0x400
+    # Message types
+    RTM_NEWLINK, RTM_DELLINK = 16, 17
+    RTM_NEWADDR, RTM_DELADDR = 20, 21
+    RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+    RT_SCOPE_LINK, RT_SCOPE_HOST = 253, 254
+    # Link state (linux/if.h, linux/if_link.h)
+    IFF_UP, IFF_RUNNING, IFF_LOWER_UP = 0x1, 0x40, 0x10000
+    IFLA_OPERSTATE, IFLA_CARRIER = 16, 33
+    NLMSG_HEADER = struct.Struct("=IHHII") # length, type, flags, seq, pid
+    IFINFOMSG = struct.Struct("=BxHiII") # family, type, index, flags, change
+    RTATTR_HEADER = struct.Struct("=HH") # length, type
+
+    def __init__(self):
+        # Raises OSError/AttributeError where netlink is unavailable (non-Linux, restricted containers).
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self.sock.bind((0, self.RTMGRP_LINK | self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV4_ROUTE
+                        | self.RTMGRP_IPV6_IFADDR | self.RTMGRP_IPV6_ROUTE))
+        self.link_state = {} # Interface index -> (operstate, carrier) from its last RTM_NEWLINK
+
+    def _link_changed(self, body):
+        """Return True if an RTM_NEWLINK body reports an up/running/carrier or operstate change.
+
+        The kernel also sends RTM_NEWLINK for MTU, name, statistics and similar updates, which never change the public IP.
+        """
+        if len(body) < self.IFINFOMSG.size:
+            return False
+        _, _, index, _, change = self.IFINFOMSG.unpack_from(body)
+        state = {}
+        offset = self.IFINFOMSG.size
+        while offset + self.RTATTR_HEADER.size <= len(body):
+            attr_length, attr_type = self.RTATTR_HEADER.unpack_from(body, offset)
+            if attr_length < self.RTATTR_HEADER.size:
+                break
+            if attr_type in (self.IFLA_OPERSTATE, self.IFLA_CARRIER) and attr_length > self.RTATTR_HEADER.size:
+                state[attr_type] = body[offset + self.RTATTR_HEADER.size]
+            offset += (attr_length + 3) & ~3 # Attributes are 4-byte aligned
+        current = (state.get(self.IFLA_OPERSTATE), state.get(self.IFLA_CARRIER))
+        previous = self.link_state.get(index)
+        self.link_state[index] = current
+        if change & (self.IFF_UP | self.IFF_RUNNING | self.IFF_LOWER_UP):
+            return True
+        return previous is not None and previous != current
+
+    def _relevant(self, data):
+        """Return a description of the first event in data that could change the public IP, or None."""
+        offset = 0
+        while offset + self.NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = self.NLMSG_HEADER.unpack_from(data, offset)
+            if length < self.NLMSG_HEADER.size:
+                break
+            body = data[offset + self.NLMSG_HEADER.size:offset + length]
+            if msg_type in (self.RTM_NEWADDR, self.RTM_DELADDR) and len(body) >= 4:
+                # struct ifaddrmsg: family, prefixlen, flags, scope, index. Loopback and link-local addresses never matter.
+                if body[3] not in (self.RT_SCOPE_LINK, self.RT_SCOPE_HOST):
+                    return "address " + ("added" if msg_type == self.RTM_NEWADDR else "removed")
+            elif msg_type in (self.RTM_NEWROUTE, self.RTM_DELROUTE) and len(body) >= 2:
+                # struct rtmsg: family, dst_len, ... Only default routes (dst_len 0) are of interest.
+                if body[1] == 0:
+                    return "default route " + ("added" if msg_type == self.RTM_NEWROUTE else "removed")
+            elif msg_type == self.RTM_NEWLINK:
+                if self._link_changed(body):
+                    return "link changed"
+            elif msg_type == self.RTM_DELLINK:
+                if len(body) >= self.IFINFOMSG.size:
+                    self.link_state.pop(self.IFINFOMSG.unpack_from(body)[2], None)
+                return "link removed"
+            offset += (length + 3) & ~3 # Messages are 4-byte aligned
+        return None
+
+    def wait(self, timeout):
+        """Block until a relevant event arrives (returns its description) or timeout seconds pass (returns None).
+
+        Interfaces usually change in bursts (link up, address, route), so once one event arrives this keeps
+        draining for WATCH_SETTLE_TIME seconds before returning, which gives one lookup per burst.
+        """
+        deadline = time.monotonic() + timeout
+        event = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return event
+            self.sock.settimeout(remaining)
+            try:
+                found = self._relevant(self.sock.recv(65536))
+            except socket.timeout:
+                return event
+            except OSError as e: # e.g. ENOBUFS when the kernel dropped events; assume something changed
+                logging.warning(f"Netlink socket error: {e}")
+                found = "netlink overflow"
+            if found and event is None:
+                event = found
+                deadline = time.monotonic() + WATCH_SETTLE_TIME
+
+    def close(self):
+        self.sock.close()
+
+
+def run_daemon(watch=False):
+    """Poll the public IP forever, only contacting Cloudflare when it changes or a reconciliation is due.
+
+    With watch=True the public IP is only looked up after a local interface change (netlink),
+    or every WATCH_FALLBACK_POLL_INTERVAL seconds for changes that happen upstream.
+    """
+    setup_logging() # Initialize logging once for the life of the process
+
+    watcher = None
+    if watch:
+        try:
+            watcher = NetlinkWatcher()
+        except (AttributeError, OSError) as e:
+            logging.warning(f"Netlink is not available ({e}). Falling back to polling every {DAEMON_POLL_INTERVAL}s.")
+    if watcher is not None:
+        logging.info(f"Starting DDNS daemon (watching interfaces, fallback poll every {WATCH_FALLBACK_POLL_INTERVAL}s, reconciliation every {DAEMON_RECONCILE_INTERVAL}s)...")
+    else:
+        logging.info(f"Starting DDNS daemon (IP poll every {DAEMON_POLL_INTERVAL}s, reconciliation every {DAEMON_RECONCILE_INTERVAL}s)...")
+    record_index = RecordStateStore(STATE_FILE) if ENABLE_STATE_CACHE else RecordIndex()
+    last_ips = load_last_ips()
+    next_reconcile = time.monotonic() # The first pass builds the record index
+    retry_undelivered_notifications() # Later failures are retried by the queue itself
+
+    if METRICS_PORT is not None:
+        start_metrics_server(METRICS_ADDRESS, METRICS_PORT)
+
+    try:
+        while True:
+            LAST_RUN_TIMESTAMP.set(time.time())
+            start_run_trace("poll")
+            synced = False
+            system_checks = None # Started only by polls that sync something
+            lookup_failed = True # Until a lookup succeeds; a poll that fails part way waits a full interval too
+            try:
+                start_zone_discovery() # Cheap unless the zone cache has gone stale
+                detection_started = time.monotonic()
+                current_ips = get_public_ips()
+                lookup_failed = not current_ips
+                if lookup_failed:
+                    logging.error("Could not fetch public IP. Retrying on next poll.")
+                else:
+                    reconcile_due = time.monotonic() >= next_reconcile
+                    changed_ips = {record_type: ip for record_type, ip in current_ips.items() if ip != last_ips.get(record_type)}
+                    if changed_ips or reconcile_due:
+                        for record_type, ip in changed_ips.items():
+                            logging.info(f"Public IP for {record_type} records changed from '{last_ips.get(record_type)}' to '{ip}'. Starting DNS updates.")
+                            IP_CHANGES.inc(type=record_type)
+                        if reconcile_due:
+                            logging.info(f"Reconciling DNS records against {format_ips(current_ips)}...")
+                        # A reconciliation checks every family; otherwise only the ones that changed are touched.
+                        target_ips = current_ips if reconcile_due else changed_ips
+                        synced = True
+                        system_checks = start_system_checks()
+                        converged_ips = sync_dns_records(target_ips, last_ips, record_index, reconcile_due, system_checks)
+                        record_convergence(converged_ips, detection_started)
+                        last_ips.update(converged_ips)
+                        if reconcile_due:
+                            next_reconcile = time.monotonic() + DAEMON_RECONCILE_INTERVAL
+                    else:
+                        logging.debug(f"IP unchanged ({format_ips(current_ips)}). No update needed.")
+                    sync_discovered_zones(current_ips, record_index, system_checks, wait=False)
+            except Exception as e:
+                # One bad poll (an unexpected API response, a full disk) must not end the daemon.
+                logging.error(f"DDNS poll failed: {e}. Retrying on next poll.", exc_info=True)
+            finally:
+                finish_run_trace(logging.INFO if synced else logging.DEBUG) # Polls that found nothing to do only log at DEBUG
+
+            if watcher is None or lookup_failed:
+                # A failed lookup right after an interface change usually means the network is not up yet.
+                time.sleep(DAEMON_POLL_INTERVAL)
+                continue
+            timeout = min(WATCH_FALLBACK_POLL_INTERVAL, max(0, next_reconcile - time.monotonic()))
+            event = watcher.wait(timeout)
+            if event:
+                logging.info(f"Network change detected ({event}). Checking public IP...")
+    finally:
+        # Let queued notifications finish (the notification thread would otherwise keep the process alive).
+        if notification_dispatcher is not None:
+            notification_dispatcher.close()
+        for account in accounts:
+            account.client.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Update Cloudflare DNS 'A'/'AAAA' records with the current public IP address.")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and poll the public IP instead of exiting after one check (for use without cron).")
+    parser.add_argument("--watch", action="store_true", help="Like --daemon, but only look up the public IP when a local interface changes (Linux netlink), with a slow fallback poll.")
+    parser.add_argument("--plan", action="store_true", help="Show which records (and fields) would be updated for the current public IP, without changing anything.")
+    parser.add_argument("--plan-format", choices=["text", "json"], default="text", help="Output format for --plan (default: text).")
+    parser.add_argument("--profile", metavar="FILE", help="Profile the run with cProfile and write the stats to FILE (view with python3 -m pstats FILE).")
+    args = parser.parse_args()
+
+    profilers = start_profiler() if args.profile else None
+    plan_ok = True
+    try:
+        if args.plan:
+            start_run_trace("plan")
+            try:
+                plan_ok = run_plan(args.plan_format)
+            finally:
+                finish_run_trace()
+        elif args.daemon or args.watch:
+            try:
+                run_daemon(watch=args.watch)
+            except KeyboardInterrupt:
+                logging.info("DDNS daemon stopped.")
+        else:
+            start_run_trace()
+            try:
+                main()
+            finally:
+                finish_run_trace()
+                if METRICS_TEXTFILE:
+                    write_metrics_textfile(METRICS_TEXTFILE)
+    finally:
+        if profilers is not None:
+            write_profile(profilers, args.profile)
+    if not plan_ok:
+        exit(1)
@@ -0,0 +1,71 @@
+# Shared fixtures: cloudflare_ddns imported once with a generated config.py, and a fresh mock Cloudflare API per test.
+#
+# The script reads config.py when it is imported, so settings a test needs to vary are monkeypatched on the module.
+
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, "benchmarks")]
+
+from mock_cloudflare_api import MockCloudflareAPI, base_url # noqa: E402
+
+NEW_IP = "198.51.100.7" # What the mock's /ip endpoint reports
+
+CONFIG = {
+    "CLOUDFLARE_API_TOKEN_ENV_VAR": None,
+    "CLOUDFLARE_API_TOKEN": "test-token",
+    "CLOUDFLARE_API_BASE_URL": "http://127.0.0.1:9/client/v4", # Replaced per test by the mock_api fixture
+    "ZONES": {"example0.test": "zone00000"},
+    "LOG_ASYNC": False,
+    "ENABLE_STATE_CACHE": False,
+    "MAX_WORKERS": 4,
+    "IP_PROVIDERS": [{"name": "mock", "type": "text", "url": "http://127.0.0.1:9/ip"}],
+    "IP_PROVIDER_QUORUM": 1,
+    "IP_PROVIDER_FANOUT": 1,
+    "CLOUDFLARE_RATE_LIMIT": 10 ** 9,
+    "API_MAX_RETRIES": 1,
+    "API_BACKOFF_BASE": 0.01,
+    "ENABLE_DISCORD_NOTIFICATIONS": True,
+    "NOTIFICATION_BACKEND": f"{os.path.join(REPO_DIR, 'benchmarks', 'benchmark.py')}:NullNotifier",
+    "RECORD_OVERRIDES": {"Pinned.Example0.test.": {"proxied": False}}, # Only a record no test creates
+}
+
+
+@pytest.fixture(scope="session")
+def ddns():
+    """The cloudflare_ddns module, imported with CONFIG as its config.py."""
+    directory = tempfile.mkdtemp(prefix="ddns-tests-")
+    with open(os.path.join(directory, "config.py"), "w") as f:
+        for name, value in CONFIG.items():
+            f.write(f"{name} = {value!r}\n")
+        f.write(f"LOG_FILE = {os.path.join(directory, 'cloudflare_ddns.log')!r}\n")
+    sys.path.insert(0, directory)
+    return importlib.import_module("cloudflare_ddns")
+
+
+@pytest.fixture
+def mock_api(ddns, monkeypatch, tmp_path):
+    """A running MockCloudflareAPI with one zone (example0.test / zone00000) the script is pointed at."""
+    api = MockCloudflareAPI(NEW_IP)
+    api.add_zone("zone00000", "example0.test")
+    server = api.start()
+    host, port = server.server_address[:2]
+    client = ddns.accounts[0].client
+    monkeypatch.setattr(client, "base_url", base_url(server))
+    monkeypatch.setattr(ddns, "IP_PROVIDERS", [{"name": "mock", "type": "text", "url": f"http://{host}:{port}/ip"}])
+    monkeypatch.setattr(ddns, "IP_FILE", str(tmp_path / "ip.txt"))
+    # Nothing carries over from the previous test: breaker state, zones without a batch endpoint.
+    client.scheduler.zone_failures.clear()
+    client.scheduler.zone_open_until.clear()
+    ddns.batch_unsupported_zones.clear()
+    yield api
+    if ddns.notification_dispatcher is not None:
+        ddns.notification_dispatcher.close() # Tests that call sync_dns_records() directly leave its thread running
+    server.shutdown()
+    server.server_close()
+
@@ -0,0 +1,62 @@
+# ACCOUNTS: zones grouped under several tokens, each account with its own scheduler, connection pool and workers.
+
+import threading
+
+import pytest
+
+OLD_IP, NEW_IP = "192.0.2.1", "198.51.100.7"
+
+
+@pytest.fixture
+def two_accounts(ddns, mock_api, monkeypatch):
+    """Accounts 'personal' (example0.test) and 'work' (example1.test) with their own tokens, 3 stale records each."""
+    mock_api.add_zone("zone00000", "example0.test", 3, OLD_IP)
+    mock_api.add_zone("zone00001", "example1.test", 3, OLD_IP)
+    accounts = [
+        ddns.Account("personal", "token-personal", {"example0.test": "zone00000"}, 2, 10 ** 9, 300),
+        ddns.Account("work", "token-work", {"example1.test": "zone00001"}, 3, 10 ** 9, 300),
+    ]
+    # The mock_api fixture already pointed the default account at the mock; share its address.
+    url = ddns.accounts[0].client.base_url
+    for account in accounts:
+        account.client.base_url = url
+    monkeypatch.setattr(ddns, "accounts", accounts)
+    monkeypatch.setattr(ddns, "zone_clients", {"zone00000": accounts[0].client, "zone00001": accounts[1].client})
+    monkeypatch.setattr(ddns, "ENABLE_BATCH_UPDATES", False)
+    yield accounts
+    for account in accounts:
+        account.client.close()
+
+
+def test_each_zone_uses_its_accounts_token(ddns, mock_api, two_accounts):
+    ddns.main()
+
+    assert mock_api.zone_tokens == {"zone00000": {"Bearer token-personal"}, "zone00001": {"Bearer token-work"}}
+    assert mock_api.count_content(NEW_IP) == 6
+
+
+def test_each_account_has_its_own_scheduler_and_pool(ddns, mock_api, two_accounts, monkeypatch):
+    personal, work = two_accounts
+    scheduled = {personal.name: [], work.name: []} # Zone of every request each scheduler sent
+    for account in two_accounts:
+        def call(zone_id, send, call=account.client.scheduler.call, seen=scheduled[account.name]):
+            seen.append(zone_id)
+            return call(zone_id, send)
+        monkeypatch.setattr(account.client.scheduler, "call", call)
+    workers = {} # Zone -> name of the worker thread that listed it
+    queue_zone_updates = ddns.queue_zone_updates
+    def record_worker(zone_name, *args):
+        workers[zone_name] = threading.current_thread().name
+        return queue_zone_updates(zone_name, *args)
+    monkeypatch.setattr(ddns, "queue_zone_updates", record_worker)
+
+    ddns.main()
+
+    assert personal.client.scheduler is not work.client.scheduler
+    assert set(scheduled["personal"]) == {"zone00000"} and set(scheduled["work"]) == {"zone00001"}
+    assert len(scheduled["personal"]) == len(scheduled["work"]) == 4 # One listing and 3 PATCHes each
+    # Separate requests sessions, so separate connection pools sized for each account's workers
+    assert personal.client.session is not work.client.session
+    assert personal.client.session.get_adapter(personal.client.base_url).poolmanager.connection_pool_kw["maxsize"] == 2
+    assert work.client.session.get_adapter(work.client.base_url).poolmanager.connection_pool_kw["maxsize"] == 3
+    assert workers["example0.test"].startswith("personal_") and workers["example1.test"].startswith("work_")
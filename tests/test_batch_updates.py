@@ -0,0 +1,67 @@
+# Record updates sent through /dns_records/batch (update_dns_records_batch, submit_batch_update).
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+def stale_records(mock_api, count):
+    """Add count stale records to the mock zone; returns them as update_dns_records_batch() takes them."""
+    mock_api.add_zone("zone00000", "example0.test", count, OLD_IP)
+    return [(f"zone00000-{n}", f"host{n}.example0.test", "A", {"content": NEW_IP}) for n in range(count)]
+
+
+def test_batch_success_fans_out_to_each_record(ddns, mock_api):
+    records = stale_records(mock_api, 3)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        record_futures = ddns.submit_batch_update(executor, "zone00000", records)
+        results = {record_id: future.result() for record_id, *_, future in record_futures}
+
+    assert results == {record_id: {"success": True} for record_id, *_ in records}
+    assert mock_api.batch_sizes == [3]
+    assert mock_api.stats["requests_PATCH"] == 0
+    assert mock_api.count_content(NEW_IP) == 3
+
+
+def test_failed_batch_falls_back_to_single_updates(ddns, mock_api):
+    records = stale_records(mock_api, 3)
+    del mock_api.zones["zone00000"]["zone00000-1"] # Deleted elsewhere: the whole batch is rejected
+
+    results = ddns.update_dns_records_batch("zone00000", records)
+
+    assert results["zone00000-0"]["success"] and results["zone00000-2"]["success"]
+    assert not results["zone00000-1"]["success"]
+    assert mock_api.stats["requests_POST"] == 1
+    assert mock_api.stats["requests_PATCH"] == 3
+    assert mock_api.count_content(NEW_IP) == 2
+    assert "zone00000" not in ddns.batch_unsupported_zones # A rejected batch says nothing about the endpoint
+
+
+@pytest.mark.parametrize("status", [404, 405, 501])
+def test_missing_batch_endpoint_switches_the_zone_to_single_updates(ddns, mock_api, status):
+    records = stale_records(mock_api, 2)
+    mock_api.batch_status = status
+
+    results = ddns.update_dns_records_batch("zone00000", records)
+    assert all(result["success"] for result in results.values())
+    assert "zone00000" in ddns.batch_unsupported_zones
+    posts = mock_api.stats["requests_POST"] # 501 is retried like any 5xx before giving up
+
+    ddns.update_dns_records_batch("zone00000", records)
+    assert mock_api.stats["requests_POST"] == posts # Not tried again for this zone
+    assert mock_api.stats["requests_PATCH"] == 4
+
+
+def test_updates_are_chunked_by_dns_batch_size(ddns, mock_api, monkeypatch):
+    monkeypatch.setattr(ddns, "DNS_BATCH_SIZE", 4)
+    stale_records(mock_api, 10)
+
+    assert ddns.sync_dns_records({"A": NEW_IP}, {"A": OLD_IP}) == {"A": NEW_IP}
+
+    assert sorted(mock_api.batch_sizes) == [2, 4, 4]
+    assert mock_api.stats["requests_PATCH"] == 0
+    assert mock_api.count_content(NEW_IP) == 10
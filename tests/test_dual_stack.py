@@ -0,0 +1,81 @@
+# Dual-stack (A + AAAA) syncing: each family follows its own public IP, and the IP file holds both.
+
+import json
+
+import pytest
+
+OLD_IP, NEW_IP = "192.0.2.1", "198.51.100.7"
+OLD_IP6, NEW_IP6 = "2001:db8::1", "2001:db8::7"
+
+
+@pytest.fixture
+def dual_stack(ddns, mock_api, monkeypatch, tmp_path):
+    """Zone example0.test with 3 'A' and 3 'AAAA' records, and the script syncing both families.
+
+    Returns a function that runs main() with the given public IPs and previously saved IPs.
+    """
+    monkeypatch.setattr(ddns, "RECORD_TYPES", ["A", "AAAA"])
+    monkeypatch.setattr(ddns, "ENABLE_BATCH_UPDATES", False) # One PATCH per record, to see which were written
+    mock_api.add_zone("zone00000", "example0.test", 3, NEW_IP)
+    mock_api.add_zone("zone00000", "example0.test", 3, OLD_IP6, record_type="AAAA")
+
+    def run(public_ips, saved_ips):
+        (tmp_path / "ip.txt").write_text(json.dumps(saved_ips))
+        monkeypatch.setattr(ddns, "get_public_ips", lambda: dict(public_ips))
+        ddns.main()
+        return json.loads((tmp_path / "ip.txt").read_text())
+    return run
+
+
+def contents(mock_api, record_type):
+    return sorted(record["content"] for record in mock_api.zones["zone00000"].values() if record["type"] == record_type)
+
+
+def test_only_aaaa_records_are_patched_when_only_ipv6_changes(ddns, mock_api, dual_stack):
+    mock_api.zones["zone00000"]["zone00000-0"]["content"] = OLD_IP # 'A' drift must wait for an 'A' change
+
+    saved = dual_stack({"A": NEW_IP, "AAAA": NEW_IP6}, {"A": NEW_IP, "AAAA": OLD_IP6})
+
+    assert mock_api.listing_types == ["AAAA"]
+    assert mock_api.stats["requests_PATCH"] == 3
+    assert contents(mock_api, "AAAA") == [NEW_IP6] * 3
+    assert contents(mock_api, "A") == [OLD_IP, NEW_IP, NEW_IP]
+    assert saved == {"A": NEW_IP, "AAAA": NEW_IP6}
+
+
+def test_both_families_are_listed_in_one_pass(ddns, mock_api, dual_stack):
+    for record in mock_api.zones["zone00000"].values():
+        if record["type"] == "A":
+            record["content"] = OLD_IP
+
+    saved = dual_stack({"A": NEW_IP, "AAAA": NEW_IP6}, {"A": OLD_IP, "AAAA": OLD_IP6})
+
+    assert mock_api.listing_types == [None] # One unfiltered listing, split by type in the script
+    assert mock_api.stats["requests_PATCH"] == 6
+    assert contents(mock_api, "A") == [NEW_IP] * 3
+    assert contents(mock_api, "AAAA") == [NEW_IP6] * 3
+    assert saved == {"A": NEW_IP, "AAAA": NEW_IP6}
+
+
+def test_family_whose_lookup_failed_keeps_its_saved_ip(ddns, mock_api, dual_stack):
+    saved = dual_stack({"AAAA": NEW_IP6}, {"A": "203.0.113.9", "AAAA": OLD_IP6})
+
+    assert mock_api.listing_types == ["AAAA"]
+    assert saved == {"A": "203.0.113.9", "AAAA": NEW_IP6}
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"A": "198.51.100.7", "AAAA": "2001:db8::7"}', {"A": NEW_IP, "AAAA": NEW_IP6}),
+    ("198.51.100.7\n", {"A": NEW_IP}), # Plain-text file written before dual-stack support
+    ("2001:db8::7", {"AAAA": NEW_IP6}),
+    ("not an address", {}),
+])
+def test_ip_file_is_read(ddns, mock_api, tmp_path, content, expected):
+    (tmp_path / "ip.txt").write_text(content)
+    assert ddns.load_last_ips() == expected
+
+
+def test_ip_file_is_written_as_json(ddns, mock_api, tmp_path):
+    ddns.save_current_ips({"A": NEW_IP, "AAAA": NEW_IP6})
+    assert json.loads((tmp_path / "ip.txt").read_text()) == {"A": NEW_IP, "AAAA": NEW_IP6}
+    assert ddns.load_last_ips() == {"A": NEW_IP, "AAAA": NEW_IP6}
@@ -0,0 +1,170 @@
+# Public IP lookup: racing the providers (get_public_ip, query_ip_provider) against local HTTP stand-ins,
+# and the DNS provider (lookup_ip_dns) against a local UDP responder.
+
+import http.server
+import ipaddress
+import socket
+import struct
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def http_providers(ddns, monkeypatch):
+    """A local HTTP server whose paths are providers. Yields (provider factory, hits per path, answers per path).
+
+    answers maps a path to (status, body); provider(path) is a 'text' provider for it.
+    """
+    answers, hits = {}, {}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                hits[self.path] = hits.get(self.path, 0) + 1
+            status, body = answers.get(self.path, (404, ""))
+            body = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ddns, "ip_provider_stats", {}) # Every test starts with unmeasured providers
+    monkeypatch.setattr(ddns, "IP_PROVIDER_TIMEOUT", 2)
+
+    def provider(path):
+        return {"name": path.strip("/"), "type": "text", "url": f"http://127.0.0.1:{server.server_address[1]}{path}"}
+    yield provider, hits, answers
+    server.shutdown()
+    server.server_close()
+
+
+def use_providers(ddns, monkeypatch, providers, quorum=1, fanout=3):
+    monkeypatch.setattr(ddns, "IP_PROVIDERS", providers)
+    monkeypatch.setattr(ddns, "IP_PROVIDER_QUORUM", quorum)
+    monkeypatch.setattr(ddns, "IP_PROVIDER_FANOUT", fanout)
+
+
+def test_quorum_of_agreeing_providers_wins(ddns, http_providers, monkeypatch):
+    provider, hits, answers = http_providers
+    answers.update({"/a": (200, "203.0.113.7\n"), "/b": (200, "198.51.100.1"), "/c": (200, "203.0.113.7")})
+    use_providers(ddns, monkeypatch, [provider("/a"), provider("/b"), provider("/c")], quorum=2)
+
+    assert ddns.get_public_ip() == "203.0.113.7"
+
+
+def test_disagreeing_providers_give_no_ip(ddns, http_providers, monkeypatch, caplog):
+    provider, hits, answers = http_providers
+    answers.update({"/a": (200, "203.0.113.7"), "/b": (200, "198.51.100.1"), "/c": (500, "")})
+    use_providers(ddns, monkeypatch, [provider("/a"), provider("/b"), provider("/c")], quorum=2)
+
+    assert ddns.get_public_ip() is None
+    assert "fewer than 2 providers agreed" in caplog.text
+
+
+def test_wrong_family_or_garbage_does_not_count(ddns, http_providers, monkeypatch):
+    provider, hits, answers = http_providers
+    answers.update({"/v6": (200, "2001:db8::7"), "/html": (200, "<html>"), "/ok": (200, "203.0.113.7")})
+    use_providers(ddns, monkeypatch, [provider("/v6"), provider("/html"), provider("/ok")], quorum=1)
+
+    assert ddns.query_ip_provider(provider("/v6")) is None
+    assert ddns.query_ip_provider(provider("/html")) is None
+    assert ddns.get_public_ip() == "203.0.113.7"
+
+
+def test_best_provider_is_asked_first(ddns, http_providers, monkeypatch):
+    provider, hits, answers = http_providers
+    answers.update({"/slow": (200, "203.0.113.7"), "/fast": (200, "203.0.113.7")})
+    use_providers(ddns, monkeypatch, [provider("/slow"), provider("/fast")], quorum=1, fanout=1)
+    ddns.ip_provider_stats.update({"slow": {"latency": 0.5, "failure_rate": 0.0},
+                                   "fast": {"latency": 0.01, "failure_rate": 0.0}})
+
+    assert ddns.get_public_ip() == "203.0.113.7"
+    assert hits == {"/fast": 1}
+
+
+def test_failing_provider_is_deprioritized(ddns, http_providers, monkeypatch):
+    provider, hits, answers = http_providers
+    answers.update({"/broken": (500, ""), "/good": (200, "203.0.113.7")})
+    use_providers(ddns, monkeypatch, [provider("/broken"), provider("/good")], quorum=1, fanout=1)
+
+    assert ddns.get_public_ip() == "203.0.113.7" # Both untried: configured order, so /broken is asked first
+    assert hits == {"/broken": 1, "/good": 1}
+    assert ddns.get_public_ip() == "203.0.113.7"
+    assert ddns.get_public_ip() == "203.0.113.7"
+    assert hits == {"/broken": 1, "/good": 3} # Its failure sank it below the working provider
+
+
+def dns_answer(query, record_type, rdata, extra_answers=()):
+    """A response to query with the given answers, each a (type, rdata) pair whose name points at the question."""
+    query_id = struct.unpack("!H", query[:2])[0]
+    question = query[12:]
+    answers = [(record_type, rdata), *extra_answers]
+    body = b"".join(struct.pack("!HHHIH", 0xC00C, answer_type, 1, 60, len(data)) + data for answer_type, data in answers)
+    return struct.pack("!HHHHHH", query_id, 0x8180, 1, len(answers), 0, 0) + question + body
+
+
+@pytest.fixture
+def dns_responder(ddns, monkeypatch):
+    """A local UDP DNS server. Yields (port, queries); set respond[0] to a function query -> response bytes."""
+    monkeypatch.setattr(ddns, "IP_PROVIDER_TIMEOUT", 2)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    queries, respond = [], [None]
+
+    def serve():
+        while True:
+            try:
+                query, client = sock.recvfrom(512)
+            except OSError:
+                return
+            queries.append(query)
+            sock.sendto(respond[0](query), client)
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()[1], queries, respond
+    sock.close()
+
+
+def dns_provider(port, **settings):
+    return {"name": "local-dns", "type": "dns", "server": "127.0.0.1", "port": port, "query": "myip.example.test", **settings}
+
+
+def test_dns_a_answer(ddns, dns_responder):
+    port, queries, respond = dns_responder
+    # A CNAME first, as resolvers often answer, then the address
+    respond[0] = lambda query: dns_answer(query, 5, b"\x02ip\xc0\x0c", [(1, socket.inet_aton("203.0.113.7"))])
+
+    assert ddns.lookup_ip_dns(dns_provider(port)) == "203.0.113.7"
+    assert struct.unpack("!H", queries[0][-4:-2])[0] == 1 # Asked for an 'A' record
+
+
+def test_dns_aaaa_answer(ddns, dns_responder):
+    port, queries, respond = dns_responder
+    respond[0] = lambda query: dns_answer(query, 28, ipaddress.ip_address("2001:db8::7").packed)
+
+    assert ddns.query_ip_provider(dns_provider(port, ip_version=6)) == "2001:db8::7"
+    assert struct.unpack("!H", queries[0][-4:-2])[0] == 28
+
+
+def test_dns_txt_answer(ddns, dns_responder):
+    port, queries, respond = dns_responder
+    respond[0] = lambda query: dns_answer(query, 16, b"\x0b203.0.113.7")
+
+    assert ddns.query_ip_provider(dns_provider(port, record_type="TXT")) == "203.0.113.7"
+    assert struct.unpack("!H", queries[0][-4:-2])[0] == 16
+
+
+def test_dns_error_or_missing_answer_fails(ddns, dns_responder):
+    port, queries, respond = dns_responder
+    respond[0] = lambda query: query[:2] + b"\x81\x83" + query[4:] # NXDOMAIN
+    assert ddns.query_ip_provider(dns_provider(port)) is None
+
+    respond[0] = lambda query: dns_answer(query, 16, b"\x0b203.0.113.7") # TXT when 'A' was asked for
+    with pytest.raises(ValueError, match="no A record"):
+        ddns.lookup_ip_dns(dns_provider(port))
@@ -0,0 +1,72 @@
+# Prometheus metrics: the text exposition after a sync against the mock, and the atomic textfile write.
+
+import logging
+import os
+
+import pytest
+
+OLD_IP, NEW_IP = "192.0.2.1", "198.51.100.7"
+
+
+@pytest.fixture
+def fresh_metrics(ddns, monkeypatch):
+    """Every metric starts empty; the registry is shared by the whole test session."""
+    for metric in ddns.metrics_registry:
+        monkeypatch.setattr(metric, "values", {})
+
+
+def samples(text):
+    """Sample lines of an exposition as {'name{labels}': value}."""
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def test_exposition_after_a_sync(ddns, mock_api, fresh_metrics, monkeypatch):
+    monkeypatch.setattr(ddns, "ENABLE_BATCH_UPDATES", False)
+    mock_api.add_zone("zone00000", "example0.test", 3, OLD_IP)
+
+    ddns.main()
+    text = ddns.render_metrics()
+    values = samples(text)
+
+    assert "# TYPE cloudflare_ddns_api_request_duration_seconds histogram" in text
+    assert "# TYPE cloudflare_ddns_records_updated_total counter" in text
+    assert "# TYPE cloudflare_ddns_last_run_timestamp_seconds gauge" in text
+    assert values['cloudflare_ddns_records_updated_total{zone="example0.test",type="A"}'] == "3"
+    assert values['cloudflare_ddns_ip_changes_total{type="A"}'] == "1"
+
+    # One histogram series: every bucket, in order, cumulative, ending in +Inf == _count
+    patch = 'method="PATCH",endpoint="/zones/:zone_id/dns_records/:record_id",status="200"'
+    buckets = [(line.split('le="')[1].split('"')[0], int(line.rsplit(" ", 1)[1])) for line in text.splitlines()
+               if line.startswith(f"cloudflare_ddns_api_request_duration_seconds_bucket{{{patch},")]
+    assert [bound for bound, _ in buckets] == [str(bound) for bound in ddns.Histogram.DEFAULT_BUCKETS] + ["+Inf"]
+    assert [count for _, count in buckets] == sorted(count for _, count in buckets)
+    assert buckets[-1][1] == 3
+    assert values[f"cloudflare_ddns_api_request_duration_seconds_count{{{patch}}}"] == "3"
+    assert 0 < float(values[f"cloudflare_ddns_api_request_duration_seconds_sum{{{patch}}}"]) < 30
+    assert values['cloudflare_ddns_ip_lookup_duration_seconds_count{provider="mock",result="success"}'] == "1"
+
+
+def test_label_values_are_escaped(ddns, fresh_metrics):
+    ddns.RECORDS_FAILED.inc(zone='odd "zone"\\name\nx', type="A")
+
+    assert ddns.RECORDS_FAILED.samples() == ['cloudflare_ddns_records_failed_total{zone="odd \\"zone\\"\\\\name\\nx",type="A"} 1']
+
+
+def test_textfile_is_replaced_atomically(ddns, fresh_metrics, tmp_path, monkeypatch, caplog):
+    path = tmp_path / "cloudflare_ddns.prom"
+    ddns.IP_CHANGES.inc(type="A")
+
+    ddns.write_metrics_textfile(str(path))
+    assert path.read_text() == ddns.render_metrics()
+    assert os.listdir(tmp_path) == ["cloudflare_ddns.prom"] # The temporary file was renamed over it
+
+    # A failed write leaves the previous file whole for the collector
+    written = path.read_text()
+    ddns.IP_CHANGES.inc(type="A")
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(ddns.os, "replace", fail)
+    with caplog.at_level(logging.ERROR):
+        ddns.write_metrics_textfile(str(path))
+    assert path.read_text() == written
+    assert "Could not write metrics" in caplog.text
@@ -0,0 +1,39 @@
+# Record selection rules (NameRules) and per-record overrides, which are matched by name in lower case.
+
+import pytest
+
+
+@pytest.mark.parametrize("rules, name, expected", [
+    (["home.example.com"], "Home.Example.com", True),
+    (["*.example.com"], "a.b.example.com", True),
+    (["web?.example.org"], "web1.example.org", True),
+    (["re:vpn-[0-9]+\\."], "vpn-12.example.com", True),
+    (["re:vpn-[0-9]+\\."], "office.example.com", False),
+    # Regular expressions ignore case, like every other rule.
+    (["re:VPN-[0-9]+\\.Example\\.com"], "vpn-12.example.com", True),
+    (["re:[A-Z]+-[0-9]+\\."], "Vpn-12.example.com", True),
+    (["re:(VPN|Office)-"], "office-1.example.com", True),
+    # A backreference keeps pointing at its own rule's group, whatever rules come before it.
+    (["re:(web|api)-.*", "re:(a+)-\\1\\."], "aa-aa.example.com", True),
+    (["re:(web|api)-.*", "re:(a+)-\\1\\."], "aa-a.example.com", False),
+    (["re:(?P<host>[a-z]+)\\.example\\.com", "re:(?P<host>vpn)"], "vpn.example.net", True),
+    # A leading inline flag applies to its own rule only.
+    (["*.example.com", "re:(?x) vpn \\. "], "vpn.example.net", True),
+    (["*.example.com", "re:(?x) vpn \\. "], "other.example.net", False),
+])
+def test_rules_match(ddns, rules, name, expected):
+    assert ddns.NameRules(rules).matches(name) is expected
+
+
+def test_group_only_rules_are_not_empty(ddns):
+    assert not ddns.NameRules(["re:(?i)vpn"]).empty
+
+
+def test_invalid_expression_is_reported_with_its_rule(ddns):
+    with pytest.raises(ValueError, match=r"'re:\(unclosed'"):
+        ddns.NameRules(["*.example.com", "re:(unclosed", "re:vpn"])
+
+
+@pytest.mark.parametrize("name", ["pinned.example0.test", "PINNED.example0.test", "Pinned.Example0.test"])
+def test_record_overrides_match_in_lower_case(ddns, name):
+    assert ddns.desired_record_state(name, "198.51.100.7") == {"content": "198.51.100.7", "proxied": False}
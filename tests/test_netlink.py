@@ -0,0 +1,73 @@
+# Interface watching: NetlinkWatcher._relevant against canned rtnetlink messages.
+
+import socket
+import struct
+
+import pytest
+
+
+@pytest.fixture
+def watcher(ddns):
+    try:
+        watcher = ddns.NetlinkWatcher()
+    except (AttributeError, OSError) as e:
+        pytest.skip(f"netlink is not available: {e}")
+    yield watcher
+    watcher.close()
+
+
+def message(msg_type, body):
+    """One netlink message: nlmsghdr followed by body, padded to 4 bytes."""
+    body += b"\0" * (-len(body) % 4)
+    return struct.pack("=IHHII", 16 + len(body), msg_type, 0, 0, 0) + body
+
+
+def addr_message(msg_type, scope, family=socket.AF_INET):
+    return message(msg_type, struct.pack("=BBBBI", family, 24, 0, scope, 2)) # struct ifaddrmsg
+
+
+def route_message(msg_type, dst_len):
+    return message(msg_type, struct.pack("=BBBBBBBBI", socket.AF_INET, dst_len, 0, 0, 254, 3, 0, 1, 0)) # struct rtmsg
+
+
+def link_message(index, flags=0, change=0, operstate=None, carrier=None, msg_type=16):
+    body = struct.pack("=BxHiII", socket.AF_UNSPEC, 1, index, flags, change) # struct ifinfomsg
+    body += struct.pack("=HH", 8, 4) + struct.pack("=I", 1500) # IFLA_MTU, which never matters
+    for attr_type, value in ((16, operstate), (33, carrier)):
+        if value is not None:
+            body += struct.pack("=HHB3x", 5, attr_type, value)
+    return message(msg_type, body)
+
+
+def test_address_changes(watcher):
+    assert watcher._relevant(addr_message(20, 0)) == "address added"
+    assert watcher._relevant(addr_message(21, 0, socket.AF_INET6)) == "address removed"
+    assert watcher._relevant(addr_message(20, 253)) is None # Link-local
+    assert watcher._relevant(addr_message(20, 254)) is None # Loopback
+
+
+def test_only_default_routes_matter(watcher):
+    assert watcher._relevant(route_message(24, 0)) == "default route added"
+    assert watcher._relevant(route_message(25, 0)) == "default route removed"
+    assert watcher._relevant(route_message(24, 24)) is None # 192.0.2.0/24 and the like
+
+
+def test_link_messages_need_a_state_change(watcher):
+    up = 0x1 | 0x40 | 0x10000
+    # The first sighting of an interface only records its state
+    assert watcher._relevant(link_message(2, flags=up, operstate=6, carrier=1)) is None
+    # MTU, name and statistics updates arrive as RTM_NEWLINK too
+    assert watcher._relevant(link_message(2, flags=up, operstate=6, carrier=1)) is None
+    # Carrier lost: the kernel flags the change...
+    assert watcher._relevant(link_message(2, flags=0x1, change=0x40 | 0x10000, operstate=2, carrier=0)) == "link changed"
+    # ...or it only shows in the attributes
+    assert watcher._relevant(link_message(2, flags=up, operstate=6, carrier=1)) == "link changed"
+    assert watcher._relevant(link_message(3, flags=up, operstate=6, carrier=1)) is None # Other interfaces are tracked separately
+    assert watcher._relevant(link_message(3, operstate=6, carrier=1, msg_type=17)) == "link removed"
+    assert 3 not in watcher.link_state
+
+
+def test_first_relevant_message_in_a_batch_wins(watcher):
+    batch = route_message(24, 8) + link_message(4, operstate=6) + addr_message(20, 253) + route_message(24, 0) + addr_message(20, 0)
+    assert watcher._relevant(batch) == "default route added"
+    assert watcher._relevant(struct.pack("=IHHII", 8, 20, 0, 0, 0)) is None # Truncated header: stop, don't loop
@@ -0,0 +1,206 @@
+# Notification backends (ScriptNotifier, DiscordWebhookNotifier), the dispatcher thread that runs them and the
+# example discord_notifier.py's queue, against a local stand-in for a Discord webhook.
+
+import http.server
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+NEW_IP = "198.51.100.7"
+DISCORD_NOTIFIER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "Notifications Implementation Example", "Python Example", "discord_notifier.py")
+
+REPORT = {"ip": "198.51.100.7", "apache_status": "active", "update_status": "0 updates", "system_time": "now",
+          "domain_status": "Updated host0.example0.test (A)"}
+
+
+def test_python_script_gets_the_webhook_url_resolved_at_startup(ddns, tmp_path, monkeypatch):
+    script = tmp_path / "notify.py"
+    script.write_text("import sys\nopen(sys.argv[0] + '.args', 'w').write('\\n'.join(sys.argv[1:]))\n")
+    monkeypatch.setattr(ddns, "NOTIFICATION_BACKEND", "script")
+    monkeypatch.setattr(ddns, "DISCORD_SCRIPT_LANGAUGE", "py")
+    monkeypatch.setattr(ddns, "DISCORD_SCRIPT_PATH", str(script))
+    monkeypatch.setattr(ddns, "DISCORD_WEBHOOK_URL", "https://discord.invalid/api/webhooks/1/token")
+
+    dispatcher = ddns.NotificationDispatcher(ddns.load_notifier())
+    dispatcher.submit(REPORT)
+    dispatcher.close()
+
+    args = (tmp_path / "notify.py.args").read_text().split("\n")
+    assert args[:5] == [REPORT[key] for key in ("ip", "apache_status", "update_status", "system_time", "domain_status")]
+    assert args[5:] == ["--webhook-url", "https://discord.invalid/api/webhooks/1/token"]
+
+
+@pytest.fixture
+def webhook():
+    """A local webhook endpoint. Yields (url, received payloads, responses): each POST pops the next
+    (status, headers) from responses, or answers 204 once it is empty."""
+    received, responses = [], []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            status, headers = responses.pop(0) if responses else (204, {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/webhook", received, responses
+    server.shutdown()
+    server.server_close()
+
+
+def test_spooled_messages_are_sent_when_the_queue_is_built(ddns, webhook, tmp_path):
+    url, received, _ = webhook
+    spool = tmp_path / "spool.jsonl"
+    spool.write_text(json.dumps({"content": "from an earlier run"}) + "\n")
+    module = ddns.load_module_from_path(DISCORD_NOTIFIER)
+
+    queue = module.DiscordNotificationQueue(url, window=60, spool_path=str(spool), validate_url=False)
+    assert queue.close()
+
+    assert received == [{"content": "from an earlier run"}]
+    assert not spool.exists()
+
+
+class ClosingNotifier:
+    def __init__(self):
+        self.closed = False
+
+    def notify(self, report):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def test_unchanged_ip_run_still_flushes_the_spool(ddns, mock_api, monkeypatch, tmp_path):
+    (tmp_path / "ip.txt").write_text(json.dumps({"A": NEW_IP}))
+    spool = tmp_path / "spool.jsonl"
+    spool.write_text(json.dumps({"content": "from an earlier run"}) + "\n")
+    notifier = ClosingNotifier()
+    monkeypatch.setattr(ddns, "NOTIFICATION_BACKEND", "discord")
+    monkeypatch.setattr(ddns, "DISCORD_SPOOL_FILE", str(spool))
+    monkeypatch.setattr(ddns, "load_notifier", lambda: notifier)
+    monkeypatch.setattr(ddns, "notification_dispatcher", None)
+
+    ddns.main()
+
+    assert notifier.closed
+    assert mock_api.stats["requests_GET"] == 0 # Nothing was synced
+
+
+@pytest.mark.parametrize("headers", [
+    {"Retry-After": "soon"},
+    {"Retry-After": "nan"},
+])
+def test_malformed_retry_after_falls_back_to_the_default_delay(ddns, webhook, headers):
+    url, received, responses = webhook
+    responses.append((429, headers))
+    module = ddns.load_module_from_path(DISCORD_NOTIFIER)
+
+    assert module.post_webhook(url, {"content": "hello"})
+    assert len(received) == 2
+
+
+def test_malformed_reset_after_is_ignored(ddns, webhook):
+    url, received, responses = webhook
+    responses.append((204, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "later"}))
+    module = ddns.load_module_from_path(DISCORD_NOTIFIER)
+
+    assert module.post_webhook(url, {"content": "hello"})
+
+
+def test_messages_stay_queued_when_sending_raises(ddns, webhook, tmp_path, monkeypatch):
+    url, received, _ = webhook
+    spool = tmp_path / "spool.jsonl"
+    module = ddns.load_module_from_path(DISCORD_NOTIFIER)
+    queue = module.DiscordNotificationQueue(url, window=60, spool_path=str(spool), validate_url=False)
+    notifier = module.DiscordNotifier(url, validate_url=False)
+    notifier.set_content("IP changed")
+
+    def broken_post(webhook_url, payload):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(module, "post_webhook", broken_post)
+    queue.put(notifier)
+    assert not queue.close()
+    assert [json.loads(line) for line in spool.read_text().splitlines()] == [{"content": "IP changed"}]
+
+    monkeypatch.undo()
+    retry = module.DiscordNotificationQueue(url, window=60, spool_path=str(spool), validate_url=False)
+    assert retry.close()
+    assert received == [{"content": "IP changed"}]
+
+
+class StopDaemon(BaseException):
+    """Raised from the daemon's sleep to end run_daemon() in a test, like a KeyboardInterrupt would."""
+
+
+def test_main_closes_the_dispatcher_when_the_run_fails(ddns, mock_api, monkeypatch):
+    notifier = ClosingNotifier()
+    monkeypatch.setattr(ddns, "notification_dispatcher", ddns.NotificationDispatcher(notifier))
+    ddns.notification_dispatcher.submit(REPORT) # Starts the (non-daemon) notification thread
+
+    def broken_lookup():
+        raise RuntimeError("boom")
+    monkeypatch.setattr(ddns, "get_public_ips", broken_lookup)
+
+    with pytest.raises(RuntimeError):
+        ddns.main()
+    assert notifier.closed
+    assert ddns.notification_dispatcher.thread is None
+
+
+def test_daemon_survives_a_failed_poll_and_closes_the_dispatcher(ddns, mock_api, monkeypatch, caplog):
+    notifier = ClosingNotifier()
+    monkeypatch.setattr(ddns, "notification_dispatcher", ddns.NotificationDispatcher(notifier))
+    lookups = []
+
+    def flaky_lookup():
+        lookups.append(True)
+        if len(lookups) == 1:
+            raise RuntimeError("boom")
+        return {"A": NEW_IP}
+
+    def sleep(seconds):
+        if len(lookups) == 2:
+            raise StopDaemon()
+    monkeypatch.setattr(ddns, "get_public_ips", flaky_lookup)
+    monkeypatch.setattr(ddns.time, "sleep", sleep)
+    monkeypatch.setattr(ddns, "sync_dns_records", lambda *args, **kwargs: {})
+
+    with pytest.raises(StopDaemon):
+        ddns.run_daemon()
+    assert len(lookups) == 2
+    assert "DDNS poll failed: boom" in caplog.text
+    assert notifier.closed
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_unsent_report_logs_the_real_reason(ddns, mock_api, monkeypatch, caplog, enabled):
+    mock_api.add_zone("zone00000", "example0.test", 1, "192.0.2.1")
+    monkeypatch.setattr(ddns, "notification_dispatcher", None)
+    monkeypatch.setattr(ddns, "ENABLE_DISCORD_NOTIFICATIONS", enabled)
+    monkeypatch.setattr(ddns, "NOTIFICATION_BACKEND", "missing_notifier.py:Notifier")
+    caplog.set_level(logging.DEBUG)
+
+    ddns.main()
+
+    assert mock_api.count_content(NEW_IP) == 1
+    problems = [record.getMessage() for record in caplog.records if record.levelno >= logging.WARNING]
+    if enabled:
+        assert any(message.startswith("Could not load notification backend 'missing_notifier.py:Notifier'") for message in problems)
+        assert "Update report not sent: notification backend 'missing_notifier.py:Notifier' is unavailable." in problems
+    else:
+        assert problems == []
+        assert "Notifications are disabled; update report not sent." in caplog.text
@@ -0,0 +1,92 @@
+# Paginated record listings (iter_dns_records) streamed into the update loop.
+
+import json
+import logging
+import tracemalloc
+
+import pytest
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+def saved_ips(ddns):
+    """The {record_type: ip} main() saved to IP_FILE, or None if it saved nothing."""
+    try:
+        with open(ddns.IP_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_large_zone_is_listed_completely_with_bounded_memory(ddns, mock_api, monkeypatch, caplog, batch):
+    monkeypatch.setattr(ddns, "DNS_RECORDS_PER_PAGE", 1000)
+    monkeypatch.setattr(ddns, "ENABLE_BATCH_UPDATES", batch) # Without batches every update is a span of its own
+    zone = mock_api.add_zone("zone00000", "example0.test", 50000, NEW_IP)
+    for n in range(0, 50000, 100):
+        zone[f"zone00000-{n}"]["content"] = OLD_IP
+    caplog.set_level(logging.INFO)
+    ddns.get_public_ips() # Imports requests and opens the session outside the measurement
+
+    tracemalloc.start()
+    try:
+        ddns.start_run_trace() # As the script runs main(), with run timing at its default (on)
+        try:
+            ddns.main()
+        finally:
+            ddns.finish_run_trace()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert mock_api.count_content(NEW_IP) == 50000
+    assert mock_api.stats["requests_GET"] == 50 # Every page, each listed once
+    assert "Zone 'example0.test': 500 updated, 0 failed, 49500 already up-to-date." in caplog.text
+    assert "Run timing: total" in caplog.text
+    assert saved_ips(ddns) == {"A": NEW_IP}
+    # Only about one page is held at a time. Keeping the listing (as DnsRecords, let alone the API's dicts)
+    # would take well over 15 MB for 50k records.
+    assert peak < 8 * 2 ** 20, f"peak traced memory {peak / 2 ** 20:.1f} MB"
+
+
+def test_listing_cut_short_fails_the_run(ddns, mock_api, monkeypatch, caplog):
+    monkeypatch.setattr(ddns, "DNS_RECORDS_PER_PAGE", 5)
+    mock_api.add_zone("zone00000", "example0.test", 15, OLD_IP)
+    mock_api.failing_pages = {2}
+    caplog.set_level(logging.INFO)
+
+    ddns.main()
+
+    assert mock_api.count_content(NEW_IP) == 5 # Page 1 only
+    assert "Listing 'A' records failed after 5 record(s)" in caplog.text
+    assert "completed successfully" not in caplog.text
+    assert saved_ips(ddns) is None # So the next run tries again
+
+
+def test_listing_cut_short_is_listed_again_from_the_record_index(ddns, mock_api, monkeypatch):
+    monkeypatch.setattr(ddns, "DNS_RECORDS_PER_PAGE", 5)
+    mock_api.add_zone("zone00000", "example0.test", 15, OLD_IP)
+    mock_api.failing_pages = {2}
+    record_index = ddns.RecordIndex()
+
+    assert ddns.sync_dns_records({"A": NEW_IP}, {"A": OLD_IP}, record_index, refresh_index=True) == {}
+    assert not record_index.is_converged("zone00000", "A", NEW_IP)
+
+    # A retry of the same change (e.g. the daemon's next poll) would normally be served from the index.
+    mock_api.failing_pages = set()
+    assert ddns.sync_dns_records({"A": NEW_IP}, {"A": OLD_IP}, record_index, refresh_index=False) == {"A": NEW_IP}
+    assert mock_api.count_content(NEW_IP) == 15
+    assert len(record_index.records("zone00000", ["A"])) == 15
+
+
+def test_iter_dns_records_follows_result_info(ddns, mock_api, monkeypatch):
+    monkeypatch.setattr(ddns, "DNS_RECORDS_PER_PAGE", 7)
+    mock_api.add_zone("zone00000", "example0.test", 20, OLD_IP)
+    fetch_stats = {}
+
+    records = list(ddns.iter_dns_records("zone00000", ("A",), fetch_stats=fetch_stats))
+
+    assert sorted(record.name for record in records) == sorted(f"host{n}.example0.test" for n in range(20))
+    assert fetch_stats == {"seen": 20, "skipped": 0, "error": False}
+    assert mock_api.stats["requests_GET"] == 3
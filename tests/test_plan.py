@@ -0,0 +1,61 @@
+# Record settings and --plan: which fields differ from RECORD_DEFAULTS/RECORD_OVERRIDES, and that a plan writes nothing.
+
+import json
+import os
+
+import pytest
+
+OLD_IP, NEW_IP = "192.0.2.1", "198.51.100.7"
+
+
+@pytest.fixture
+def record_settings(ddns, mock_api, monkeypatch):
+    """3 'A' records (proxied, ttl 1) against defaults of proxied + ttl 300 and an override unproxying host1.
+
+    host0 and host1 point at OLD_IP; host2 already has the new IP and every desired setting.
+    """
+    monkeypatch.setattr(ddns, "RECORD_DEFAULTS", {"proxied": True, "ttl": 300})
+    monkeypatch.setattr(ddns, "RECORD_OVERRIDES", {"host1.example0.test": {"proxied": False}}) # As normalized at import
+    monkeypatch.setattr(ddns, "ENABLE_BATCH_UPDATES", False) # One PATCH per record, to see each body
+    zone = mock_api.add_zone("zone00000", "example0.test", 3, OLD_IP)
+    zone["zone00000-2"].update(content=NEW_IP, ttl=300)
+    return zone
+
+
+def test_overrides_beat_defaults(ddns, record_settings):
+    record = ddns.DnsRecord.from_api(record_settings["zone00000-1"])
+
+    assert ddns.plan_record_changes(record, {"A": NEW_IP}) == {"content": NEW_IP, "proxied": False, "ttl": 300}
+    assert ddns.plan_record_changes(record, {"AAAA": "2001:db8::7"}) == {} # Types without a target are not managed
+
+
+def test_patch_sends_only_differing_fields(ddns, mock_api, record_settings):
+    ddns.main()
+
+    assert sorted(mock_api.record_writes) == [
+        ("PATCH", "zone00000-0", {"content": NEW_IP, "ttl": 300}), # Already proxied
+        ("PATCH", "zone00000-1", {"content": NEW_IP, "proxied": False, "ttl": 300}),
+    ]
+    assert record_settings["zone00000-1"]["proxied"] is False
+
+
+def test_json_plan_lists_changes_and_writes_nothing(ddns, mock_api, record_settings, capsys):
+    assert ddns.run_plan("json") is True
+
+    plan = json.loads(capsys.readouterr().out)
+    assert plan["target_ips"] == {"A": NEW_IP}
+    [zone_plan] = plan["zones"]
+    assert {key: zone_plan[key] for key in ("zone", "zone_id", "records_seen", "fetch_ok")} == \
+        {"zone": "example0.test", "zone_id": "zone00000", "records_seen": 3, "fetch_ok": True}
+    assert sorted(zone_plan["changes"], key=lambda change: change["id"]) == [
+        {"id": "zone00000-0", "name": "host0.example0.test", "type": "A",
+         "changes": {"content": {"from": OLD_IP, "to": NEW_IP}, "ttl": {"from": 1, "to": 300}}},
+        {"id": "zone00000-1", "name": "host1.example0.test", "type": "A",
+         "changes": {"content": {"from": OLD_IP, "to": NEW_IP}, "proxied": {"from": True, "to": False}, "ttl": {"from": 1, "to": 300}}},
+    ]
+    # Nothing written: no API writes, records untouched, no IP file
+    assert mock_api.stats["requests_GET"] >= 1
+    assert mock_api.stats["requests_PATCH"] == mock_api.stats["requests_PUT"] == mock_api.stats["requests_POST"] == 0
+    assert mock_api.record_writes == []
+    assert mock_api.count_content(OLD_IP) == 2
+    assert not os.path.exists(ddns.IP_FILE)
@@ -0,0 +1,53 @@
+# Reconciliation passes (daemon mode): re-listing zones whose IP has not changed.
+
+import logging
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.reports = []
+
+    def submit(self, report):
+        self.reports.append(report)
+
+
+def test_reconciliation_without_drift_reports_nothing(ddns, mock_api, monkeypatch, caplog):
+    mock_api.add_zone("zone00000", "example0.test", 3, NEW_IP)
+    dispatcher = RecordingDispatcher()
+    monkeypatch.setattr(ddns, "get_notification_dispatcher", lambda: dispatcher)
+    caplog.set_level(logging.INFO)
+
+    assert ddns.sync_dns_records({"A": NEW_IP}, {"A": NEW_IP}, ddns.RecordIndex(), refresh_index=True) == {}
+
+    assert "Reconciliation complete" in caplog.text
+    assert dispatcher.reports == []
+
+
+def test_reconciliation_reports_drift(ddns, mock_api, monkeypatch):
+    zone = mock_api.add_zone("zone00000", "example0.test", 3, NEW_IP)
+    zone["zone00000-1"]["content"] = OLD_IP # Changed outside the script
+    dispatcher = RecordingDispatcher()
+    monkeypatch.setattr(ddns, "get_notification_dispatcher", lambda: dispatcher)
+
+    ddns.sync_dns_records({"A": NEW_IP}, {"A": NEW_IP}, ddns.RecordIndex(), refresh_index=True)
+
+    assert mock_api.count_content(NEW_IP) == 3
+    assert len(dispatcher.reports) == 1
+    assert "Updated host1.example0.test (A)" in dispatcher.reports[0]["domain_status"]
+
+
+def test_reconciliation_with_failed_listing_is_reported(ddns, mock_api, monkeypatch, caplog):
+    monkeypatch.setattr(ddns, "DNS_RECORDS_PER_PAGE", 2)
+    mock_api.add_zone("zone00000", "example0.test", 4, NEW_IP)
+    mock_api.failing_pages = {2}
+    dispatcher = RecordingDispatcher()
+    monkeypatch.setattr(ddns, "get_notification_dispatcher", lambda: dispatcher)
+    caplog.set_level(logging.INFO)
+
+    ddns.sync_dns_records({"A": NEW_IP}, {"A": NEW_IP}, ddns.RecordIndex(), refresh_index=True)
+
+    assert "Reconciliation complete" not in caplog.text
+    assert "Listing 'A' records failed after 2 record(s)" in dispatcher.reports[0]["domain_status"]
@@ -0,0 +1,136 @@
+# RequestScheduler: rate-limit pauses, retries with backoff and the per-zone circuit breaker.
+
+import time
+
+import pytest
+import requests
+
+OLD_IP = "192.0.2.1"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def make_scheduler(ddns, **settings):
+    values = {"rate_limit": 10 ** 6, "rate_period": 1, "max_retries": 3, "backoff_base": 0.01, "backoff_max": 0.05,
+              "breaker_threshold": 3, "breaker_cooldown": 0.2}
+    values.update(settings)
+    return ddns.RequestScheduler(**values)
+
+
+def scripted_send(*outcomes):
+    """send() for RequestScheduler.call(): returns (or raises) the outcomes in turn. .times holds when it was called."""
+    outcomes = list(outcomes)
+
+    def send():
+        send.times.append(time.monotonic())
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome) if isinstance(outcome, int) else outcome
+    send.times = []
+    return send
+
+
+def test_retry_after_pauses_every_caller(ddns):
+    scheduler = make_scheduler(ddns)
+    send = scripted_send(FakeResponse(429, {"Retry-After": "0.3"}), 200)
+
+    assert scheduler.call("zone-a", send).status_code == 200
+    assert send.times[1] - send.times[0] >= 0.3
+    # The pause is on the bucket, not the call: another zone's request waits for it too.
+    scheduler.paused_until = time.monotonic() + 0.2
+    other = scripted_send(200)
+    started = time.monotonic()
+    scheduler.call("zone-b", other)
+    assert other.times[0] - started >= 0.2
+    assert scheduler.zone_failures == {} # Rate limits never count towards the breaker
+
+
+def test_5xx_and_timeouts_are_retried_with_backoff(ddns, monkeypatch):
+    scheduler = make_scheduler(ddns)
+    delays = []
+    monkeypatch.setattr(scheduler, "backoff", lambda attempt: delays.append(attempt) or 0)
+    send = scripted_send(503, requests.exceptions.Timeout("slow"), requests.exceptions.ConnectionError("reset"), 200)
+
+    assert scheduler.call("zone-a", send).status_code == 200
+    assert delays == [0, 1, 2] # Exponential backoff by attempt number
+    assert scheduler.zone_failures == {}
+
+
+def test_backoff_is_exponential_with_full_jitter_and_capped(ddns):
+    scheduler = make_scheduler(ddns, backoff_base=1.0, backoff_max=5)
+    for attempt, ceiling in [(0, 1), (1, 2), (2, 4), (5, 5)]:
+        assert all(0 <= scheduler.backoff(attempt) <= ceiling for _ in range(50))
+
+
+def test_last_attempt_returns_the_error_or_raises(ddns):
+    scheduler = make_scheduler(ddns, max_retries=1, backoff_base=0)
+    assert scheduler.call("zone-a", scripted_send(500, 502)).status_code == 502
+    with pytest.raises(requests.exceptions.Timeout):
+        scheduler.call("zone-a", scripted_send(requests.exceptions.Timeout("1"), requests.exceptions.Timeout("2")))
+    assert scheduler.zone_failures == {"zone-a": 2}
+
+
+def test_breaker_opens_fails_fast_half_opens_and_closes(ddns):
+    scheduler = make_scheduler(ddns, max_retries=0)
+    for _ in range(3):
+        scheduler.call("zone-a", scripted_send(500))
+    assert "zone-a" in scheduler.zone_open_until
+
+    send = scripted_send(200)
+    with pytest.raises(ddns.CircuitOpenError):
+        scheduler.call("zone-a", send)
+    assert send.times == [] # Failed fast, nothing was sent
+    assert scheduler.call("zone-b", scripted_send(200)).status_code == 200 # Other zones are not affected
+
+    time.sleep(0.25) # Half-open: one failure is enough to open it again
+    scheduler.call("zone-a", scripted_send(500))
+    with pytest.raises(ddns.CircuitOpenError):
+        scheduler.call("zone-a", scripted_send(200))
+
+    time.sleep(0.25) # Half-open again: a success closes it
+    assert scheduler.call("zone-a", scripted_send(200)).status_code == 200
+    assert "zone-a" not in scheduler.zone_open_until
+    scheduler.call("zone-a", scripted_send(500)) # Closed: a single failure no longer opens it
+    assert scheduler.call("zone-a", scripted_send(200)).status_code == 200
+
+
+def test_client_retries_mock_5xx_and_429(ddns, mock_api):
+    client = ddns.accounts[0].client # API_MAX_RETRIES = 1 in the test config
+    mock_api.error_rate_5xx = 1.0
+    assert client.api_get("/zones/zone00000/dns_records").status_code == 503
+    assert mock_api.stats["injected_5xx"] == 2
+    assert client.scheduler.zone_failures == {"zone00000": 1}
+
+    mock_api.error_rate_5xx, mock_api.error_rate_429, mock_api.retry_after = 0.0, 1.0, 0.2
+    started = time.monotonic()
+    assert client.api_get("/zones/zone00000/dns_records").status_code == 429
+    assert mock_api.stats["injected_429"] == 2
+    assert time.monotonic() - started >= 0.2 # The retry waited out Retry-After
+
+    mock_api.error_rate_429 = 0.0
+    assert client.api_get("/zones/zone00000/dns_records").status_code == 200
+    assert client.scheduler.zone_failures == {} # A success resets the count
+
+
+@pytest.mark.parametrize("rate_limit", [2, 3, 25])
+def test_bucket_never_exceeds_the_rate_limit_in_one_period(ddns, rate_limit):
+    period = 0.5
+    scheduler = make_scheduler(ddns, rate_limit=rate_limit, rate_period=period)
+    started = time.monotonic()
+    sent = 0
+    while True:
+        scheduler.acquire()
+        if time.monotonic() - started >= period * 0.95: # Stay clear of the window's edge
+            break
+        sent += 1
+    assert rate_limit * 0.8 - 1 <= sent <= rate_limit
+
+
+def test_rate_limit_below_two_is_rejected(ddns):
+    with pytest.raises(ValueError):
+        make_scheduler(ddns, rate_limit=1)
@@ -0,0 +1,34 @@
+# Run timing (RunTrace): the summary line and the OTLP export, with the cap on stored spans.
+
+import json
+
+
+def test_spans_beyond_the_cap_are_counted_but_not_kept(ddns):
+    trace = ddns.RunTrace("run", max_spans=10)
+    with trace.span("zone", {"ddns.zone": "example0.test"}):
+        for n in range(100):
+            with trace.span("PUT /zones/:zone_id/dns_records/:record_id", {"ddns.record": f"host{n}"}):
+                pass
+    trace.finish()
+
+    assert len(trace.spans) == 10 # The root, the zone and the first 8 requests
+    assert trace.dropped_spans == 92
+    summary = trace.summary()
+    assert "zone " in summary and "(example0.test)" in summary
+    assert "PUT /zones/:zone_id/dns_records/:record_id x100 sum" in summary
+
+    exported = trace.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(exported) == 10
+    assert {"key": "ddns.dropped_spans", "value": {"intValue": "92"}} in exported[0]["attributes"]
+    json.dumps(exported) # Serializable as the export writes it
+
+
+def test_summary_skips_spans_still_running(ddns):
+    trace = ddns.RunTrace("run")
+    trace._new_span("ip_provider", trace.root["span_id"], {}, trace.KIND_INTERNAL) # Never ended, like an abandoned lookup
+    with trace.span("ip_lookup"):
+        pass
+    trace.finish()
+
+    assert "ip_provider" not in trace.summary()
+    assert "ip_lookup" in trace.summary()
@@ -0,0 +1,39 @@
+# The Apache/apt system checks are only started by runs that sync DNS records.
+
+import json
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+def count_system_check_starts(ddns, monkeypatch):
+    """Wrap start_system_checks(); returns the list its calls are recorded in."""
+    calls = []
+    start_system_checks = ddns.start_system_checks
+
+    def recording_start():
+        calls.append(True)
+        return start_system_checks()
+    monkeypatch.setattr(ddns, "start_system_checks", recording_start)
+    return calls
+
+
+def test_unchanged_ip_run_starts_no_system_checks(ddns, mock_api, monkeypatch, tmp_path):
+    (tmp_path / "ip.txt").write_text(json.dumps({"A": NEW_IP}))
+    calls = count_system_check_starts(ddns, monkeypatch)
+
+    ddns.main()
+
+    assert calls == []
+    assert mock_api.stats["requests"] == 0
+
+
+def test_changed_ip_run_starts_system_checks_once(ddns, mock_api, monkeypatch, tmp_path):
+    mock_api.add_zone("zone00000", "example0.test", 3, OLD_IP)
+    (tmp_path / "ip.txt").write_text(json.dumps({"A": OLD_IP}))
+    calls = count_system_check_starts(ddns, monkeypatch)
+
+    ddns.main()
+
+    assert calls == [True]
+    assert mock_api.count_content(NEW_IP) == 3
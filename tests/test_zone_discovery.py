@@ -0,0 +1,23 @@
+# Zone discovery: zones found by GET /zones are synced along with the configured ones.
+
+OLD_IP = "192.0.2.1"
+NEW_IP = "198.51.100.7"
+
+
+def test_discovered_zones_are_listed_once_on_a_first_run(ddns, mock_api, monkeypatch, tmp_path):
+    for n in range(1, 4):
+        mock_api.add_zone(f"zone0000{n}", f"example{n}.test", 2, OLD_IP)
+    account = ddns.accounts[0]
+    monkeypatch.setattr(account, "discover_zones", True)
+    monkeypatch.setattr(account, "zones", dict(account.zones))
+    monkeypatch.setattr(ddns, "zone_clients", dict(ddns.zone_clients)) # Rebuilt by apply_discovered_zones()
+    monkeypatch.setattr(ddns, "zone_index", None)
+    monkeypatch.setattr(ddns, "zone_discovery_future", None)
+    monkeypatch.setattr(ddns, "ZONE_DISCOVERY_CACHE_FILE", str(tmp_path / "zones.json"))
+
+    ddns.main() # ENABLE_STATE_CACHE is off, so there is no RecordIndex to carry convergence
+
+    # One /zones page, then each zone (the configured one and three discovered ones) listed exactly once.
+    assert mock_api.stats["requests_GET"] == 5
+    assert mock_api.count_content(NEW_IP) == 6
+    assert ddns.zone_index.pending(account.name) == set()